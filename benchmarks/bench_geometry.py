@@ -0,0 +1,87 @@
+"""
+Micro-benchmark: planning the 3 x 3 Street View capture grid for 100k candidate markets
+with the scalar math functions vs. the vectorized NumPy kernels in src/geometry.py.
+
+    python benchmarks/bench_geometry.py [--markets 100000]
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from geometry import plan_view_grid  # noqa: E402
+
+ANGLE_VARIATIONS = [-30, 0, 30]
+POSITION_OFFSETS = [-20, 0, 20]
+
+
+def scalar_heading(camera_lat, camera_lng, target_lat, target_lng):
+    lat1 = math.radians(camera_lat)
+    lng1 = math.radians(camera_lng)
+    lat2 = math.radians(target_lat)
+    lng2 = math.radians(target_lng)
+    y = math.sin(lng2 - lng1) * math.cos(lat2)
+    x = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(lng2 - lng1)
+    return (math.degrees(math.atan2(y, x)) + 360) % 360
+
+
+def scalar_offset(lat, lng, distance_meters, bearing_degrees):
+    R = 6378137
+    d = distance_meters / R
+    bearing_rad = math.radians(bearing_degrees)
+    lat_rad = math.radians(lat)
+    lng_rad = math.radians(lng)
+    lat_new_rad = math.asin(math.sin(lat_rad) * math.cos(d) + math.cos(lat_rad) * math.sin(d) * math.cos(bearing_rad))
+    lng_new_rad = lng_rad + math.atan2(
+        math.sin(bearing_rad) * math.sin(d) * math.cos(lat_rad),
+        math.cos(d) - math.sin(lat_rad) * math.sin(lat_new_rad)
+    )
+    return math.degrees(lat_new_rad), math.degrees(lng_new_rad)
+
+
+def scalar_plan(camera_lats, camera_lngs, target_lats, target_lngs):
+    headings = []
+    for camera_lat, camera_lng, target_lat, target_lng in zip(camera_lats, camera_lngs, target_lats, target_lngs):
+        base_heading = scalar_heading(camera_lat, camera_lng, target_lat, target_lng)
+        for offset in POSITION_OFFSETS:
+            position_lat, position_lng = scalar_offset(camera_lat, camera_lng, offset, (base_heading + 90) % 360)
+            position_heading = scalar_heading(position_lat, position_lng, target_lat, target_lng)
+            for angle_offset in ANGLE_VARIATIONS:
+                headings.append((position_heading + angle_offset) % 360)
+    return headings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--markets", type=int, default=100000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    target_lats = 41.0 + rng.normal(0, 0.05, args.markets)
+    target_lngs = 28.9 + rng.normal(0, 0.05, args.markets)
+    camera_lats = target_lats + rng.normal(0, 0.0001, args.markets)
+    camera_lngs = target_lngs + rng.normal(0, 0.0001, args.markets)
+
+    start = time.perf_counter()
+    scalar_headings = scalar_plan(camera_lats.tolist(), camera_lngs.tolist(), target_lats.tolist(), target_lngs.tolist())
+    scalar_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, _, headings = plan_view_grid(camera_lats, camera_lngs, target_lats, target_lngs, POSITION_OFFSETS, ANGLE_VARIATIONS)
+    vector_seconds = time.perf_counter() - start
+
+    max_error = float(np.max(np.abs(((headings.ravel() - np.array(scalar_headings)) + 180) % 360 - 180)))
+    print(f"Markets            : {args.markets}")
+    print(f"Scalar math loop   : {scalar_seconds * 1000:.1f} ms")
+    print(f"Vectorized NumPy   : {vector_seconds * 1000:.1f} ms")
+    print(f"Speed-up           : {scalar_seconds / vector_seconds:.1f}x")
+    print(f"Max heading error  : {max_error:.2e}°")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Throughput benchmark: images/sec of the batched inference engine in src/inference.py for
+several batch sizes, against the one-image-at-a-time loop with decoding in the main thread.
+
+    python benchmarks/bench_inference.py --model runs/yolov12_train/weights/best.pt [--images local_dataset/markets]
+    python benchmarks/bench_inference.py --decode_only --synthetic 256
+
+Without --images, --synthetic street-view sized JPEGs are generated in a temporary folder.
+--decode_only replaces the model with a no-op, which measures the decode / prefetch pipeline alone.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from inference import (  # noqa: E402
+    Detector, InferenceEngine, decode_image, list_images, load_detector, set_threads,
+)
+
+
+class NullDetector(Detector):
+    name = "decode-only"
+
+    def predict_batch(self, images):
+        return [[] for _ in images]
+
+
+def write_synthetic_images(folder, count, size=(640, 640)):
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        # Smooth gradients plus noise compress like real photos, unlike pure noise
+        base = np.linspace(0, 255, size[0], dtype=np.float32)[None, :, None]
+        pixels = np.clip(base + rng.normal(0, 20, (size[1], size[0], 3)), 0, 255).astype(np.uint8)
+        path = os.path.join(folder, f"image_{i:05d}.jpg")
+        Image.fromarray(pixels).save(path, quality=90)
+        paths.append(path)
+    return paths
+
+
+def sequential(detector, paths):
+    start = time.perf_counter()
+    for path in paths:
+        detector.predict_batch([decode_image(path)])
+    return len(paths) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", help="Image folder (default: synthetic images)")
+    parser.add_argument("--synthetic", type=int, default=64)
+    parser.add_argument("--model", help="YOLO / RT-DETR .pt weights or a DETR checkpoint directory")
+    parser.add_argument("--type", choices=["yolo", "rtdetr", "detr"], default=None)
+    parser.add_argument("--decode_only", action="store_true")
+    parser.add_argument("--batch_sizes", default="1,4,8,16")
+    parser.add_argument("--threads", type=int, default=os.cpu_count())
+    parser.add_argument("--decode_workers", type=int, default=2)
+    args = parser.parse_args()
+    if not args.decode_only and not args.model:
+        parser.error("--model is required unless --decode_only is given")
+
+    if args.decode_only:
+        detector = NullDetector()
+    else:
+        set_threads(args.threads)
+        detector = load_detector(args.model, args.type)
+
+    with tempfile.TemporaryDirectory() as folder:
+        paths = list_images(args.images) if args.images else write_synthetic_images(folder, args.synthetic)
+        # Warm-up, so lazy initialisation inside the model is not timed
+        detector.predict_batch([decode_image(paths[0])])
+
+        print(f"Model              : {detector.name}")
+        print(f"Images             : {len(paths)}")
+        print(f"Sequential         : {sequential(detector, paths):.1f} images/sec")
+        for batch_size in [int(size) for size in args.batch_sizes.split(",")]:
+            engine = InferenceEngine(detector, batch_size=batch_size, decode_workers=args.decode_workers)
+            stats = engine.run(paths)
+            print(f"Batch size {batch_size:<7} : {stats['images_per_sec']:.1f} images/sec")
+
+
+if __name__ == "__main__":
+    main()
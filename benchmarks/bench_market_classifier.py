@@ -0,0 +1,163 @@
+"""
+Equivalence check and throughput benchmark for src/market_classifier.py.
+
+The precompiled MarketClassifier must make exactly the same decisions as the original
+regex-per-pattern is_actual_market / large chain filter. This script replays a random corpus
+through both implementations, fails on any difference, and reports places/second for each.
+The golden cases are asserted in tests/test_market_classifier.py.
+
+    python benchmarks/bench_market_classifier.py [--places 200000]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from market_classifier import MarketClassifier  # noqa: E402
+
+LARGE_CHAINS = ["migros", "carrefour", "bim", "a101", "şok", "metro", "macrocenter", "kim", "sok", "file", "happy center"]
+
+
+def legacy_is_actual_market(place):
+    """The original implementation from src/data_collection.py, kept as the reference."""
+    name = place.get("name", "").lower()
+    types = [t.lower() for t in place.get("types", [])]
+    strong_market_types = ["grocery_or_supermarket", "supermarket"]
+    if any(t in strong_market_types for t in types):
+        if "pharmacy" in types or "eczane" in name:
+            return False
+        return True
+    market_patterns = [
+        r"\bmarket\b", r"\bbakkal\b", r"\bsüpermarket\b",
+        r"\bmanav\b", r"\bshop\b", r"\bgrocery\b",
+        r"\bminibakkal\b", r"\bbakkaliye\b", r"\bsupermarket\b"
+    ]
+    for pattern in market_patterns:
+        if re.search(pattern, name):
+            if not any(re.search(exclude, name) for exclude in
+                       [r"\bpharmacy\b", r"\beczane\b", r"\bkuyumcu\b"]):
+                return True
+    score = 0
+    type_scores = {"convenience_store": 3, "store": 1, "food": 1}
+    for t in types:
+        if t in type_scores:
+            score += type_scores[t]
+    name_scores = {"mini market": 3, "süper market": 3, "halk market": 3, "mahalle market": 3, "gıda": 2}
+    for term, points in name_scores.items():
+        if term in name:
+            score += points
+    negative_name_patterns = [
+        r"\brestaurant\b", r"\bcafe\b", r"\bkahvaltı\b", r"\bkulüp\b",
+        r"\bdernek\b", r"\bbar\b", r"\blounge\b", r"\bcoffee\b", r"\bkahve\b", r"(?i)\bsüt\b",
+        r"\bçay\b", r"\btea\b", r"\bfitness\b", r"\bspa\b", r"\bmerkez\b", r"(?i)\bçiftliği\b",
+        r"\bhotel\b", r"\botel\b", r"\bresort\b", r"(?i)\btekel\b", r"\bkasap\b", r"\bkuruyemiş\b", r"\bsalon\b"
+    ]
+    if any(re.search(pattern, name) for pattern in negative_name_patterns):
+        score -= 5
+    negative_types = [
+        "pharmacy", "gas_station", "car_repair", "car_dealer",
+        "clothing_store", "furniture_store", "home_goods_store",
+        "electronics_store", "jewelry_store", "restaurant", "cafe",
+        "breakfast_restaurant", "bar", "wedding_venue", "gym", "event_venue",
+        "athletic_field", "sports_activity_location", "health", "club"
+    ]
+    if any(t in negative_types for t in types):
+        score -= 5
+    if any(term in name for term in ["shell", "bp", "petrol", "opet", "aytemiz", "total", "lukoil"]):
+        score -= 4
+    if "servesBreakfast" in place or "servesBrunch" in place or "servesLunch" in place or "servesDinner" in place:
+        score -= 3
+    if "dineIn" in place and place["dineIn"] == True:
+        score -= 2
+    return score >= 2
+
+
+def legacy_is_large_chain(name):
+    return any(chain in name for chain in LARGE_CHAINS)
+
+
+NAME_WORDS = [
+    "Market", "MARKET", "market", "Bakkal", "BAKKALİYE", "Süpermarket", "Manav", "Shop", "Shopping",
+    "Grocery", "Mini Market", "Süper Market", "Halk Market", "Mahalle Market", "Gıda", "GIDA",
+    "Cafe", "Kafe", "Kahvaltı", "Kulüp", "Bar", "Barış", "Lounge", "Coffee", "Kahve", "SÜT", "Sütçü",
+    "Çay", "Tea", "Team", "Spa", "Merkez", "Çiftliği", "ÇİFTLİĞİ", "Hotel", "Otel", "Tekel", "TEKEL",
+    "Kasap", "Kuruyemiş", "Salon", "Eczane", "Pharmacy", "Kuyumcu", "Shell", "BP", "Petrol", "Opet",
+    "Total", "Migros", "Şok", "A101", "BİM", "Kimya", "Profile", "Metropol", "Happy Center",
+    "Ahmet", "Yıldız", "Deniz", "Büfe", "Şarküteri", "Ekspres", "&", "-", "1", "Ltd.", "Şti."
+]
+TYPES = [
+    "grocery_or_supermarket", "supermarket", "convenience_store", "store", "food", "point_of_interest",
+    "establishment", "pharmacy", "gas_station", "restaurant", "cafe", "bar", "clothing_store",
+    "home_goods_store", "health", "liquor_store", "bakery"
+]
+EXTRA_FIELDS = ["servesBreakfast", "servesBrunch", "servesLunch", "servesDinner"]
+
+
+def random_corpus(count, seed=0):
+    rng = random.Random(seed)
+    places = []
+    for _ in range(count):
+        place = {
+            "name": " ".join(rng.choice(NAME_WORDS) for _ in range(rng.randint(1, 4))),
+            "types": rng.sample(TYPES, rng.randint(0, 4)),
+        }
+        if rng.random() < 0.1:
+            place[rng.choice(EXTRA_FIELDS)] = True
+        if rng.random() < 0.1:
+            place["dineIn"] = rng.choice([True, False])
+        places.append(place)
+    return places
+
+
+def throughput(fn, places):
+    start = time.perf_counter()
+    fn(places)
+    return len(places) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--places", type=int, default=200000)
+    args = parser.parse_args()
+
+    classifier = MarketClassifier(LARGE_CHAINS)
+
+    failures = 0
+    corpus = random_corpus(args.places)
+    legacy_decisions = [legacy_is_actual_market(place) for place in corpus]
+    compiled_decisions = classifier.classify(corpus)
+    for place, legacy, compiled in zip(corpus, legacy_decisions, compiled_decisions):
+        if legacy != compiled:
+            failures += 1
+            if failures <= 20:
+                print(f"MISMATCH: {place} legacy={legacy} compiled={compiled}")
+        name = place["name"].lower()
+        if legacy_is_large_chain(name) != classifier.is_large_chain(name):
+            failures += 1
+            if failures <= 20:
+                print(f"CHAIN MISMATCH: {name}")
+
+    legacy_rate = throughput(lambda places: [legacy_is_actual_market(p) for p in places], corpus)
+    compiled_rate = throughput(classifier.classify, corpus)
+    names = [place["name"].lower() for place in corpus]
+    legacy_chain_rate = throughput(lambda items: [legacy_is_large_chain(n) for n in items], names)
+    compiled_chain_rate = throughput(lambda items: [classifier.is_large_chain(n) for n in items], names)
+
+    print(f"Random corpus      : {len(corpus)} places ({sum(compiled_decisions)} markets)")
+    print(f"is_actual_market   : legacy {legacy_rate:,.0f}/s, compiled {compiled_rate:,.0f}/s "
+          f"({compiled_rate / legacy_rate:.1f}x)")
+    print(f"large chain filter : legacy {legacy_chain_rate:,.0f}/s, compiled {compiled_chain_rate:,.0f}/s "
+          f"({compiled_chain_rate / legacy_chain_rate:.1f}x)")
+
+    if failures:
+        print(f"FAILED: {failures} decisions differ")
+        sys.exit(1)
+    print("OK: all decisions match")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+End-to-end benchmark of the collection pipeline against local stand-ins for the Places,
+Street View and Drive APIs (benchmarks/mock_google_apis.py), so it runs offline and for free.
+
+    python benchmarks/bench_pipeline.py [--density 40] [--radius_km 1] [--latency_ms 30] [--error_rate 0.01]
+    python benchmarks/bench_pipeline.py --json > baseline.json
+    python benchmarks/bench_pipeline.py --baseline baseline.json --tolerance 0.15
+
+Two phases are measured, each with its peak traced Python memory:
+  search   find_markets_in_radius (tiled Nearby Search with page tokens, no Place Details)
+  capture  preflight_markets + enrich_markets + capture_markets_concurrently on --capture_markets markets
+
+For each phase the report lists markets / minute, API calls per market by endpoint and the list-price
+cost per market. With --baseline the run fails (exit code 1) when the throughput of a phase drops
+more than --tolerance below the baseline run.
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import data_collection as dc  # noqa: E402
+import instrumentation  # noqa: E402
+from panorama_index import PanoramaIndex  # noqa: E402
+from storage import LocalStorageBackend  # noqa: E402
+from view_scoring import THUMBNAIL_SIZE  # noqa: E402
+from mock_google_apis import FakeDriveService, MockMapsServer, SyntheticCity  # noqa: E402
+
+
+def setup_pipeline(server, args, work_dir):
+    """Points the collector's module globals at the mock server and a fresh storage backend."""
+    dc.MAPS_API_BASE_URL = server.base_url
+    dc.initialize_request_scheduler(state_path=None)
+    dc.response_cache = None
+    dc.market_manifest = None
+    dc.job_journal = None
+    dc.image_cache = None
+    dc.image_hash_index = None
+    dc.panorama_index = PanoramaIndex()
+    dc.progressive_top_k = args.progressive_top_k
+    drive = None
+    if args.storage == "drive":
+        drive = FakeDriveService(latency_ms=args.drive_latency_ms)
+        dc.storage_backend = dc.GoogleDriveManager(service=drive)
+        dc.storage_backend.find_or_create_dataset_folder()
+    else:
+        dc.storage_backend = LocalStorageBackend(os.path.join(work_dir, "markets"))
+    return drive
+
+
+def run_phase(server, function):
+    """Runs function() under tracemalloc; returns its result, seconds, peak MB, API calls and USD spent."""
+    server.reset_stats()
+    spent_before = dc.request_scheduler.budget.spent_usd
+    tracemalloc.start()
+    started_at = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - started_at
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, {
+        "seconds": round(seconds, 2),
+        "peak_mb": round(peak / 1024 / 1024, 1),
+        "api_calls": dict(server.requests),
+        "api_errors": server.errors,
+        "spent_usd": dc.request_scheduler.budget.spent_usd - spent_before,
+    }
+
+
+def summarize(phase, markets):
+    markets = max(markets, 1)
+    phase["markets"] = markets
+    phase["markets_per_min"] = round(markets / max(phase["seconds"], 1e-9) * 60, 1)
+    phase["calls_per_market"] = {endpoint: round(calls / markets, 2) for endpoint, calls in sorted(phase["api_calls"].items())}
+    phase["usd_per_market"] = round(phase.pop("spent_usd") / markets, 4)
+    return phase
+
+
+def print_phase(name, phase):
+    print(f"\n{name}")
+    print(f"  Markets            : {phase['markets']}")
+    print(f"  Time               : {phase['seconds']:.2f} s ({phase['markets_per_min']:.1f} markets/min)")
+    print(f"  Peak traced memory : {phase['peak_mb']:.1f} MB")
+    print(f"  Cost per market    : ${phase['usd_per_market']:.4f}")
+    print(f"  Injected errors    : {phase['api_errors']}")
+    for endpoint, calls in phase["calls_per_market"].items():
+        print(f"  {endpoint:<19}: {calls:.2f} calls / market")
+
+
+def check_baseline(report, baseline_path, tolerance):
+    """Names of the phases whose markets / minute fell more than tolerance below the baseline."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = []
+    for name, phase in report["phases"].items():
+        reference = baseline.get("phases", {}).get(name)
+        if reference and phase["markets_per_min"] < reference["markets_per_min"] * (1 - tolerance):
+            regressions.append(f"{name}: {phase['markets_per_min']:.1f} markets/min "
+                               f"(baseline {reference['markets_per_min']:.1f})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lat", type=float, default=41.0)
+    parser.add_argument("--lng", type=float, default=28.9)
+    parser.add_argument("--radius_km", type=float, default=1.0)
+    parser.add_argument("--density", type=float, default=40.0, help="Synthetic places per km2")
+    parser.add_argument("--latency_ms", type=float, default=20.0, help="Mean Maps API latency")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Share of Maps API calls answered with HTTP 503")
+    parser.add_argument("--page_token_delay", type=float, default=0.5, help="Seconds until a next_page_token works")
+    parser.add_argument("--coverage", type=float, default=0.9, help="Share of locations with a panorama")
+    parser.add_argument("--capture_markets", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=dc.MAX_CAPTURE_WORKERS)
+    parser.add_argument("--progressive_top_k", type=int, default=None)
+    parser.add_argument("--storage", choices=["drive", "local"], default="drive")
+    parser.add_argument("--drive_latency_ms", type=float, default=20.0, help="Latency of every fake Drive call")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON (e.g. to save a baseline)")
+    parser.add_argument("--baseline", help="JSON report of an earlier run to compare markets / minute against")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args()
+
+    instrumentation.set_verbosity("summary")
+    city = SyntheticCity(args.lat, args.lng, extent_km=args.radius_km * 1.5, density_per_km2=args.density)
+    report = {"config": vars(args).copy(), "phases": {}}
+
+    # The collector's own progress output goes to stderr, so --json prints a clean report
+    progress_output = sys.stderr if args.json else sys.stdout
+    with MockMapsServer(city, args.latency_ms, args.error_rate, args.page_token_delay, args.coverage) as server, \
+            tempfile.TemporaryDirectory() as work_dir, contextlib.redirect_stdout(progress_output):
+        server.warm_up(["1280x1024", THUMBNAIL_SIZE])
+        drive = setup_pipeline(server, args, work_dir)
+
+        markets, search = run_phase(server, lambda: dc.find_markets_in_radius(
+            args.lat, args.lng, radius_km=args.radius_km, fetch_details=False))
+        report["phases"]["search"] = summarize(search, len(markets))
+
+        def capture():
+            selected = dc.preflight_markets(markets[:args.capture_markets])
+            dc.enrich_markets(selected)
+            counts = dc.capture_markets_concurrently(selected, max_workers=args.workers)
+            return selected, sum(count or 0 for count in counts)
+
+        (captured, images), capture_phase = run_phase(server, capture)
+        capture_phase["images"] = images
+        if drive is not None:
+            capture_phase["drive_calls"] = drive.calls
+            capture_phase["drive_mb_uploaded"] = round(drive.bytes_uploaded / 1024 / 1024, 1)
+        report["phases"]["capture"] = summarize(capture_phase, len(captured))
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"\nSynthetic places   : {len(city)} ({args.density:g} / km2), latency {args.latency_ms:g} ms, "
+              f"error rate {args.error_rate:g}, storage {args.storage}")
+        print_phase("Search (find_markets_in_radius)", report["phases"]["search"])
+        print_phase("Capture (preflight + details + images)", report["phases"]["capture"])
+        print(f"  Images uploaded    : {report['phases']['capture']['images']}")
+
+    if args.baseline:
+        regressions = check_baseline(report, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"Throughput regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
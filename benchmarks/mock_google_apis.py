@@ -0,0 +1,409 @@
+"""
+Local stand-ins for the Google APIs used by the collector, for offline benchmarks.
+
+    python benchmarks/mock_google_apis.py --port 8765 --density 40 --latency_ms 50 --error_rate 0.02
+    GOOGLE_MAPS_API_BASE_URL=http://127.0.0.1:8765 STORAGE_BACKEND=local python src/data_collection.py ...
+
+MockMapsServer answers nearbysearch (20 results per page, at most 60, with next_page_tokens
+that only become valid after --page_token_delay seconds), place/details, streetview/metadata
+and streetview image requests over a synthetic city of --density places per km2. Every
+response waits --latency_ms (+-50%) and fails with HTTP 503 with probability --error_rate.
+
+FakeDriveService implements the parts of the googleapiclient Drive v3 service the collector
+uses (files().list / create / generateIds, batch requests, changes()) in memory and can be
+passed to GoogleDriveManager(service=...).
+"""
+import io
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import itertools
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+from PIL import Image
+
+PAGE_SIZE = 20
+MAX_RESULTS = 60
+# Panoramas are taken every ~10 m along the street; nearby requests resolve to the same one
+PANO_GRID_DEGREES = 0.0001
+IMAGE_VARIANTS = 16
+GENERIC_KEYWORDS = ("market", "grocer")
+
+PLACE_KINDS = [
+    # (name prefix, types, share of places)
+    ("Bakkal", ["grocery_or_supermarket", "store", "food", "point_of_interest", "establishment"], 0.35),
+    ("Mini Market", ["convenience_store", "store", "food", "point_of_interest", "establishment"], 0.25),
+    ("Manav", ["store", "food", "point_of_interest", "establishment"], 0.1),
+    ("Süpermarket", ["supermarket", "grocery_or_supermarket", "store", "point_of_interest", "establishment"], 0.1),
+    ("Eczane", ["pharmacy", "health", "store", "point_of_interest", "establishment"], 0.1),
+    ("Kafe", ["cafe", "food", "point_of_interest", "establishment"], 0.1),
+]
+
+
+class SyntheticCity:
+    """Places scattered uniformly over a square of side 2 * extent_km around a center."""
+
+    def __init__(self, lat=41.0, lng=28.9, extent_km=5.0, density_per_km2=40.0, seed=0):
+        rng = np.random.default_rng(seed)
+        count = int(density_per_km2 * (2 * extent_km) ** 2)
+        dlat = extent_km / 111.32
+        dlng = extent_km / (111.32 * math.cos(math.radians(lat)))
+        self.lats = lat + rng.uniform(-dlat, dlat, count)
+        self.lngs = lng + rng.uniform(-dlng, dlng, count)
+        # Nearby Search orders by prominence, not distance
+        self.prominence = rng.random(count)
+        shares = np.array([share for _, _, share in PLACE_KINDS])
+        self.kinds = rng.choice(len(PLACE_KINDS), size=count, p=shares / shares.sum())
+        self.ratings = np.round(rng.uniform(3.0, 5.0, count), 1)
+        self.rating_counts = rng.integers(0, 500, count)
+
+    def __len__(self):
+        return len(self.lats)
+
+    def place(self, i):
+        prefix, types, _ = PLACE_KINDS[self.kinds[i]]
+        return {
+            "place_id": f"MOCK{i:07d}",
+            "name": f"{prefix} {i}",
+            "types": types,
+            "geometry": {"location": {"lat": float(self.lats[i]), "lng": float(self.lngs[i])}},
+            "vicinity": f"Mock Sk. No:{i % 200 + 1}",
+            "rating": float(self.ratings[i]),
+            "user_ratings_total": int(self.rating_counts[i]),
+            "business_status": "OPERATIONAL",
+        }
+
+    def search(self, lat, lng, radius_m, query_field, query_value):
+        """Indices of matching places within radius_m, most prominent first."""
+        dy = (self.lats - lat) * 111320
+        dx = (self.lngs - lng) * 111320 * math.cos(math.radians(lat))
+        inside = np.nonzero(dx * dx + dy * dy <= radius_m * radius_m)[0]
+        if query_field == "type":
+            kinds = [k for k, (_, types, _) in enumerate(PLACE_KINDS) if query_value in types]
+        else:
+            # Generic grocery keywords match every grocery kind, other keywords match by name
+            value = query_value.lower()
+            generic = any(word in value for word in GENERIC_KEYWORDS)
+            kinds = [k for k, (prefix, types, _) in enumerate(PLACE_KINDS)
+                     if value in prefix.lower() or (generic and "store" in types and "pharmacy" not in types)]
+        inside = inside[np.isin(self.kinds[inside], kinds)]
+        return inside[np.argsort(-self.prominence[inside])]
+
+
+class MockMapsServer:
+    """Threaded HTTP server for the Maps endpoints. Use as a context manager or start() / stop()."""
+
+    def __init__(self, city=None, latency_ms=0.0, error_rate=0.0, page_token_delay=0.0,
+                 coverage=0.9, host="127.0.0.1", port=0, seed=0):
+        self.city = city or SyntheticCity()
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.page_token_delay = page_token_delay
+        self.coverage = coverage
+        self.requests = {}
+        self.errors = 0
+        self.bytes_sent = 0
+        self._random = random.Random(seed)
+        self._tokens = {}
+        self._token_ids = itertools.count()
+        self._images = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests = {}
+            self.errors = 0
+            self.bytes_sent = 0
+
+    # --- endpoint implementations: return (status, content_type, body bytes)
+
+    def nearbysearch(self, params):
+        if "pagetoken" in params:
+            with self._lock:
+                entry = self._tokens.get(params["pagetoken"])
+            if entry is None:
+                return self._json({"status": "INVALID_REQUEST", "results": []})
+            indices, offset, valid_from = entry
+            if time.monotonic() < valid_from:
+                return self._json({"status": "INVALID_REQUEST", "results": []})
+        else:
+            lat, lng = (float(value) for value in params["location"].split(","))
+            query_field = "type" if "type" in params else "keyword"
+            indices = self.city.search(lat, lng, float(params.get("radius", 1000)), query_field,
+                                       params.get(query_field, ""))[:MAX_RESULTS]
+            offset = 0
+        page = indices[offset:offset + PAGE_SIZE]
+        body = {"status": "OK" if len(page) else "ZERO_RESULTS", "results": [self.city.place(i) for i in page]}
+        if offset + PAGE_SIZE < len(indices):
+            token = f"token{next(self._token_ids)}"
+            with self._lock:
+                self._tokens[token] = (indices, offset + PAGE_SIZE, time.monotonic() + self.page_token_delay)
+            body["next_page_token"] = token
+        return self._json(body)
+
+    def place_details(self, params):
+        i = int(params["place_id"][4:])
+        return self._json({"status": "OK", "result": {
+            "formatted_address": f"Mock Sk. No:{i % 200 + 1}, 34{i % 1000:03d} Mock/İstanbul, Türkiye",
+            "formatted_phone_number": f"0212 {i % 1000:03d} {i % 100:02d} {i % 97:02d}",
+            "opening_hours": {"open_now": True, "weekday_text": []},
+        }})
+
+    def _covered(self, lat, lng):
+        digest = hashlib.md5(f"{lat:.4f},{lng:.4f}".encode()).digest()
+        return digest[0] / 255 < self.coverage
+
+    def streetview_metadata(self, params):
+        if "pano" in params:
+            return self._json({"status": "OK", "pano_id": params["pano"]})
+        lat, lng = (float(value) for value in params["location"].split(","))
+        if not self._covered(lat, lng):
+            return self._json({"status": "ZERO_RESULTS"})
+        pano_lat = round(lat / PANO_GRID_DEGREES) * PANO_GRID_DEGREES
+        pano_lng = round(lng / PANO_GRID_DEGREES) * PANO_GRID_DEGREES
+        return self._json({
+            "status": "OK",
+            "pano_id": f"PANO_{pano_lat:.4f}_{pano_lng:.4f}",
+            "location": {"lat": pano_lat, "lng": pano_lng},
+            "date": "2023-06",
+        })
+
+    def warm_up(self, sizes):
+        """Renders the image pool of every "WxH" size up front, so rendering is not part of a measurement."""
+        for size in sizes:
+            for variant in range(IMAGE_VARIANTS):
+                self._image(size, variant)
+
+    def _image(self, size, variant):
+        key = (size, variant)
+        with self._lock:
+            image = self._images.get(key)
+        if image is None:
+            width, height = (int(value) for value in size.split("x"))
+            image = synthetic_jpeg(width, height, seed=variant)
+            with self._lock:
+                self._images[key] = image
+        return image
+
+    def streetview(self, params):
+        variant = int(hashlib.md5(json.dumps(params, sort_keys=True).encode()).hexdigest(), 16) % IMAGE_VARIANTS
+        return 200, "image/jpeg", self._image(params.get("size", "640x640"), variant)
+
+    @staticmethod
+    def _json(body):
+        return 200, "application/json; charset=UTF-8", json.dumps(body).encode("utf-8")
+
+    def _handler_class(self):
+        server = self
+        routes = {
+            "/maps/api/place/nearbysearch/json": ("nearbysearch", server.nearbysearch),
+            "/maps/api/place/details/json": ("place_details", server.place_details),
+            "/maps/api/streetview/metadata": ("streetview_metadata", server.streetview_metadata),
+            "/maps/api/streetview": ("streetview", server.streetview),
+        }
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                route = routes.get(url.path)
+                if route is None:
+                    self.send_error(404)
+                    return
+                endpoint, handle = route
+                params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                with server._lock:
+                    server.requests[endpoint] = server.requests.get(endpoint, 0) + 1
+                    failed = server._random.random() < server.error_rate
+                    delay = server.latency_ms / 1000 * server._random.uniform(0.5, 1.5)
+                if delay:
+                    time.sleep(delay)
+                if failed:
+                    with server._lock:
+                        server.errors += 1
+                    status, content_type, body = 503, "text/plain", b"Service Unavailable"
+                else:
+                    status, content_type, body = handle(params)
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with server._lock:
+                    server.bytes_sent += len(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def synthetic_jpeg(width, height, seed=0, quality=85):
+    """A photo-like JPEG (smooth gradient plus noise) so sizes resemble real Street View frames."""
+    rng = np.random.default_rng(seed)
+    colors = rng.integers(0, 256, (2, 2, 3), dtype=np.uint8)
+    base = Image.fromarray(colors).resize((width, height), Image.BILINEAR)
+    noise = Image.effect_noise((width, height), 64).convert("RGB")
+    buffer = io.BytesIO()
+    Image.blend(base, noise, 0.2).save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+class _FakeRequest:
+    def __init__(self, drive, action):
+        self.drive = drive
+        self.action = action
+
+    def execute(self):
+        self.drive._call()
+        return self.action()
+
+    def next_chunk(self):
+        # The whole resumable upload in one step; the media is still read chunk by chunk
+        return None, self.execute()
+
+
+class _FakeBatch:
+    def __init__(self, drive, callback):
+        self.drive = drive
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id=None):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        self.drive._call()
+        for request_id, request in self.requests:
+            self.callback(request_id, request.action(), None)
+
+
+class FakeDriveService:
+    """
+    In-memory Drive v3 service: folders and files are kept as metadata only, uploaded media
+    is read and counted. Each execute() waits latency_ms, like one HTTP round-trip.
+    """
+
+    def __init__(self, latency_ms=0.0):
+        self.latency_ms = latency_ms
+        self.calls = 0
+        self.files_created = 0
+        self.bytes_uploaded = 0
+        self._files = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def _call(self):
+        with self._lock:
+            self.calls += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+    def _new_id(self):
+        return f"drive{next(self._ids)}"
+
+    def files(self):
+        return self
+
+    def changes(self):
+        return _FakeChanges(self)
+
+    def new_batch_http_request(self, callback=None):
+        return _FakeBatch(self, callback)
+
+    def list(self, q="", pageToken=None, **kwargs):
+        def action():
+            with self._lock:
+                files = list(self._files.values())
+            if "in parents" in q:
+                parent = q.split("'")[1]
+                files = [f for f in files if parent in f.get("parents", [])]
+            elif "name='" in q:
+                name = q.split("name='")[1].split("'")[0]
+                files = [f for f in files if f["name"] == name]
+            if "mimeType='application/vnd.google-apps.folder'" in q:
+                files = [f for f in files if f.get("mimeType") == "application/vnd.google-apps.folder"]
+            return {"files": [{"id": f["id"], "name": f["name"], "parents": f.get("parents", [])} for f in files]}
+        return _FakeRequest(self, action)
+
+    def generateIds(self, count=10, space="drive"):
+        return _FakeRequest(self, lambda: {"ids": [self._new_id() for _ in range(count)]})
+
+    def create(self, body=None, media_body=None, fields=None):
+        def action():
+            size = 0
+            if media_body is not None:
+                total = media_body.size()
+                while size < total:
+                    size += len(media_body.getbytes(size, min(256 * 1024, total - size)))
+            file_id = body.get("id") or self._new_id()
+            with self._lock:
+                self._files[file_id] = dict(body, id=file_id)
+                self.files_created += 1
+                self.bytes_uploaded += size
+            return {"id": file_id}
+        return _FakeRequest(self, action)
+
+
+class _FakeChanges:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def getStartPageToken(self):
+        return _FakeRequest(self.drive, lambda: {"startPageToken": "1"})
+
+    def list(self, **kwargs):
+        return _FakeRequest(self.drive, lambda: {"changes": [], "newStartPageToken": "1"})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--lat", type=float, default=41.0)
+    parser.add_argument("--lng", type=float, default=28.9)
+    parser.add_argument("--extent_km", type=float, default=5.0)
+    parser.add_argument("--density", type=float, default=40.0, help="Places per km2")
+    parser.add_argument("--latency_ms", type=float, default=0.0)
+    parser.add_argument("--error_rate", type=float, default=0.0)
+    parser.add_argument("--page_token_delay", type=float, default=0.0)
+    parser.add_argument("--coverage", type=float, default=0.9, help="Share of locations with a panorama")
+    args = parser.parse_args()
+
+    city = SyntheticCity(args.lat, args.lng, args.extent_km, args.density)
+    server = MockMapsServer(city, args.latency_ms, args.error_rate, args.page_token_delay, args.coverage,
+                            port=args.port)
+    print(f"{len(city)} synthetic places, serving on {server.base_url} (Ctrl+C to stop)")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
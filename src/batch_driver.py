@@ -0,0 +1,460 @@
+"""
+Non-interactive batch collection over many survey regions.
+
+    python src/batch_driver.py regions.json --processes 4
+    python src/batch_driver.py istanbul.geojson --shard_radius_km 3 --summary run_summary.json
+
+Regions come from a JSON list or a CSV file with lat, lng, radius_km (and an optional name)
+columns, or from a GeoJSON polygon that is covered with search circles. Every region is split
+into shards of at most --shard_radius_km, and the shards are processed by a pool of worker
+processes. Overlapping shards find the same markets, so each place_id is claimed in a shared
+SQLite table before it is captured: only the first shard that claims it collects it. Markets
+an interrupted earlier run left unfinished (see the job journal) are resumed first.
+"""
+import os
+import csv
+import json
+import math
+import time
+import sqlite3
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+METERS_PER_DEGREE_LAT = 111320.0
+DEFAULT_SHARD_RADIUS_KM = 3.0
+RESUME_MARKETS_PER_SHARD = 20
+
+
+class ClaimStore:
+    """
+    Place_id claims shared by all worker processes through one SQLite file. INSERT OR IGNORE
+    makes a claim atomic, so two processes can never both win the same market.
+    """
+
+    def __init__(self, db_path="batch_claims.sqlite"):
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path, timeout=60)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS claims (
+                   place_id TEXT PRIMARY KEY,
+                   shard_id TEXT NOT NULL,
+                   claimed_at REAL
+               )"""
+        )
+        self._conn.commit()
+
+    def claim(self, place_id, shard_id):
+        """True when the market belongs to this shard (newly claimed now or by an earlier run of it)."""
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO claims (place_id, shard_id, claimed_at) VALUES (?, ?, ?)",
+                (place_id, shard_id, time.time())
+            )
+            row = self._conn.execute("SELECT shard_id FROM claims WHERE place_id = ?", (place_id,)).fetchone()
+        return row is not None and row[0] == shard_id
+
+    def owner(self, place_id):
+        """shard_id that claimed the market, or None."""
+        row = self._conn.execute("SELECT shard_id FROM claims WHERE place_id = ?", (place_id,)).fetchone()
+        return row[0] if row else None
+
+    def close(self):
+        self._conn.close()
+
+
+def _to_local(lat, lng, origin_lat, origin_lng):
+    """Equirectangular projection around the origin, in meters (x east, y north)."""
+    x = (lng - origin_lng) * METERS_PER_DEGREE_LAT * math.cos(math.radians(origin_lat))
+    y = (lat - origin_lat) * METERS_PER_DEGREE_LAT
+    return x, y
+
+
+def _from_local(x, y, origin_lat, origin_lng):
+    lat = origin_lat + y / METERS_PER_DEGREE_LAT
+    lng = origin_lng + x / (METERS_PER_DEGREE_LAT * math.cos(math.radians(origin_lat)))
+    return lat, lng
+
+
+def _point_in_ring(x, y, ring):
+    inside = False
+    for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+        if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+            inside = not inside
+    return inside
+
+
+def _distance_to_ring(x, y, ring):
+    best = float("inf")
+    for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+        dx, dy = x2 - x1, y2 - y1
+        length_sq = dx * dx + dy * dy
+        t = 0.0 if length_sq == 0 else max(0.0, min(1.0, ((x - x1) * dx + (y - y1) * dy) / length_sq))
+        best = min(best, math.hypot(x - (x1 + t * dx), y - (y1 + t * dy)))
+    return best
+
+
+def _grid_centers(min_x, min_y, max_x, max_y, spacing):
+    """Centers of a square grid of `spacing` cells covering the bounding box."""
+    cols = max(1, math.ceil((max_x - min_x) / spacing))
+    rows = max(1, math.ceil((max_y - min_y) / spacing))
+    start_x = (min_x + max_x) / 2 - (cols - 1) * spacing / 2
+    start_y = (min_y + max_y) / 2 - (rows - 1) * spacing / 2
+    for row in range(rows):
+        for col in range(cols):
+            yield start_x + col * spacing, start_y + row * spacing
+
+
+def split_circle(lat, lng, radius_km, shard_radius_km):
+    """
+    Covers a search circle with circles of at most shard_radius_km. Each shard circle is the
+    circumcircle of a grid cell, so together they leave no gaps.
+    """
+    if radius_km <= shard_radius_km:
+        return [(lat, lng, radius_km)]
+    shard_radius_m = shard_radius_km * 1000
+    radius_m = radius_km * 1000
+    spacing = shard_radius_m * math.sqrt(2)
+    shards = []
+    for x, y in _grid_centers(-radius_m, -radius_m, radius_m, radius_m, spacing):
+        if math.hypot(x, y) <= radius_m + shard_radius_m:
+            shard_lat, shard_lng = _from_local(x, y, lat, lng)
+            shards.append((shard_lat, shard_lng, shard_radius_km))
+    return shards
+
+
+def split_polygon(polygon, shard_radius_km):
+    """
+    Covers a polygon ([outer ring, holes...] of (lng, lat) points, GeoJSON order) with search
+    circles. A grid cell is kept when its center is inside the polygon or the boundary passes
+    within the cell's circumcircle.
+    """
+    outer = polygon[0]
+    origin_lat = sum(point[1] for point in outer) / len(outer)
+    origin_lng = sum(point[0] for point in outer) / len(outer)
+    rings = [[_to_local(point[1], point[0], origin_lat, origin_lng) for point in ring] for ring in polygon]
+    xs = [x for x, _ in rings[0]]
+    ys = [y for _, y in rings[0]]
+
+    shard_radius_m = shard_radius_km * 1000
+    spacing = shard_radius_m * math.sqrt(2)
+    shards = []
+    for x, y in _grid_centers(min(xs), min(ys), max(xs), max(ys), spacing):
+        inside = _point_in_ring(x, y, rings[0]) and not any(_point_in_ring(x, y, hole) for hole in rings[1:])
+        if inside or min(_distance_to_ring(x, y, ring) for ring in rings) <= shard_radius_m:
+            shard_lat, shard_lng = _from_local(x, y, origin_lat, origin_lng)
+            shards.append((shard_lat, shard_lng, shard_radius_km))
+    return shards
+
+
+def _geojson_polygons(data):
+    """Yields (name, polygon) for every Polygon / MultiPolygon in a GeoJSON document."""
+    if data.get("type") == "FeatureCollection":
+        for index, feature in enumerate(data.get("features", [])):
+            for name, polygon in _geojson_polygons(feature):
+                yield name or f"feature{index}", polygon
+    elif data.get("type") == "Feature":
+        name = (data.get("properties") or {}).get("name")
+        for _, polygon in _geojson_polygons(data.get("geometry") or {}):
+            yield name, polygon
+    elif data.get("type") == "Polygon":
+        yield None, data["coordinates"]
+    elif data.get("type") == "MultiPolygon":
+        for polygon in data["coordinates"]:
+            yield None, polygon
+
+
+def load_regions(path):
+    """
+    Reads survey regions. Returns a list of {"name", "lat", "lng", "radius_km"} circles or
+    {"name", "polygon"} polygons.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    base_name = os.path.splitext(os.path.basename(path))[0]
+    if extension == ".csv":
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict) and "type" in data:
+            return [
+                {"name": name or f"{base_name}{index}", "polygon": polygon}
+                for index, (name, polygon) in enumerate(_geojson_polygons(data))
+            ]
+        rows = data
+
+    regions = []
+    for index, row in enumerate(rows):
+        regions.append({
+            "name": row.get("name") or f"{base_name}{index}",
+            "lat": float(row["lat"]),
+            "lng": float(row["lng"]),
+            "radius_km": float(row.get("radius_km") or 10),
+        })
+    return regions
+
+
+def make_shards(regions, shard_radius_km=DEFAULT_SHARD_RADIUS_KM):
+    """Splits every region into shard circles with stable ids (so a rerun resumes the same shards)."""
+    shards = []
+    for region in regions:
+        if "polygon" in region:
+            circles = split_polygon(region["polygon"], shard_radius_km)
+        else:
+            circles = split_circle(region["lat"], region["lng"], region["radius_km"], shard_radius_km)
+        for index, (lat, lng, radius_km) in enumerate(circles):
+            shards.append({
+                "shard_id": f"{region['name']}-{index:04d}",
+                "region": region["name"],
+                "lat": round(lat, 6),
+                "lng": round(lng, 6),
+                "radius_km": round(radius_km, 3),
+            })
+    return shards
+
+
+# State of a worker process, set up once by init_worker
+_worker = {}
+
+
+def init_worker(options):
+    """Opens storage, caches, journal and a share of the rate limits / budget in a worker process."""
+    import data_collection as dc
+    import instrumentation
+    from request_scheduler import DEFAULT_RATE_LIMITS
+
+    processes = options["processes"]
+    instrumentation.set_verbosity(options.get("verbosity", "progress"))
+    if options.get("metrics_dir"):
+        instrumentation.enable()
+    dc.initialize_storage(options.get("storage_backend"))
+    if not dc.storage_backend:
+        raise RuntimeError("Storage connection failed in a batch worker.")
+    dc.initialize_manifest()
+    dc.initialize_journal(options["journal_path"])
+    dc.initialize_request_scheduler(
+        daily_budget_usd=options.get("budget_share_usd"),
+        state_path=None,
+        rate_limits={
+            endpoint: (rate / processes, max(1, burst // processes))
+            for endpoint, (rate, burst) in DEFAULT_RATE_LIMITS.items()
+        }
+    )
+    dc.initialize_response_cache()
+    dc.initialize_image_cache()
+    if options.get("progressive_top_k"):
+        dc.initialize_progressive_capture(options["progressive_top_k"])
+    if options.get("dedup", True):
+        dc.initialize_dedup_index()
+    _worker["dc"] = dc
+    _worker["claims"] = ClaimStore(options["claims_path"])
+    _worker["options"] = options
+
+
+def run_shard(shard):
+    """Searches and captures one shard. Returns its summary dict."""
+    dc = _worker["dc"]
+    claims = _worker["claims"]
+    options = _worker["options"]
+    budget = dc.request_scheduler.budget
+    calls_before = dict(budget.calls)
+    spent_before = budget.spent_usd
+    started_at = time.time()
+
+    summary = dict(shard, markets_found=0, markets_with_street_view=0, markets_captured=0, images=0, error=None)
+    try:
+        if "markets" in shard:
+            # Unfinished markets of an earlier run, already claimed and checked for coverage
+            markets = shard["markets"]
+            summary["markets_found"] = summary["markets_with_street_view"] = len(markets)
+        else:
+            markets = dc.find_markets_in_radius(
+                shard["lat"], shard["lng"], radius_km=shard["radius_km"],
+                claim=lambda place_id: claims.owner(place_id) in (None, shard["shard_id"]),
+                fetch_details=False
+            )
+            summary["markets_found"] = len(markets)
+            markets = dc.preflight_markets(
+                markets, max_distance_m=options["max_pano_distance_m"], min_date=options.get("min_pano_date")
+            )
+            summary["markets_with_street_view"] = len(markets)
+            # Only the markets this shard captures are claimed; the rest stay free for other shards
+            limit = options.get("max_markets_per_shard")
+            claimed = []
+            for market in markets:
+                if limit and len(claimed) == limit:
+                    break
+                if claims.claim(market.get("place_id"), shard["shard_id"]):
+                    claimed.append(market)
+            markets = claimed
+        if markets:
+            dc.enrich_markets(markets, max_workers=options["threads"])
+            counts = dc.capture_markets_concurrently(markets, max_workers=options["threads"])
+            summary["markets_captured"] = sum(1 for count in counts if count)
+            summary["images"] = sum(count or 0 for count in counts)
+    except dc.QuotaExceeded as e:
+        summary["error"] = f"quota: {e}"
+    except Exception as e:
+        summary["error"] = f"{type(e).__name__}: {e}"
+
+    summary.pop("markets", None)
+    summary["elapsed_s"] = round(time.time() - started_at, 1)
+    summary["api_calls"] = {
+        endpoint: count - calls_before.get(endpoint, 0)
+        for endpoint, count in budget.calls.items() if count - calls_before.get(endpoint, 0)
+    }
+    summary["spent_usd"] = round(budget.spent_usd - spent_before, 4)
+    if options.get("metrics_dir"):
+        # One file per worker; the Prometheus textfile collector reads them all
+        dc.instrumentation.write_prometheus(os.path.join(options["metrics_dir"], f"worker-{os.getpid()}.prom"))
+    return summary
+
+
+def make_resume_shards(journal_path, markets_per_shard=RESUME_MARKETS_PER_SHARD):
+    """Groups the markets the journal lists as unfinished into shards that only capture them."""
+    from job_journal import JobJournal
+
+    journal = JobJournal(journal_path)
+    pending = journal.pending_markets()
+    journal.close()
+    return [
+        {"shard_id": f"resume-{index:04d}", "region": "resume", "markets": pending[start:start + markets_per_shard]}
+        for index, start in enumerate(range(0, len(pending), markets_per_shard))
+    ]
+
+
+def run_batch(regions, processes=None, threads=4, shard_radius_km=DEFAULT_SHARD_RADIUS_KM,
+              max_markets_per_shard=None, max_pano_distance_m=None, min_pano_date=None, progressive_top_k=None,
+              dedup=True, claims_path="batch_claims.sqlite",
+              journal_path="collection_journal.sqlite", summary_path="run_summary.json", storage_backend=None,
+              verbosity="progress", metrics_dir=None):
+    """Runs every shard of the regions in a process pool and writes the combined run summary."""
+    import data_collection as dc
+
+    processes = processes or os.cpu_count() or 1
+    shards = make_shards(regions, shard_radius_km)
+    print(f"\n{len(regions)} regions split into {len(shards)} shards of up to {shard_radius_km} km, "
+          f"{processes} processes x {threads} transfer threads.")
+    resume_shards = make_resume_shards(journal_path)
+    if resume_shards:
+        pending = sum(len(shard["markets"]) for shard in resume_shards)
+        print(f"{pending} markets from an interrupted run are unfinished, resuming them first.")
+        shards = resume_shards + shards
+
+    # Interactive steps (Drive login) and the full manifest rebuild happen once, here
+    dc.initialize_storage(storage_backend)
+    if not dc.storage_backend:
+        print("\nStorage connection failed. Terminating the program.")
+        return None
+    dc.initialize_manifest()
+    budget = dc.initialize_request_scheduler().budget
+    remaining = budget.remaining_usd()
+
+    options = {
+        "processes": processes,
+        "threads": threads,
+        "max_markets_per_shard": max_markets_per_shard,
+        "max_pano_distance_m": max_pano_distance_m or dc.MAX_PANORAMA_DISTANCE_METERS,
+        "min_pano_date": min_pano_date,
+        "progressive_top_k": progressive_top_k,
+        "dedup": dedup,
+        "verbosity": verbosity,
+        "metrics_dir": metrics_dir,
+        "claims_path": claims_path,
+        "journal_path": journal_path,
+        "storage_backend": storage_backend or os.environ.get("STORAGE_BACKEND", "drive"),
+        "budget_share_usd": None if remaining is None else remaining / processes,
+    }
+    ClaimStore(claims_path).close()
+    if metrics_dir:
+        os.makedirs(metrics_dir, exist_ok=True)
+
+    started_at = time.time()
+    results = []
+    with ProcessPoolExecutor(max_workers=processes, initializer=init_worker, initargs=(options,)) as pool:
+        futures = {pool.submit(run_shard, shard): shard for shard in shards}
+        for future in as_completed(futures):
+            shard = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = dict(shard, markets_found=0, markets_with_street_view=0, markets_captured=0, images=0,
+                              error=f"{type(e).__name__}: {e}")
+                result.pop("markets", None)
+            results.append(result)
+            budget.add_usage(result.get("api_calls", {}), result.get("spent_usd", 0.0))
+            status = f"ERROR {result['error']}" if result["error"] else f"{result['markets_captured']} markets, {result['images']} images"
+            print(f"[{len(results)}/{len(shards)}] shard {result['shard_id']}: {status}")
+
+    results.sort(key=lambda result: result["shard_id"])
+    elapsed = time.time() - started_at
+    api_calls = {}
+    for result in results:
+        for endpoint, count in result.get("api_calls", {}).items():
+            api_calls[endpoint] = api_calls.get(endpoint, 0) + count
+    summary = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started_at)),
+        "elapsed_s": round(elapsed, 1),
+        "regions": len(regions),
+        "shards": len(shards),
+        "failed_shards": sum(1 for result in results if result["error"]),
+        "markets_found": sum(result["markets_found"] for result in results),
+        "markets_with_street_view": sum(result["markets_with_street_view"] for result in results),
+        "markets_captured": sum(result["markets_captured"] for result in results),
+        "images": sum(result["images"] for result in results),
+        "api_calls": api_calls,
+        "spent_usd": round(sum(result.get("spent_usd", 0.0) for result in results), 4),
+        "shard_results": results,
+    }
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    print(f"\n{'='*60}")
+    print(f"Batch completed in {elapsed / 60:.1f} min: {summary['markets_captured']} markets and "
+          f"{summary['images']} images from {len(shards)} shards ({summary['failed_shards']} failed).")
+    print(f"API cost: ${summary['spent_usd']:.2f}. Run summary written to {summary_path}")
+    return summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("regions", help="Regions file: .json / .csv (lat, lng, radius_km, name) or .geojson polygon")
+    parser.add_argument("--processes", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--threads", type=int, default=4, help="Concurrent transfers per process")
+    parser.add_argument("--shard_radius_km", type=float, default=DEFAULT_SHARD_RADIUS_KM)
+    parser.add_argument("--max_markets_per_shard", type=int, default=None)
+    parser.add_argument("--max_pano_distance_m", type=float, default=None,
+                        help="Skip markets whose nearest panorama is farther than this (default: 30)")
+    parser.add_argument("--min_pano_date", default=None, help="Skip markets whose panorama is older than this (YYYY-MM)")
+    parser.add_argument("--progressive_top_k", type=int, default=None,
+                        help="Capture only the best K of the 9 views per market, chosen from thumbnails "
+                             "(9 + K billed Street View calls per market instead of 9)")
+    parser.add_argument("--no_dedup", action="store_true", help="Upload near-duplicate images too")
+    parser.add_argument("--claims", default="batch_claims.sqlite", help="Shared place_id claims database")
+    parser.add_argument("--journal", default="collection_journal.sqlite")
+    parser.add_argument("--summary", default="run_summary.json")
+    parser.add_argument("--verbosity", choices=["summary", "progress", "detail"], default="progress",
+                        help="Console output of the workers")
+    parser.add_argument("--metrics_dir", help="Each worker writes its Prometheus text metrics here after every shard")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    run_batch(
+        load_regions(args.regions),
+        processes=args.processes,
+        threads=args.threads,
+        shard_radius_km=args.shard_radius_km,
+        max_markets_per_shard=args.max_markets_per_shard,
+        max_pano_distance_m=args.max_pano_distance_m,
+        min_pano_date=args.min_pano_date,
+        progressive_top_k=args.progressive_top_k,
+        dedup=not args.no_dedup,
+        claims_path=args.claims,
+        journal_path=args.journal,
+        summary_path=args.summary,
+        verbosity=args.verbosity,
+        metrics_dir=args.metrics_dir,
+    )
@@ -0,0 +1,123 @@
+from geometry import haversine_distance_batch
+from instrumentation import log
+
+
+class CandidateStore:
+    """
+    Deduplicated collection of Nearby Search candidates.
+
+    Places are indexed by place_id, so merging a result page costs O(1) per place no matter
+    how many candidates are already stored. Distances of the new places of a page are
+    computed in one vectorized call. A place found again by another query only gets
+    that query appended to its "search_methods"; rejected places (already collected, large
+    chain, outside the search circle) are remembered and not evaluated twice.
+    """
+
+    def __init__(self, center_lat, center_lng, radius_meters=None,
+                 existing_place_ids=None, classifier=None, exclude_chains=True):
+        self.center_lat = center_lat
+        self.center_lng = center_lng
+        self.radius_meters = radius_meters
+        self.existing_place_ids = existing_place_ids if existing_place_ids is not None else set()
+        self.classifier = classifier
+        self.exclude_chains = exclude_chains
+        self._places = {}
+        self._order = []
+        self._rejected = set()
+        self._stream_position = 0
+
+    def __len__(self):
+        return len(self._places)
+
+    def __contains__(self, place_id):
+        return place_id in self._places
+
+    def __iter__(self):
+        """Iterates over the stored candidates in the order they were first found."""
+        return iter(self._order)
+
+    def get(self, place_id):
+        return self._places.get(place_id)
+
+    def is_chain(self, name):
+        return self.classifier is not None and self.classifier.is_large_chain(name)
+
+    def add_page(self, places, search_method):
+        """
+        Merges one page of raw Nearby Search results. Returns the list of candidates that were
+        new in this page.
+        """
+        unseen = {}
+        for place in places:
+            place_id = place.get("place_id")
+            if place_id is None or place_id in self._rejected:
+                continue
+
+            known = self._places.get(place_id)
+            if known is not None:
+                if search_method not in known["search_methods"]:
+                    known["search_methods"].append(search_method)
+                continue
+
+            if place_id in unseen:
+                continue
+
+            if place_id in self.existing_place_ids:
+                log(f"  Skipping: {place.get('name')} (available in Drive)")
+                self._rejected.add(place_id)
+                continue
+
+            name = place.get("name", "").lower()
+            if self.exclude_chains and self.is_chain(name):
+                self._rejected.add(place_id)
+                continue
+
+            unseen[place_id] = place
+
+        if not unseen:
+            return []
+
+        locations = [place.get("geometry", {}).get("location", {}) for place in unseen.values()]
+        distances = haversine_distance_batch(
+            self.center_lat, self.center_lng,
+            [location["lat"] for location in locations],
+            [location["lng"] for location in locations]
+        )
+
+        new_places = []
+        for (place_id, place), location, distance in zip(unseen.items(), locations, distances.tolist()):
+            # Sub-tiles reach past the search circle, only keep places inside it
+            if self.radius_meters is not None and distance > self.radius_meters:
+                self._rejected.add(place_id)
+                continue
+
+            place_info = {
+                "name": place.get("name"),
+                "place_id": place_id,
+                "location": location,
+                "types": place.get("types", []),
+                "formatted_address": place.get("vicinity", ""),
+                "rating": place.get("rating", 0),
+                "user_ratings_total": place.get("user_ratings_total", 0),
+                "search_method": search_method,
+                "search_methods": [search_method],
+                "distance": distance / 1000
+            }
+            self._places[place_id] = place_info
+            self._order.append(place_info)
+            new_places.append(place_info)
+
+        return new_places
+
+    def stream(self):
+        """
+        Yields the candidates added since the previous call, so later stages can start on new
+        places while the search is still running.
+        """
+        while self._stream_position < len(self._order):
+            place = self._order[self._stream_position]
+            self._stream_position += 1
+            yield place
+
+    def sorted_by_distance(self):
+        return sorted(self._order, key=lambda place: place["distance"])
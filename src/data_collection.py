@@ -1,10 +1,8 @@
 import requests
 import os
-import time
-import math
 import json
-import re
 import io
+import argparse
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
@@ -12,20 +10,59 @@ from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaIoBaseUpload, MediaFileUpload
 import pickle
+from response_cache import ResponseCache
+from spatial_tiling import adaptive_tile_search
+from candidate_store import CandidateStore
+from market_classifier import MarketClassifier
+from panorama_index import PanoramaIndex, StreetViewImageCache, quantize_heading
+from storage import StorageBackend, SpooledImage, STREAM_CHUNK_SIZE, create_storage_backend, place_id_from_folder_name
+from market_manifest import MarketManifest
+from job_journal import JobJournal, STAGE_DETAILS_FETCHED, STAGE_DETAILS_SAVED
+from request_scheduler import RequestScheduler, QuotaBudget, QuotaExceeded
+from image_dedup import PerceptualHashIndex, DUPLICATE_MAX_DISTANCE, phash
+from view_scoring import THUMBNAIL_SIZE, DEFAULT_TOP_K, analyze_view, select_views
+from geometry import haversine_distance_batch, heading_batch, offset_coordinates_batch, plan_view_grid
+import instrumentation
+from instrumentation import log, timed, PROGRESS
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 GOOGLE_API_KEY = "GOOGLE_API_KEY"  
+# Root of the Places / Street View endpoints; a local stand-in can be used for offline benchmarks
+MAPS_API_BASE_URL = os.environ.get("GOOGLE_MAPS_API_BASE_URL", "https://maps.googleapis.com")
 large_chains = ["migros", "carrefour", "bim", "a101", "şok", "metro", "macrocenter", "kim", "sok", "file", "happy center"]
+market_classifier = MarketClassifier(large_chains)
+
+# Number of parallel Street View downloads / Drive uploads in concurrent capture mode
+MAX_CAPTURE_WORKERS = 8
+# Drive accepts at most 100 calls in one batch request
+DRIVE_BATCH_SIZE = 100
+# Drive resumable uploads send chunks of a multiple of 256 KiB; smaller images go in one request
+DRIVE_UPLOAD_CHUNK_SIZE = 256 * 1024
+# Number of parallel Place Details requests during enrichment
+MAX_DETAILS_WORKERS = 8
+# Number of parallel Street View metadata requests in the pre-flight pass
+MAX_PREFLIGHT_WORKERS = 16
+# Markets whose nearest panorama is farther than this get no usable images
+MAX_PANORAMA_DISTANCE_METERS = 30
+# Only the fields Nearby Search does not return (name, geometry, types, rating are already known)
+PLACE_DETAILS_FIELDS = "formatted_address,formatted_phone_number,opening_hours"
 
 
 SCOPES = ['https://www.googleapis.com/auth/drive']
 
-class GoogleDriveManager:
-    def __init__(self, credentials_file='credentials.json'):
-        
-        self.service = None
+class GoogleDriveManager(StorageBackend):
+    name = "drive"
+    
+    def __init__(self, credentials_file='credentials.json', service=None):
+        """`service` replaces the authenticated Drive client, e.g. with a stand-in for offline benchmarks."""
+        self.creds = None
         self.credentials_file = credentials_file
+        self._local = threading.local()
+        self._shared_service = service
         self.dataset_folder_id = None
-        self.authenticate()
+        if service is None:
+            self.authenticate()
     
     def authenticate(self):
         creds = None
@@ -44,9 +81,21 @@ class GoogleDriveManager:
             with open('token.pickle', 'wb') as token:
                 pickle.dump(creds, token)
         
-        self.service = build('drive', 'v3', credentials=creds)
+        self.creds = creds
+        self._local.service = build('drive', 'v3', credentials=creds)
         print("Google Drive API connection successful! (With read and write permissions)")
     
+    @property
+    def service(self):
+        """Drive service of the calling thread (the underlying httplib2 connection is not thread-safe)."""
+        if self._shared_service is not None:
+            return self._shared_service
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            service = build('drive', 'v3', credentials=self.creds, cache_discovery=False)
+            self._local.service = service
+        return service
+    
     def find_or_create_dataset_folder(self, folder_name="DATASET"):
         try:
             query = f"name='{folder_name}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
@@ -81,44 +130,87 @@ class GoogleDriveManager:
             print(error)
             return None
     
-    def get_existing_market_folders(self):
-        existing_place_ids = set()
+    def list_market_folders(self):
+        """Returns a dict mapping every market folder name under DATASET to its folder ID."""
+        folders = {}
         
         if not self.dataset_folder_id:
-            return existing_place_ids
+            return folders
         
-        try:
-            query = f"'{self.dataset_folder_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"
-            
-            keep_paginating = True
-            page_token = None
-            while keep_paginating:
-                results = self.service.files().list(
-                    q=query,
-                    spaces='drive',
-                    fields='nextPageToken, files(id, name)',
-                    pageToken=page_token).execute()
-                
-                items = results.get('files', [])
-                
-                for item in items:
-                    folder_name = item['name']
-                    parts = folder_name.split('_')
-                    if len(parts) >= 3:  
-                        place_id = parts[0]
-                        existing_place_ids.add(place_id)
-                        print(f"  Existing market found: {folder_name}")
-                
-                page_token = results.get('nextPageToken', None)
-                if page_token is None:
-                    keep_paginating = False
+        query = f"'{self.dataset_folder_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"
+        
+        page_token = None
+        while True:
+            results = self.service.files().list(
+                q=query,
+                spaces='drive',
+                pageSize=1000,
+                fields='nextPageToken, files(id, name)',
+                pageToken=page_token).execute()
             
-            print(f"\nToplam {len(existing_place_ids)} existing market found.")
-            return existing_place_ids
+            for item in results.get('files', []):
+                folders[item['name']] = item['id']
             
+            page_token = results.get('nextPageToken', None)
+            if page_token is None:
+                return folders
+
+    def list_folder_files(self, folder_id):
+        """Returns the names of the files stored in a market folder."""
+        query = f"'{folder_id}' in parents and trashed=false"
+        names = []
+        page_token = None
+        while True:
+            results = self.service.files().list(
+                q=query,
+                spaces='drive',
+                pageSize=1000,
+                fields='nextPageToken, files(name)',
+                pageToken=page_token).execute()
+            names.extend(item['name'] for item in results.get('files', []))
+            page_token = results.get('nextPageToken', None)
+            if page_token is None:
+                return sorted(names)
+    
+    def get_change_token(self):
+        """Start token of the Drive changes feed."""
+        try:
+            return self.service.changes().getStartPageToken().execute().get('startPageToken')
         except HttpError as error:
-            print(f'An error occurred while listing folders: {error}')
-            return set()
+            print(f'Error reading the Drive change token: {error}')
+            return None
+    
+    def list_market_folder_changes(self, change_token):
+        """
+        Reads the Drive changes feed since change_token.
+        
+        Returns:
+            (added, removed_ids, new_token): market folders created under DATASET as a
+            name -> ID dict, IDs of removed or trashed files and the token for the next call
+        """
+        added = {}
+        removed_ids = set()
+        page_token = change_token
+        while page_token:
+            results = self.service.changes().list(
+                pageToken=page_token,
+                spaces='drive',
+                pageSize=1000,
+                fields='nextPageToken, newStartPageToken, changes(fileId, removed, file(name, parents, mimeType, trashed))'
+            ).execute()
+            
+            for change in results.get('changes', []):
+                file = change.get('file') or {}
+                if change.get('removed') or file.get('trashed'):
+                    removed_ids.add(change['fileId'])
+                elif (file.get('mimeType') == 'application/vnd.google-apps.folder'
+                      and self.dataset_folder_id in file.get('parents', [])):
+                    added[file['name']] = change['fileId']
+            
+            if 'newStartPageToken' in results:
+                return added, removed_ids, results['newStartPageToken']
+            page_token = results.get('nextPageToken')
+        return added, removed_ids, change_token
     
     def create_market_folder(self, folder_name):
         """
@@ -148,6 +240,51 @@ class GoogleDriveManager:
             print(f'Error creating folder: {error}')
             return None
     
+    def create_market_folders(self, folder_names, on_created=None):
+        """
+        Creates several market folders with Drive batch requests (up to 100 folders per HTTP
+        round-trip). Folder IDs are generated up front, so every created folder can be used
+        as a parent right away. on_created(folder_name, folder_id) is called for the folders
+        of every batch as soon as it returns.
+        
+        Returns:
+            dict mapping each folder name to its ID (None for folders that could not be created)
+        """
+        folder_ids = {}
+        try:
+            for start in range(0, len(folder_names), DRIVE_BATCH_SIZE):
+                chunk = folder_names[start:start + DRIVE_BATCH_SIZE]
+                ids = self.service.files().generateIds(count=len(chunk), space='drive').execute().get('ids', [])
+                failed = set()
+                
+                def callback(request_id, response, exception):
+                    if exception is not None:
+                        print(f'Error creating folder {chunk[int(request_id)]}: {exception}')
+                        failed.add(int(request_id))
+                
+                batch = self.service.new_batch_http_request(callback=callback)
+                for index, (folder_name, folder_id) in enumerate(zip(chunk, ids)):
+                    file_metadata = {
+                        'id': folder_id,
+                        'name': folder_name,
+                        'mimeType': 'application/vnd.google-apps.folder',
+                        'parents': [self.dataset_folder_id]
+                    }
+                    batch.add(self.service.files().create(body=file_metadata, fields='id'), request_id=str(index))
+                batch.execute()
+                
+                for index, (folder_name, folder_id) in enumerate(zip(chunk, ids)):
+                    folder_ids[folder_name] = None if index in failed else folder_id
+                    if on_created and index not in failed:
+                        on_created(folder_name, folder_id)
+        
+        except HttpError as error:
+            print(f'Error creating folders: {error}')
+        
+        for folder_name in folder_names:
+            folder_ids.setdefault(folder_name, None)
+        return folder_ids
+    
     def upload_json_to_folder(self, folder_id, filename, content):
         """
         Uploads the JSON content to the specified folder.
@@ -169,7 +306,7 @@ class GoogleDriveManager:
                 fields='id'
             ).execute()
             
-            print(f"    JSON  file is uploaded: {filename}")
+            log(f"    JSON  file is uploaded: {filename}")
             return file.get('id')
             
         except HttpError as error:
@@ -193,19 +330,133 @@ class GoogleDriveManager:
                 fields='id'
             ).execute()
             
-            print(f"    Image uploaded: {filename}")
+            log(f"    Image uploaded: {filename}")
             return file.get('id')
             
         except HttpError as error:
             print(f'Error while loading image: {error}')
             return None
 
-drive_manager = None
+    def upload_image_stream(self, folder_id, filename, image):
+        """
+        Uploads a SpooledImage. Images larger than one chunk use a resumable upload that reads
+        DRIVE_UPLOAD_CHUNK_SIZE bytes at a time, so no upload holds more than one chunk in memory.
+        """
+        try:
+            file_metadata = {
+                'name': filename,
+                'parents': [folder_id]
+            }
+            resumable = image.size > DRIVE_UPLOAD_CHUNK_SIZE
+            media = MediaIoBaseUpload(image.open(), mimetype='image/jpeg',
+                                      chunksize=DRIVE_UPLOAD_CHUNK_SIZE, resumable=resumable)
+            request = self.service.files().create(
+                body=file_metadata,
+                media_body=media,
+                fields='id'
+            )
+            if resumable:
+                file = None
+                while file is None:
+                    _, file = request.next_chunk()
+            else:
+                file = request.execute()
+
+            log(f"    Image uploaded: {filename}")
+            return file.get('id')
+
+        except HttpError as error:
+            print(f'Error while loading image: {error}')
+            return None
+
+def create_http_session(pool_size=MAX_CAPTURE_WORKERS * 2):
+    """Shared keep-alive session for the Maps endpoints, sized for the concurrent capture pools."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+http_session = create_http_session()
+request_scheduler = RequestScheduler(http_session)
+storage_backend = None
+market_manifest = None
+job_journal = None
+response_cache = None
+panorama_index = PanoramaIndex()
+image_cache = None
+progressive_top_k = None
+image_hash_index = None
+
+# Only final answers are cached; errors and quota failures must be retried on the next run
+CACHEABLE_STATUSES = {"OK", "ZERO_RESULTS"}
+
+def get_json(endpoint, base_url, params):
+    """
+    Sends a GET request to a JSON endpoint of the Google Maps APIs, going through the
+    persistent response cache when it is enabled. Returns the parsed body or None.
+    """
+    if response_cache:
+        cached = response_cache.get(endpoint, params)
+        if cached is not None:
+            instrumentation.count("cache_hits_total", cache="api_response", endpoint=endpoint)
+            return cached
+        instrumentation.count("cache_misses_total", cache="api_response", endpoint=endpoint)
+
+    result = request_scheduler.get_json(endpoint, base_url, params)
+    if result is None:
+        return None
+
+    if response_cache and result.get("status") in CACHEABLE_STATUSES:
+        response_cache.set(endpoint, params, result)
+    return result
+
+def get_next_page(base_url, page_params):
+    """Fetches a next_page_token page, polling until the token becomes valid unless the page is cached."""
+    if response_cache and response_cache.contains("nearbysearch", page_params):
+        return get_json("nearbysearch", base_url, page_params)
+    return request_scheduler.poll_page_token(lambda: get_json("nearbysearch", base_url, page_params))
+
+def initialize_request_scheduler(daily_budget_usd=None, state_path="api_quota.json", rate_limits=None):
+    """
+    Sets up rate limiting and quota accounting for all Google API calls. The daily budget in USD
+    comes from the GOOGLE_API_DAILY_BUDGET_USD environment variable; without it costs are only tracked.
+    """
+    global request_scheduler
+    if daily_budget_usd is None and os.environ.get("GOOGLE_API_DAILY_BUDGET_USD"):
+        daily_budget_usd = float(os.environ["GOOGLE_API_DAILY_BUDGET_USD"])
+    budget = QuotaBudget(daily_budget_usd=daily_budget_usd, state_path=state_path)
+    request_scheduler = RequestScheduler(http_session, rate_limits=rate_limits, budget=budget)
+    return request_scheduler
+
+def initialize_image_cache(cache_dir="streetview_cache"):
+    """Opens the local Street View image cache shared by neighbouring markets."""
+    global image_cache
+    image_cache = StreetViewImageCache(cache_dir)
+    return image_cache
+
+def initialize_response_cache(db_path="api_cache.sqlite"):
+    """Opens the local API response cache."""
+    global response_cache
+    response_cache = ResponseCache(db_path)
+    print(f"API response cache: {db_path} ({response_cache.stats()['entries']} stored responses)")
+    return response_cache
+
+def initialize_progressive_capture(top_k=DEFAULT_TOP_K):
+    """Captures only the top_k views of each market at full resolution, chosen from thumbnails."""
+    global progressive_top_k
+    progressive_top_k = top_k
+    return progressive_top_k
+
+def initialize_dedup_index(db_path="image_hashes.sqlite", max_distance=DUPLICATE_MAX_DISTANCE):
+    """Opens the perceptual-hash index that keeps near-duplicate images out of storage."""
+    global image_hash_index
+    image_hash_index = PerceptualHashIndex(db_path, max_distance)
+    print(f"Image dedup index: {db_path} ({len(image_hash_index)} hashes)")
+    return image_hash_index
 
 def initialize_drive_manager():
     """Starts Google Drive connection"""
-    global drive_manager
-    
     print("\n=== Establishing Google Drive Connection ===")
     print("Note: You may need to log in to your Google account in your browser for the first run.")
     
@@ -221,44 +472,97 @@ def initialize_drive_manager():
         print(e)
         return None
 
-def save_market_to_drive(market):
+def initialize_storage(backend_name=None):
+    """
+    Selects where market folders are written, from the STORAGE_BACKEND environment variable:
+    "drive" (default), "local" (LOCAL_STORAGE_DIR) or "s3" (S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL).
+    """
+    global storage_backend
+    backend_name = backend_name or os.environ.get("STORAGE_BACKEND", "drive")
+    if backend_name == "drive":
+        storage_backend = initialize_drive_manager()
+    else:
+        try:
+            storage_backend = create_storage_backend(backend_name)
+            print(f"\n=== Using {storage_backend.name} storage backend ===")
+        except (ImportError, ValueError) as e:
+            print(e)
+            storage_backend = None
+    return storage_backend
+
+def initialize_manifest():
+    """Opens the local manifest of collected markets and applies the backend's changes since the last run."""
+    global market_manifest
+    market_manifest = MarketManifest(f"market_manifest_{storage_backend.name}.sqlite")
+    market_manifest.sync(storage_backend)
+    return market_manifest
+
+def initialize_journal(db_path="collection_journal.sqlite"):
+    """Opens the crash-safe journal that lets an interrupted run resume where it stopped."""
+    global job_journal
+    job_journal = JobJournal(db_path)
+    return job_journal
+
+def record_collected_market(market, folder_id, image_count, completed=True):
+    """
+    Adds a captured market to the manifest so later runs skip it without listing the storage.
+    Markets with a failed download or upload are not marked completed in the journal and are
+    finished by the next run; only views without imagery and duplicates may be missing.
+    """
+    if market_manifest is not None:
+        market_manifest.record_market(market, market_folder_name(market), folder_id, image_count)
+    if job_journal and completed:
+        job_journal.record_completed(market.get("place_id"), image_count)
+
+def market_folder_name(market):
+    """Name of the Drive folder of a market: {place_id}_{lat}_{lng}"""
+    place_id = market.get("place_id")
+    lat = market.get("location", {}).get("lat", "unknown_lat")
+    lng = market.get("location", {}).get("lng", "unknown_lng")
+    return f"{place_id}_{lat}_{lng}"
+
+def save_market_to_drive(market, folder_id=None):
     """
     Saves market information and images to Google Drive.
+    The folder is created unless an already created folder_id is given.
     """
-    if not drive_manager:
-        print("No Google Drive connection, market could not be saved.")
+    if not storage_backend:
+        print("No storage connection, market could not be saved.")
         return None
     
     place_id = market.get("place_id")
-    lat = market.get("location", {}).get("lat", "unknown_lat")
-    lng = market.get("location", {}).get("lng", "unknown_lng")
     
-    folder_name = f"{place_id}_{lat}_{lng}"
+    if not folder_id and job_journal:
+        folder_id = job_journal.folder_id_of(place_id)
     
-    print(f"\nCreating a folder in Drive for '{market.get('name')}'...")
-    folder_id = drive_manager.create_market_folder(folder_name)
+    if not folder_id:
+        log(f"\nCreating a folder in Drive for '{market.get('name')}'...", PROGRESS)
+        folder_id = storage_backend.create_market_folder(market_folder_name(market))
     
     if folder_id:
+        if job_journal:
+            job_journal.record_folder(place_id, folder_id)
+            if job_journal.has_reached(place_id, STAGE_DETAILS_SAVED):
+                return folder_id
         json_filename = f"{place_id}_details.json"
-        drive_manager.upload_json_to_folder(folder_id, json_filename, market)
+        with instrumentation.span("storage_upload", backend=storage_backend.name):
+            saved = storage_backend.upload_json_to_folder(folder_id, json_filename, market)
+        if saved and job_journal:
+            job_journal.record_details_saved(place_id)
         return folder_id
     
     return None
 
 
-def download_and_upload_street_view_images(target_name, target_lat, target_lng, place_id, drive_folder_id):
+def plan_street_view_views(target_lat, target_lng):
     """
-    Downloads Street View images and uploads them to Google Drive.
+    Resolves the camera position for a target and returns the list of Street View requests
+    (3 position offsets x 3 angle variations) that should be captured for it.
     """
-    if not drive_manager or not drive_folder_id:
-        print("There is no Google Drive link or folder ID.")
-        return 0
-    
-    print(f"\nDownloading Street View images and uploading them to Drive {target_name}...")
     metadata = get_streetview_metadata(target_lat, target_lng)
 
     if not metadata or metadata.get("status") != "OK":
-        print(f"Could not get Street View metadata for coordinates {target_lat}, {target_lng}!")
+        log(f"Could not get Street View metadata for coordinates {target_lat}, {target_lng}!")
         camera_lat, camera_lng = target_lat, target_lng
         nearest_pano = None
     else:
@@ -267,18 +571,17 @@ def download_and_upload_street_view_images(target_name, target_lat, target_lng,
         nearest_pano = metadata.get("pano_id")
 
         from_target_meters = haversine_distance(target_lat, target_lng, camera_lat, camera_lng)
-        if from_target_meters > 30:
-            print(f"The closest Street View location is {from_target_meters:.1f} meters from the target!")
+        if from_target_meters > MAX_PANORAMA_DISTANCE_METERS:
+            log(f"The closest Street View location is {from_target_meters:.1f} meters from the target!")
             camera_lat, camera_lng = target_lat, target_lng
             nearest_pano = None
 
     base_heading = calculate_heading_to_target(camera_lat, camera_lng, target_lat, target_lng)
-    print(f"Target direction : {base_heading:.1f}°")
+    log(f"Target direction : {base_heading:.1f}°")
 
     angle_variations = [-30, 0, 30]
     position_offsets = [-20, 0, 20]
 
-    base_url = "https://maps.googleapis.com/maps/api/streetview"
     common_params = {
         "size": "1280x1024",
         "key": GOOGLE_API_KEY,
@@ -288,17 +591,21 @@ def download_and_upload_street_view_images(target_name, target_lat, target_lng,
     if nearest_pano:
         common_params["pano"] = nearest_pano
 
-    total_successful = 0
-    total_attempts = len(position_offsets) * len(angle_variations)
+    position_lats, position_lngs, headings = plan_view_grid(
+        [camera_lat], [camera_lng], [target_lat], [target_lng], position_offsets, angle_variations
+    )
 
+    views = []
     for pos_idx, offset in enumerate(position_offsets):
-        perpendicular_bearing = (base_heading + 90) % 360
-        position_lat, position_lng = offset_coordinates(camera_lat, camera_lng, offset, perpendicular_bearing)
-        position_heading = calculate_heading_to_target(position_lat, position_lng, target_lat, target_lng)
+        position_lat = float(position_lats[0, pos_idx])
+        position_lng = float(position_lngs[0, pos_idx])
 
         for angle_idx, angle_offset in enumerate(angle_variations):
-            heading = (position_heading + angle_offset) % 360
+            heading = float(headings[0, pos_idx, angle_idx])
             params = common_params.copy()
+            if nearest_pano:
+                # Same panorama: round the heading so overlapping views hit the image cache
+                heading = quantize_heading(heading)
 
             if "pano" not in params:
                 params["location"] = f"{position_lat},{position_lng}"
@@ -310,405 +617,769 @@ def download_and_upload_street_view_images(target_name, target_lat, target_lng,
                 "quality": 100
             })
 
-            response = requests.get(base_url, params=params, stream=True)
+            views.append({
+                "filename": f"pos_{offset}_angle_{angle_offset}.jpg",
+                "offset": offset,
+                "angle": angle_offset,
+                "params": params
+            })
+
+    return views
+
+@timed("stage", stage="progressive_probe")
+def select_views_progressively(views, top_k):
+    """
+    Fetches a thumbnail of every planned view, scores it (sharpness, contrast, storefront-like
+    edges) and returns the top_k views that are not near duplicates of each other, in plan order.
+    Views whose thumbnail could not be fetched fill the slots the scored views leave free; when
+    no thumbnail could be fetched at all, every view is captured.
+    """
+    def probe(view):
+        try:
+            image_data = download_street_view_image(dict(view["params"], size=THUMBNAIL_SIZE))
+        except (requests.RequestException, QuotaExceeded):
+            return None, 0, True
+        if not image_data:
+            return None, 0, False
+        return analyze_view(image_data), len(image_data), False
+
+    with ThreadPoolExecutor(max_workers=len(views) or 1) as pool:
+        probes = list(pool.map(probe, views))
+
+    failed = [index for index, (_, _, probe_failed) in enumerate(probes) if probe_failed]
+    if views and len(failed) == len(views):
+        log(f"    Progressive capture: no thumbnail could be fetched, capturing all {len(views)} views")
+        return views
+    selected = select_views([analysis for analysis, _, _ in probes], top_k)
+    selected += failed[:max(0, top_k - len(selected))]
+    thumbnail_bytes = sum(size for _, size, _ in probes)
+    log(f"    Progressive capture: {len(selected)} of {len(views)} views selected "
+          f"({thumbnail_bytes / 1024:.0f} KB of thumbnails)")
+    return [views[index] for index in sorted(selected)]
+
+def plan_capture_views(target_lat, target_lng):
+    """The views to capture for a target: all planned views, or the best ones in progressive mode."""
+    views = plan_street_view_views(target_lat, target_lng)
+    if progressive_top_k:
+        views = select_views_progressively(views, progressive_top_k)
+    return views
+
+def check_street_view_coverage(market, max_distance_m=MAX_PANORAMA_DISTANCE_METERS, min_date=None):
+    """
+    Resolves the nearest panorama of a market. Returns ({"pano_id", "distance_m", "date"}, None)
+    when it is usable, or (None, reason) when it is missing, too far or older than min_date ("YYYY-MM").
+    """
+    location = market.get("location", {})
+    lat, lng = location.get("lat"), location.get("lng")
+    if not lat or not lng:
+        return None, "no location"
+
+    metadata = get_streetview_metadata(lat, lng)
+    if not metadata:
+        return None, "no panorama"
+
+    pano_location = metadata.get("location", {})
+    distance = haversine_distance(lat, lng, pano_location.get("lat", lat), pano_location.get("lng", lng))
+    if distance > max_distance_m:
+        return None, "too far"
+    date = metadata.get("date")
+    if min_date and (not date or date < min_date):
+        return None, "too old"
+    return {"pano_id": metadata.get("pano_id"), "distance_m": round(distance, 1), "date": date}, None
+
+@timed("stage", stage="preflight")
+def preflight_markets(markets, max_distance_m=MAX_PANORAMA_DISTANCE_METERS, min_date=None,
+                      max_workers=MAX_PREFLIGHT_WORKERS):
+    """
+    Checks the Street View coverage of all candidates concurrently before anything is written
+    to storage (metadata requests do not use image quota). Returns the markets with a usable
+    panorama in their original order, each with a "street_view" entry describing it.
+    """
+    if not markets:
+        return []
+    print(f"\nChecking Street View coverage of {len(markets)} markets...")
+
+    results = [None] * len(markets)
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = {
+            pool.submit(check_street_view_coverage, market, max_distance_m, min_date): index
+            for index, market in enumerate(markets)
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                results[index] = future.result()
+            except requests.RequestException as e:
+                results[index] = (None, "request error")
+                print(f"  Request error while checking {markets[index].get('name')}: {e}")
+
+    passed = []
+    rejected = {}
+    for market, (street_view, reason) in zip(markets, results):
+        if street_view:
+            market["street_view"] = street_view
+            passed.append(market)
+        else:
+            rejected[reason] = rejected.get(reason, 0) + 1
+
+    print(f"Street View pre-flight: {len(passed)} of {len(markets)} markets have a panorama within {max_distance_m:g} m"
+          + (f" taken in {min_date} or later" if min_date else "") + ".")
+    for reason, count in sorted(rejected.items()):
+        print(f"  Skipped ({reason}): {count}")
+    return passed
+
+def first_chunk(response):
+    """Reads the first chunk of a streamed response once; the rest stays in response.remaining_chunks."""
+    if not hasattr(response, "peeked_chunk"):
+        response.remaining_chunks = response.iter_content(STREAM_CHUNK_SIZE)
+        response.peeked_chunk = next(response.remaining_chunks, b"")
+    return response.peeked_chunk
+
+def is_streetview_error(response):
+    # An XML body instead of a JPEG is an API error (usually quota)
+    return response.status_code == 200 and first_chunk(response).startswith(b"<?xml")
+
+class StreetViewDownloadError(requests.RequestException):
+    """A Street View image could not be fetched after all retries (unlike a view without imagery)."""
+
+def download_street_view_image_stream(params):
+    """
+    Downloads a single Street View image into a SpooledImage, chunk by chunk. Only the first
+    chunk is inspected for an error body; the rest is never held in memory as a whole.
+    Returns None when there is no imagery for the view (HTTP 404 with return_error_code) and
+    raises StreetViewDownloadError when the download failed. Panorama views are served from
+    the image cache when a neighbouring market already fetched them.
+    """
+    cache_key = None
+    if image_cache and params.get("pano"):
+        cache_key = image_cache.make_key(params["pano"], params["heading"], params["pitch"], params["fov"], params["size"])
+        cached_path = image_cache.get_path(cache_key)
+        if cached_path is not None:
+            instrumentation.count("cache_hits_total", cache="streetview_image")
+            return SpooledImage.from_file(cached_path)
+
+    base_url = f"{MAPS_API_BASE_URL}/maps/api/streetview"
+    with instrumentation.span("streetview_download"):
+        response = request_scheduler.get("streetview", base_url, params, stream=True, retry_if=is_streetview_error)
+        if response is None:
+            raise StreetViewDownloadError("no response after retries")
+
+        try:
+            if response.status_code == 404:
+                return None
+            if response.status_code != 200 or is_streetview_error(response):
+                raise StreetViewDownloadError(f"HTTP {response.status_code} error response")
+            image = SpooledImage()
+            try:
+                image.write(first_chunk(response))
+                for chunk in response.remaining_chunks:
+                    image.write(chunk)
+            except BaseException:
+                image.close()
+                raise
+        finally:
+            response.close()
+    if not image.size:
+        image.close()
+        raise StreetViewDownloadError("empty image")
+    instrumentation.count("api_bytes_total", image.size, endpoint="streetview")
+
+    if cache_key:
+        image_cache.put_stream(cache_key, image)
+    return image
+
+def download_street_view_image(params):
+    """Downloads a single Street View image. Returns the JPEG bytes or None when the view has no imagery."""
+    image = download_street_view_image_stream(params)
+    if image is None:
+        return None
+    with image:
+        return image.read_bytes()
+
+def store_image(folder_id, place_id, filename, image):
+    """
+    Uploads a SpooledImage unless the dedup index already holds a near-identical image of the
+    same market. Returns (file_id, duplicate_of); a skipped duplicate is not journaled as uploaded.
+    """
+    image_hash = None
+    if image_hash_index is not None:
+        try:
+            image_hash = phash(image.open())
+        except (OSError, ValueError):
+            image_hash = None
+        if image_hash is not None:
+            duplicate = image_hash_index.check_and_add(image_hash, place_id, filename)
+            if duplicate is not None:
+                instrumentation.count("duplicates_skipped_total")
+                log(f"    Skipping {filename}: near duplicate of {duplicate[1]}")
+                return None, duplicate
+
+    with instrumentation.span("storage_upload", backend=storage_backend.name):
+        file_id = storage_backend.upload_image_stream(folder_id, filename, image)
+    if file_id:
+        instrumentation.count("storage_bytes_total", image.size, backend=storage_backend.name)
+    else:
+        instrumentation.count("storage_failures_total", backend=storage_backend.name)
+    if not file_id and image_hash is not None:
+        image_hash_index.discard(image_hash, place_id, filename)
+    return file_id, None
 
-            if response.status_code == 200 and not response.content.startswith(b"<?xml"):
-                image_data = response.content
-                filename = f"pos_{offset}_angle_{angle_offset}.jpg"
+@timed("stage", stage="capture")
+def download_and_upload_street_view_images(target_name, target_lat, target_lng, place_id, drive_folder_id):
+    """
+    Downloads Street View images and uploads them to Google Drive.
+    """
+    if not storage_backend or not drive_folder_id:
+        print("There is no Google Drive link or folder ID.")
+        return 0
     
-                if drive_manager.upload_image_to_folder(drive_folder_id, filename, image_data):
-                    total_successful += 1
-                else:
-                    print(f"    ERROR: {filename} could not be uploaded to Drive")
-            else:
-                print(f"    Failed to download image for position {offset}m, angle {angle_offset}°")
+    log(f"\nDownloading Street View images and uploading them to Drive {target_name}...", PROGRESS)
+    views = plan_capture_views(target_lat, target_lng)
+    uploaded = job_journal.uploaded_images(place_id) if job_journal else set()
+
+    total_successful = 0
+    total_attempts = len(views)
+    # Views that failed but can be retried; the market is only marked completed when there are none
+    failed_transfers = 0
+    duplicates = 0
+
+    for view in views:
+        filename = view["filename"]
+        if filename in uploaded:
+            total_successful += 1
+            continue
+
+        try:
+            image = download_street_view_image_stream(view["params"])
+        except (requests.RequestException, OSError) as e:
+            failed_transfers += 1
+            log(f"    Failed to download image for position {view['offset']}m, angle {view['angle']}°: {e}")
+            continue
+        if not image:
+            log(f"    No Street View imagery for position {view['offset']}m, angle {view['angle']}°")
+            continue
+
+        try:
+            with image:
+                file_id, duplicate = store_image(drive_folder_id, place_id, filename, image)
+            if file_id and job_journal:
+                job_journal.record_image(place_id, filename, file_id)
+        except Exception as e:
+            failed_transfers += 1
+            print(f"    ERROR: {filename} could not be stored: {e!r}")
+            continue
+        if duplicate:
+            duplicates += 1
+        elif file_id:
+            total_successful += 1
+        else:
+            failed_transfers += 1
+            log(f"    ERROR: {filename} could not be uploaded to Drive")
 
-    print(f"\n{total_successful} of {total_attempts} images for {target_name} successfully uploaded to Drive.")
+    log(f"\n{total_successful} of {total_attempts} images for {target_name} successfully uploaded to Drive"
+          + (f" ({duplicates} duplicates skipped)." if duplicates else "."), PROGRESS)
+    if job_journal and failed_transfers == 0:
+        job_journal.record_completed(place_id, total_successful)
     return total_successful
 
-def get_place_details(place_id):
+@timed("stage", stage="capture")
+def capture_markets_concurrently(markets, max_workers=MAX_CAPTURE_WORKERS):
+    """
+    Concurrent version of the save_market_to_drive + download_and_upload_street_view_images loop.
+
+    Market setup (metadata lookup and folder creation), Street View downloads and Drive uploads
+    run in separate bounded thread pools, so downloads of one market overlap with uploads of
+    another. At most 2 * max_workers downloaded images wait for an upload slot, each spooled
+    to a temporary file beyond a small in-memory buffer.
+
+    Returns a list with the number of uploaded images for each market (None when the
+    market could not be set up), in the same order as `markets`.
+    """
+    if not storage_backend:
+        print("No storage connection, markets could not be saved.")
+        return [None] * len(markets)
+
+    success_counts = [None] * len(markets)
+    attempt_counts = [0] * len(markets)
+    folder_ids_by_index = {}
+    failed_transfers = [0] * len(markets)
+    duplicate_counts = [0] * len(markets)
+    counts_lock = threading.Lock()
+    in_flight = threading.BoundedSemaphore(max_workers * 2)
+
+    def setup_market(market, folder_id):
+        folder_id = save_market_to_drive(market, folder_id)
+        if not folder_id:
+            return None, []
+        market_lat = market["location"]["lat"]
+        market_lng = market["location"]["lng"]
+        return folder_id, plan_capture_views(market_lat, market_lng)
+
+    def upload(index, folder_id, filename, image):
+        try:
+            with image:
+                file_id, duplicate = store_image(folder_id, markets[index].get("place_id"), filename, image)
+            if duplicate:
+                with counts_lock:
+                    duplicate_counts[index] += 1
+            elif file_id:
+                if job_journal:
+                    job_journal.record_image(markets[index].get("place_id"), filename, file_id)
+                with counts_lock:
+                    success_counts[index] += 1
+            else:
+                with counts_lock:
+                    failed_transfers[index] += 1
+                log(f"    ERROR: {filename} could not be uploaded to Drive")
+        except Exception as e:
+            # Socket / httplib2 timeouts, sqlite errors of the journal or the dedup index, ...
+            with counts_lock:
+                failed_transfers[index] += 1
+            print(f"    ERROR: {filename} of {markets[index].get('name')} could not be stored: {e!r}")
+        finally:
+            in_flight.release()
+
+    def download(index, folder_id, view, upload_pool):
+        handed_off = False
+        try:
+            image = download_street_view_image_stream(view["params"])
+            if not image:
+                log(f"    No Street View imagery for position {view['offset']}m, angle {view['angle']}° ({markets[index].get('name')})")
+                return
+            upload_pool.submit(upload, index, folder_id, view["filename"], image)
+            handed_off = True
+        except (requests.RequestException, QuotaExceeded) as e:
+            log(f"    Failed to download {view['filename']} ({markets[index].get('name')}): {e}")
+            with counts_lock:
+                failed_transfers[index] += 1
+        except Exception as e:
+            # e.g. an OSError of the image cache or the spool file
+            with counts_lock:
+                failed_transfers[index] += 1
+            print(f"    ERROR: {view['filename']} of {markets[index].get('name')} could not be downloaded: {e!r}")
+        finally:
+            # The upload releases the slot of an image handed to it
+            if not handed_off:
+                in_flight.release()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as upload_pool:
+        with ThreadPoolExecutor(max_workers=max_workers) as download_pool:
+            with ThreadPoolExecutor(max_workers=max(1, max_workers // 2)) as setup_pool:
+                valid_indexes = []
+                for index, market in enumerate(markets):
+                    location = market.get("location", {})
+                    if location.get("lat") and location.get("lng"):
+                        valid_indexes.append(index)
+                    else:
+                        print(f"ERROR: No location information found for {market.get('name', 'Anonymous Market')}.")
+
+                # Folders created by an interrupted earlier run are reused
+                journaled_folders = {}
+                if job_journal:
+                    for index in valid_indexes:
+                        folder_id = job_journal.folder_id_of(markets[index].get("place_id"))
+                        if folder_id:
+                            journaled_folders[market_folder_name(markets[index])] = folder_id
+                new_folders = {market_folder_name(markets[index]): markets[index].get("place_id")
+                               for index in valid_indexes
+                               if market_folder_name(markets[index]) not in journaled_folders}
+
+                def journal_folder(folder_name, folder_id):
+                    # Journaled before any setup work, so a crash after the batch still leaves
+                    # the market resumable instead of an unknown folder the manifest calls collected
+                    if job_journal:
+                        job_journal.record_folder(new_folders[folder_name], folder_id)
+
+                print(f"\nCreating {len(new_folders)} market folders in Drive...")
+                folder_ids = storage_backend.create_market_folders(list(new_folders), journal_folder) if new_folders else {}
+                folder_ids.update(journaled_folders)
+
+                setup_futures = {}
+                for index in valid_indexes:
+                    folder_id = folder_ids.get(market_folder_name(markets[index]))
+                    if folder_id:
+                        setup_futures[setup_pool.submit(setup_market, markets[index], folder_id)] = index
+                    else:
+                        log(f"✗ Could not create Drive folder for {markets[index].get('name')}.", PROGRESS)
+
+                for future in as_completed(setup_futures):
+                    index = setup_futures[future]
+                    try:
+                        folder_id, views = future.result()
+                    except Exception as e:
+                        print(f"Error while preparing {markets[index].get('name')}: {e}")
+                        continue
+                    if not folder_id:
+                        log(f"✗ Could not create Drive folder for {markets[index].get('name')}.", PROGRESS)
+                        continue
+
+                    uploaded = job_journal.uploaded_images(markets[index].get("place_id")) if job_journal else set()
+                    success_counts[index] = len([view for view in views if view["filename"] in uploaded])
+                    attempt_counts[index] = len(views)
+                    folder_ids_by_index[index] = folder_id
+                    for view in views:
+                        if view["filename"] in uploaded:
+                            continue
+                        in_flight.acquire()
+                        download_pool.submit(download, index, folder_id, view, upload_pool)
+
+    for index, (market, successful, attempts) in enumerate(zip(markets, success_counts, attempt_counts)):
+        if successful is not None:
+            log(f"{successful} of {attempts} images for {market.get('name')} successfully uploaded to Drive"
+                  + (f" ({duplicate_counts[index]} duplicates skipped)." if duplicate_counts[index] else "."), PROGRESS)
+            record_collected_market(market, folder_ids_by_index[index], successful,
+                                    completed=failed_transfers[index] == 0)
+
+    return success_counts
+
+def get_place_details(place_id, fields=PLACE_DETAILS_FIELDS):
     """Retrieves detail information for a specific place_id."""
-    base_url = "https://maps.googleapis.com/maps/api/place/details/json"
+    base_url = f"{MAPS_API_BASE_URL}/maps/api/place/details/json"
     
     params = {
         "place_id": place_id,
-        "fields": "name,formatted_address,geometry,types,rating,user_ratings_total,opening_hours,formatted_phone_number",
+        "fields": fields,
         "key": GOOGLE_API_KEY
     }
     
-    response = requests.get(base_url, params=params)
-    
-    if response.status_code == 200:
-        result = response.json()
-        if result.get("status") == "OK":
-            return result.get("result")
+    result = get_json("place_details", base_url, params)
+    if result and result.get("status") == "OK":
+        return result.get("result")
     
     return None
 
+def apply_place_details(place, details):
+    """Merges a Place Details result into a Nearby Search place."""
+    place["formatted_address"] = details.get("formatted_address", place.get("formatted_address", ""))
+    place["formatted_phone_number"] = details.get("formatted_phone_number", "")
+    if "opening_hours" in details:
+        place["open_now"] = details["opening_hours"].get("open_now", False)
+        if "weekday_text" in details["opening_hours"]:
+            place["weekday_text"] = details["opening_hours"]["weekday_text"]
+
+def needs_details(place):
+    if job_journal and job_journal.has_reached(place.get("place_id"), STAGE_DETAILS_FETCHED):
+        return False
+    return "formatted_phone_number" not in place
+
+@timed("stage", stage="place_details")
+def enrich_markets(markets, max_workers=MAX_DETAILS_WORKERS):
+    """
+    Fetches Place Details for the markets that do not have them yet, `max_workers` requests at
+    a time, and merges them into the market dicts in place.
+    """
+    pending = [market for market in markets if needs_details(market)]
+    if not pending:
+        return markets
+    print(f"\nRetrieving details for {len(pending)} markets...")
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = {pool.submit(get_place_details, market.get("place_id")): market for market in pending}
+        for done, future in enumerate(as_completed(futures), start=1):
+            market = futures[future]
+            try:
+                details = future.result()
+            except requests.RequestException as e:
+                print(f"  Request error while retrieving details for {market.get('name')}: {e}")
+                continue
+            log(f"  {done}/{len(pending)} - Details retrieved for {market.get('name')}")
+            if details:
+                apply_place_details(market, details)
+                if job_journal:
+                    job_journal.record_details(market)
+    return markets
+
 def is_actual_market(place):
     """Determines whether a place is truly a market."""
-    name = place.get("name", "").lower()
-    types = [t.lower() for t in place.get("types", [])]
-    
-    # Strong positive indicators
-    strong_market_types = ["grocery_or_supermarket", "supermarket"]
-    if any(t in strong_market_types for t in types):
-        if "pharmacy" in types or "eczane" in name:
-            return False
-        return True
-    
-    # Clear market names
-    market_patterns = [
-        r"\bmarket\b", r"\bbakkal\b", r"\bsüpermarket\b", 
-        r"\bmanav\b", r"\bshop\b", r"\bgrocery\b",
-        r"\bminibakkal\b", r"\bbakkaliye\b", r"\bsupermarket\b"
-    ]
-    
-    for pattern in market_patterns:
-        if re.search(pattern, name):
-            if not any(re.search(exclude, name) for exclude in 
-                  [r"\bpharmacy\b", r"\beczane\b", r"\bkuyumcu\b"]):
-                return True
-    
-    # Scoring system
-    score = 0
-    
-    # Type-based scoring
-    type_scores = {
-        "convenience_store": 3,
-        "store": 1,
-        "food": 1
-    }
-    
-    for t in types:
-        if t in type_scores:
-            score += type_scores[t]
-    
-    # Name-based scoring
-    name_scores = {
-        "mini market": 3,
-        "süper market": 3,
-        "halk market": 3,
-        "mahalle market": 3,
-        "gıda": 2
-    }
-    
-    for term, points in name_scores.items():
-        if term in name:
-            score += points
-    
-    # Negative indicators
-    negative_name_patterns = [
-        r"\brestaurant\b", r"\bcafe\b", r"\bkahvaltı\b", r"\bkulüp\b", 
-        r"\bdernek\b", r"\bbar\b", r"\blounge\b", r"\bcoffee\b", r"\bkahve\b",r"(?i)\bsüt\b",
-        r"\bçay\b", r"\btea\b", r"\bfitness\b", r"\bspa\b", r"\bmerkez\b", r"(?i)\bçiftliği\b",
-        r"\bhotel\b", r"\botel\b", r"\bresort\b",r"(?i)\btekel\b",r"\bkasap\b",r"\bkuruyemiş\b",r"\bsalon\b"
-    ]
-
-    if any(re.search(pattern, name) for pattern in negative_name_patterns):
-        score -= 5
-    
-    negative_types = [
-        "pharmacy", "gas_station", "car_repair", "car_dealer",
-        "clothing_store", "furniture_store", "home_goods_store",
-        "electronics_store", "jewelry_store", "restaurant", "cafe", 
-        "breakfast_restaurant", "bar", "wedding_venue", "gym", "event_venue", 
-        "athletic_field", "sports_activity_location", "health", "club"
-    ]
-    
-    if any(t in negative_types for t in types):
-        score -= 5
-    if any(term in name for term in ["shell", "bp", "petrol", "opet", "aytemiz", "total", "lukoil"]):
-        score -= 4
-    if "servesBreakfast" in place or "servesBrunch" in place or "servesLunch" in place or "servesDinner" in place:
-        score -= 3
-    if "dineIn" in place and place["dineIn"] == True:
-        score -= 2
-    return score >= 2
-
-def find_markets_in_radius(lat, lng, radius_km=10):
+    return market_classifier.is_market(place)
+
+def find_markets_in_radius(lat, lng, radius_km=10, claim=None, fetch_details=True):
     """
     Finds grocery stores around the given location and filters available grocery stores in Drive.
+    `claim(place_id)` can reject markets another worker is already collecting (see batch_driver.py).
+    With fetch_details=False the Place Details calls are left to enrich_markets on the selected markets.
     """
     print(f"\nSearching for markets within {radius_km} km radius of {lat}, {lng} location...")
     existing_place_ids = set()
-    if drive_manager:
-        print("\nChecking existing markets in Google Drive...")
-        existing_place_ids = drive_manager.get_existing_market_folders()
+    if market_manifest is not None:
+        existing_place_ids = market_manifest.place_ids()
+    elif storage_backend:
+        print(f"\nChecking existing markets in {storage_backend.name} storage...")
+        existing_place_ids = storage_backend.get_existing_market_folders()
 
-    place_types = ["grocery_or_supermarket", "convenience_store", "store", "supermarket"]
-    keywords = ["market", "bakkal", "mini market", "süpermarket", "manav", "grocery", "groceries", 
-               "yerel market", "mahalle marketi",]
+    journaled_search = job_journal.get_search(lat, lng, radius_km) if job_journal else None
+    if journaled_search is not None:
+        real_markets = [market for market, stage in journaled_search if market.get("place_id") not in existing_place_ids]
+        print(f"\nThis search was already completed in an earlier run: {len(real_markets)} NEW real markets loaded from the journal.")
+    else:
+        place_types = ["grocery_or_supermarket", "convenience_store", "store", "supermarket"]
+        keywords = ["market", "bakkal", "mini market", "süpermarket", "manav", "grocery", "groceries", 
+                   "yerel market", "mahalle marketi",]
     
-    radius_meters = radius_km * 1000
-    all_places = []
-    base_url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
-    print("\nResmi yer türleri ile arama yapılıyor...")
-    for place_type in place_types:
-        params = {
-            "location": f"{lat},{lng}",
-            "radius": radius_meters,
-            "type": place_type,
-            "key": GOOGLE_API_KEY
-        }
-        response = requests.get(base_url, params=params)
-        if response.status_code == 200:
-            results = response.json()
-            if results.get("status") == "OK" and results.get("results"):
-                print(f"  '{place_type}' türünde {len(results.get('results', []))} places found.")
-                exclude_chains = True
-                
-                for place in results["results"]:
-                    place_id = place.get("place_id")
-                    name = place.get("name", "").lower()
-                    if place_id in existing_place_ids:
-                        print(f"  Skipping: {place.get('name')} (available in Drive)")
-                    else:
-                        if not (exclude_chains and any(chain in name for chain in large_chains)):
-                            if not any(p.get("place_id") == place_id for p in all_places):
-                                place_lat = place["geometry"]["location"]["lat"]
-                                place_lng = place["geometry"]["location"]["lng"]
-                                distance = haversine_distance(lat, lng, place_lat, place_lng) / 1000
-                                
-                                place_info = {
-                                    "name": place.get("name"),
-                                    "place_id": place_id,
-                                    "location": place.get("geometry", {}).get("location", {}),
-                                    "types": place.get("types", []),
-                                    "formatted_address": place.get("vicinity", ""),
-                                    "rating": place.get("rating", 0),
-                                    "user_ratings_total": place.get("user_ratings_total", 0),
-                                    "search_method": f"type:{place_type}",
-                                    "distance": distance
-                                }
-                                
-                                all_places.append(place_info)
-                
-                process_next_pages(base_url, results, params, all_places, lat, lng, exclude_chains, large_chains, existing_place_ids)
+        radius_meters = radius_km * 1000
+        candidates = CandidateStore(lat, lng, radius_meters=radius_meters,
+                                    existing_place_ids=existing_place_ids, classifier=market_classifier)
+        base_url = f"{MAPS_API_BASE_URL}/maps/api/place/nearbysearch/json"
+        log("\nResmi yer türleri ile arama yapılıyor...", PROGRESS)
+        for place_type in place_types:
+            found, tiles = tiled_nearby_search(base_url, "type", place_type, lat, lng, radius_meters, candidates)
+            if found:
+                log(f"  '{place_type}' türünde {found} places found ({tiles} tiles searched).", PROGRESS)
 
-    print("\nAnahtar kelimeler ile arama yapılıyor...")
-    for keyword in keywords:
-        params = {
-            "location": f"{lat},{lng}",
-            "radius": radius_meters,
-            "keyword": keyword,
-            "key": GOOGLE_API_KEY
-        }
-        
-        response = requests.get(base_url, params=params)
-        
-        if response.status_code == 200:
-            results = response.json()
-            
-            if results.get("status") == "OK" and results.get("results"):
-                print(f"  {len(results.get('results', []))} found for '{keyword}' search.")
-                exclude_chains = True
-                for place in results["results"]:
-                    place_id = place.get("place_id")
-                    name = place.get("name", "").lower()
-                    if place_id in existing_place_ids:
-                        print(f"  Skipping: {place.get('name')} (available in Drive)")
-                    else:
-                        if not (exclude_chains and any(chain in name for chain in large_chains)):
-                            if not any(p.get("place_id") == place_id for p in all_places):
-                                place_lat = place["geometry"]["location"]["lat"]
-                                place_lng = place["geometry"]["location"]["lng"]
-                                distance = haversine_distance(lat, lng, place_lat, place_lng) / 1000
-                                place_info = {
-                                    "name": place.get("name"),
-                                    "place_id": place_id,
-                                    "location": place.get("geometry", {}).get("location", {}),
-                                    "types": place.get("types", []),
-                                    "formatted_address": place.get("vicinity", ""),
-                                    "rating": place.get("rating", 0),
-                                    "user_ratings_total": place.get("user_ratings_total", 0),
-                                    "search_method": f"keyword:{keyword}",
-                                    "distance": distance
-                                }
-                                all_places.append(place_info)
-                process_next_pages(base_url, results, params, all_places, lat, lng, exclude_chains, large_chains, existing_place_ids)
+        log("\nAnahtar kelimeler ile arama yapılıyor...", PROGRESS)
+        for keyword in keywords:
+            found, tiles = tiled_nearby_search(base_url, "keyword", keyword, lat, lng, radius_meters, candidates)
+            if found:
+                log(f"  {found} found for '{keyword}' search ({tiles} tiles searched).", PROGRESS)
     
-    all_places.sort(key=lambda x: x["distance"])
+        all_places = candidates.sorted_by_distance()
     
-    print(f"\nA total of {len(all_places)} unique places were found.")
-    real_markets = [place for place in all_places if is_actual_market(place)]
-    print(f"After filtering {len(real_markets)} NEW real markets were found.")
-    if real_markets:
-        for i, place in enumerate(real_markets):
-            place_id = place.get("place_id")
-            print(f"  {i+1}/{len(real_markets)} - Retrieving details for {place.get('name')}...")
-            details = get_place_details(place_id) 
-            if details:
-                place["formatted_address"] = details.get("formatted_address", place.get("formatted_address", ""))
-                place["formatted_phone_number"] = details.get("formatted_phone_number", "")
-                if "opening_hours" in details:
-                    place["open_now"] = details["opening_hours"].get("open_now", False)
-                    if "weekday_text" in details["opening_hours"]:
-                        place["weekday_text"] = details["opening_hours"]["weekday_text"]
+        print(f"\nA total of {len(all_places)} unique places were found.")
+        real_markets = [place for place, is_market in zip(all_places, market_classifier.classify(all_places)) if is_market]
+        print(f"After filtering {len(real_markets)} NEW real markets were found.")
+        if job_journal:
+            job_journal.record_search(lat, lng, radius_km, real_markets)
+
+    if claim:
+        real_markets = [market for market in real_markets if claim(market.get("place_id"))]
+        print(f"{len(real_markets)} of them are not collected by another worker.")
+    
+    if real_markets and fetch_details:
+        enrich_markets(real_markets)
     
     return real_markets
 
-def process_next_pages(base_url, results, params, all_places, lat, lng, exclude_chains, large_chains, existing_place_ids):
-    """Processes the next page results from the API."""
+@timed("stage", stage="nearby_search")
+def tiled_nearby_search(base_url, query_field, query_value, lat, lng, radius_meters, candidates):
+    """
+    Runs one Nearby Search query ("type" or "keyword") over the search circle with adaptive
+    tiling: tiles that hit the 60 result cap are split into quadrants until the market
+    density is fully covered. Results are merged into the CandidateStore `candidates`.
+
+    Returns the number of results received and the number of tiles queried.
+    """
+    search_method = f"{query_field}:{query_value}"
+
+    def query_tile(tile):
+        params = {
+            "location": f"{tile.lat},{tile.lng}",
+            "radius": round(tile.radius_m),
+            query_field: query_value,
+            "key": GOOGLE_API_KEY
+        }
+        results = get_json("nearbysearch", base_url, params)
+        if not results or results.get("status") != "OK" or not results.get("results"):
+            return []
+        return results["results"] + process_next_pages(base_url, results)
+
+    found = 0
+    tiles = 0
+    for tile, places in adaptive_tile_search(lat, lng, radius_meters, query_tile):
+        tiles += 1
+        found += len(places)
+        candidates.add_page(places, search_method)
+    return found, tiles
+
+def process_next_pages(base_url, results):
+    """Follows next_page_token and returns the results of the remaining pages."""
+    page_places = []
     next_page_token = results.get("next_page_token")
     while next_page_token:
-        time.sleep(2)
         page_params = {
             "key": GOOGLE_API_KEY,
             "pagetoken": next_page_token
         }
-        page_response = requests.get(base_url, params=page_params)
-        if page_response.status_code == 200:
-            page_results = page_response.json()
-            if page_results.get("status") == "OK" and page_results.get("results"):
-                for place in page_results["results"]:
-                    place_id = place.get("place_id")
-                    name = place.get("name", "").lower()
-                    if place_id not in existing_place_ids:
-                        if not (exclude_chains and any(chain in name for chain in large_chains)):
-                            if not any(p.get("place_id") == place_id for p in all_places):
-                                place_lat = place["geometry"]["location"]["lat"]
-                                place_lng = place["geometry"]["location"]["lng"]
-                                distance = haversine_distance(lat, lng, place_lat, place_lng) / 1000
-                                search_method = "type:" + params.get("type", "") if "type" in params else "keyword:" + params.get("keyword", "")
-                                place_info = {
-                                    "name": place.get("name"),
-                                    "place_id": place_id,
-                                    "location": place.get("geometry", {}).get("location", {}),
-                                    "types": place.get("types", []),
-                                    "formatted_address": place.get("vicinity", ""),
-                                    "rating": place.get("rating", 0),
-                                    "user_ratings_total": place.get("user_ratings_total", 0),
-                                    "search_method": search_method,
-                                    "distance": distance
-                                }
-                                
-                                all_places.append(place_info)
-                
-                next_page_token = page_results.get("next_page_token")
-            else:
-                next_page_token = None
+        page_results = get_next_page(base_url, page_params)
+        if page_results and page_results.get("status") == "OK" and page_results.get("results"):
+            page_places.extend(page_results["results"])
+            next_page_token = page_results.get("next_page_token")
         else:
             next_page_token = None
+    return page_places
 
 def get_streetview_metadata(lat, lng):
     """Gets Street View metadata for the given coordinates."""
-    base_url = "https://maps.googleapis.com/maps/api/streetview/metadata"
+    known = panorama_index.lookup(lat, lng)
+    if known is not None:
+        instrumentation.count("cache_hits_total", cache="panorama_index")
+        return known
+
+    base_url = f"{MAPS_API_BASE_URL}/maps/api/streetview/metadata"
     params = {
         "location": f"{lat},{lng}",
         "key": GOOGLE_API_KEY
     }
-    response = requests.get(base_url, params=params)
-    if response.status_code == 200:
-        metadata = response.json()
-        if metadata.get("status") == "OK":
-            return metadata
+    metadata = get_json("streetview_metadata", base_url, params)
+    if metadata and metadata.get("status") == "OK":
+        panorama_index.add(lat, lng, metadata)
+        return metadata
     return None
 
 def calculate_heading_to_target(camera_lat, camera_lng, target_lat, target_lng):
     """Calculate the heading angle from the camera position to the target position."""
-    lat1 = math.radians(camera_lat)
-    lng1 = math.radians(camera_lng)
-    lat2 = math.radians(target_lat)
-    lng2 = math.radians(target_lng)
-    y = math.sin(lng2 - lng1) * math.cos(lat2)
-    x = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(lng2 - lng1)
-    bearing = math.atan2(y, x)
-    heading = (math.degrees(bearing) + 360) % 360
-    return heading
+    return float(heading_batch(camera_lat, camera_lng, target_lat, target_lng))
 
 def offset_coordinates(lat, lng, distance_meters, bearing_degrees):
     """Calculates a new point with a given distance and angle from a point."""
-    R = 6378137
-    d = distance_meters / R
-    bearing_rad = math.radians(bearing_degrees)
-    lat_rad = math.radians(lat)
-    lng_rad = math.radians(lng)
-    lat_new_rad = math.asin(
-        math.sin(lat_rad) * math.cos(d) +
-        math.cos(lat_rad) * math.sin(d) * math.cos(bearing_rad)
-    )
-    lng_new_rad = lng_rad + math.atan2(
-        math.sin(bearing_rad) * math.sin(d) * math.cos(lat_rad),
-        math.cos(d) - math.sin(lat_rad) * math.sin(lat_new_rad)
-    )
-    lat_new = math.degrees(lat_new_rad)
-    lng_new = math.degrees(lng_new_rad)
-    return lat_new, lng_new
+    lat_new, lng_new = offset_coordinates_batch(lat, lng, distance_meters, bearing_degrees)
+    return float(lat_new), float(lng_new)
 
 def haversine_distance(lat1, lng1, lat2, lng2):
     """Calculates the distance between two points in meters."""
-    R = 6371000
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    delta_phi = math.radians(lat2 - lat1)
-    delta_lambda = math.radians(lng2 - lng1)
-    a = math.sin(delta_phi / 2) * math.sin(delta_phi / 2) + \
-        math.cos(phi1) * math.cos(phi2) * \
-        math.sin(delta_lambda / 2) * math.sin(delta_lambda / 2)
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    distance = R * c
-    return distance
-
-def main():
-    global drive_manager
-    drive_manager = initialize_drive_manager()
-    if not drive_manager:
-        print("\Google Drive connection failed. Terminating the program.")
+    return float(haversine_distance_batch(lat1, lng1, lat2, lng2))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Collects Street View images of the small markets around a location.")
+    parser.add_argument("--lat", type=float, help="Latitude of the search center")
+    parser.add_argument("--lng", type=float, help="Longitude of the search center")
+    parser.add_argument("--radius_km", type=float, help="Search radius in km")
+    parser.add_argument("--max_markets", type=int, help="Number of markets to collect (default: ask)")
+    parser.add_argument("--workers", type=int, help="Number of concurrent transfers, 1 = sequential (default: ask)")
+    parser.add_argument("--lazy_details", action="store_true",
+                        help="Fetch Place Details only for the markets selected for capture")
+    parser.add_argument("--max_pano_distance_m", type=float, default=MAX_PANORAMA_DISTANCE_METERS,
+                        help="Skip markets whose nearest panorama is farther than this")
+    parser.add_argument("--min_pano_date", help="Skip markets whose panorama is older than this (YYYY-MM)")
+    parser.add_argument("--no_dedup", action="store_true", help="Upload near-duplicate images too")
+    parser.add_argument("--progressive_top_k", type=int,
+                        help="Probe thumbnails of all views and capture only the best K at full resolution "
+                             "(fewer image bytes, but 9 + K billed Street View calls per market instead of 9)")
+    parser.add_argument("--verbosity", choices=["summary", "progress", "detail"], default="detail",
+                        help="Console output: run totals only, one line per market, or everything")
+    parser.add_argument("--metrics_file", help="Write Prometheus text metrics here at the end of the run")
+    parser.add_argument("--metrics_port", type=int, help="Serve Prometheus metrics on this port during the run")
+    parser.add_argument("--report", help="Write a JSON run report with per-stage timings and counters")
+    return parser.parse_args(argv)
+
+def initialize_instrumentation(args):
+    """Console verbosity, and metrics collection when any metrics output is requested."""
+    instrumentation.set_verbosity(args.verbosity)
+    if args.metrics_file or args.metrics_port or args.report:
+        instrumentation.enable()
+    if args.metrics_port:
+        instrumentation.serve_prometheus(args.metrics_port)
+
+def export_metrics(args):
+    if instrumentation.metrics is None:
         return
-    try:
-        lat = float(input("\nLatitude: "))
-        lng = float(input("Longitude: "))
-    except ValueError:
-        print("Invalid coordinates! Using default values.")
-        lat = 41.02633949669803
-        lng = 28.876766310010403
-    try:
-        radius = float(input("Search radius (in km, default: 10): ") or "10")
-    except ValueError:
-        print("Invalid radius! Using default value (10 km).")
-        radius = 10
-    markets = find_markets_in_radius(lat, lng, radius_km=radius)
+    instrumentation.metrics.print_summary()
+    if args.metrics_file:
+        instrumentation.write_prometheus(args.metrics_file)
+        print(f"Metrics written to {args.metrics_file}")
+    if args.report:
+        instrumentation.write_report(args.report)
+        print(f"Run report written to {args.report}")
+
+def main(args=None):
+    """Interactive run; values given on the command line are not asked for again."""
+    if args is None:
+        args = parse_args([])
+    initialize_instrumentation(args)
+    initialize_storage()
+    if not storage_backend:
+        print("\nStorage connection failed. Terminating the program.")
+        return
+    initialize_manifest()
+    initialize_journal()
+    initialize_request_scheduler()
+    initialize_response_cache()
+    initialize_image_cache()
+    if args.progressive_top_k:
+        initialize_progressive_capture(args.progressive_top_k)
+    if not args.no_dedup:
+        initialize_dedup_index()
+    
+    pending_markets = job_journal.pending_markets()
+    if pending_markets:
+        print(f"\n{len(pending_markets)} markets from an interrupted run are unfinished, resuming them first...")
+        capture_markets_concurrently(pending_markets)
+    if args.lat is not None and args.lng is not None:
+        lat, lng = args.lat, args.lng
+    else:
+        try:
+            lat = float(input("\nLatitude: "))
+            lng = float(input("Longitude: "))
+        except ValueError:
+            print("Invalid coordinates! Using default values.")
+            lat = 41.02633949669803
+            lng = 28.876766310010403
+    if args.radius_km is not None:
+        radius = args.radius_km
+    else:
+        try:
+            radius = float(input("Search radius (in km, default: 10): ") or "10")
+        except ValueError:
+            print("Invalid radius! Using default value (10 km).")
+            radius = 10
+    markets = find_markets_in_radius(lat, lng, radius_km=radius, fetch_details=not args.lazy_details)
+    markets = preflight_markets(markets, max_distance_m=args.max_pano_distance_m, min_date=args.min_pano_date)
 
     if markets:
         print(f"\n{len(markets)} new markets found. Found markets")
         for i, market in enumerate(markets):
-            print(f"{i+1}. {market.get('name')} - {market.get('distance', 0):.2f} km away")
-            print(f" Address: {market.get('formatted_address', 'No address information')}")
-            print(f" Rating: {market.get('rating', 0)}/5.0 ({market.get('user_ratings_total', 0)} rating)")
-            print("")
+            log(f"{i+1}. {market.get('name')} - {market.get('distance', 0):.2f} km away", PROGRESS)
+            log(f" Address: {market.get('formatted_address') or market.get('vicinity', 'No address information')}", PROGRESS)
+            log(f" Rating: {market.get('rating', 0)}/5.0 ({market.get('user_ratings_total', 0)} rating)", PROGRESS)
+            log("", PROGRESS)
         max_places = min(10, len(markets))
-        try:
-            num_places = int(input(f"\nFor how many markets will data be collected? (1-{len(markets)}, default: {max_places}): ") or str(max_places))
-            num_places = min(len(markets), max(1, num_places))
-        except ValueError:
-            print(f"Invalid value! Using default value ({max_places}")
-            num_places = max_places
+        if args.max_markets is not None:
+            num_places = min(len(markets), max(1, args.max_markets))
+        else:
+            try:
+                num_places = int(input(f"\nFor how many markets will data be collected? (1-{len(markets)}, default: {max_places}): ") or str(max_places))
+                num_places = min(len(markets), max(1, num_places))
+            except ValueError:
+                print(f"Invalid value! Using default value ({max_places}")
+                num_places = max_places
+        
+        if args.workers is not None:
+            max_workers = max(1, args.workers)
+        else:
+            try:
+                max_workers = int(input(f"Number of concurrent transfers (1 = sequential, default: {MAX_CAPTURE_WORKERS}): ") or str(MAX_CAPTURE_WORKERS))
+                max_workers = max(1, max_workers)
+            except ValueError:
+                print(f"Invalid value! Using default value ({MAX_CAPTURE_WORKERS})")
+                max_workers = MAX_CAPTURE_WORKERS
         
         print(f"\nData for the first {num_places} market selected will be saved to Google Drive:")
         total_processed = 0
+        selected_markets = markets[:num_places]
+        if args.lazy_details:
+            enrich_markets(selected_markets)
         
-        for i, market in enumerate(markets[:num_places]):
-            name = market.get('name', 'Anonymous Market')
-            market_lat = market.get('location', {}).get('lat')
-            market_lng = market.get('location', {}).get('lng')
-            place_id = market.get('place_id')
-            if market_lat and market_lng:
-                print(f"\n{i+1}/{num_places} - {name} işleniyor...")
-                folder_id = save_market_to_drive(market)
-                if folder_id:
-                    success_count = download_and_upload_street_view_images(
-                        name, market_lat, market_lng, place_id, folder_id
-                    )
-                    if success_count > 0:
-                        total_processed += 1
-                        print(f"✓ {name} successfully processed.")
+        if max_workers > 1:
+            success_counts = capture_markets_concurrently(selected_markets, max_workers=max_workers)
+            for market, success_count in zip(selected_markets, success_counts):
+                name = market.get('name', 'Anonymous Market')
+                if success_count:
+                    total_processed += 1
+                    log(f"✓ {name} successfully processed.", PROGRESS)
+                elif success_count == 0:
+                    log(f"✗ No images found for {name}.", PROGRESS)
+        else:
+            for i, market in enumerate(selected_markets):
+                name = market.get('name', 'Anonymous Market')
+                market_lat = market.get('location', {}).get('lat')
+                market_lng = market.get('location', {}).get('lng')
+                place_id = market.get('place_id')
+                if market_lat and market_lng:
+                    log(f"\n{i+1}/{num_places} - {name} işleniyor...", PROGRESS)
+                    folder_id = save_market_to_drive(market)
+                    if folder_id:
+                        success_count = download_and_upload_street_view_images(
+                            name, market_lat, market_lng, place_id, folder_id
+                        )
+                        record_collected_market(market, folder_id, success_count, completed=False)
+                        if success_count > 0:
+                            total_processed += 1
+                            log(f"✓ {name} successfully processed.", PROGRESS)
+                        else:
+                            log(f"✗ No images found for {name}.", PROGRESS)
                     else:
-                        print(f"✗ No images found for {name}.")
+                        log(f"✗ Could not create Drive folder for {name}.", PROGRESS)
                 else:
-                    print(f"✗ Could not create Drive folder for {name}.")
-            else:
-                print(f"ERROR: No location information found for {name}.")
+                    log(f"ERROR: No location information found for {name}.", PROGRESS)
         
         print(f"\n{'='*60}")
         print(f"Process completed!")
@@ -718,6 +1389,20 @@ def main():
         print(f"\nNo new markets found within {radius} km of the specified location.")
         print("All markets may already exist in Google Drive.")
         print("Try again with a different location or a larger radius.")
+    
+    response_cache.print_stats()
+    print(f"Panorama lookups reused: {panorama_index.hits}, Street View images reused: {image_cache.hits}")
+    if image_hash_index is not None:
+        print(f"Near-duplicate images skipped: {image_hash_index.duplicates}")
+    request_scheduler.print_stats()
+    export_metrics(args)
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    try:
+        main(args)
+    except QuotaExceeded as e:
+        print(f"\n{e}")
+        print("Stopped before going over the budget. Run again after it resets to resume unfinished markets.")
+        request_scheduler.print_stats()
+        export_metrics(args)
@@ -0,0 +1,326 @@
+"""
+Packs a detection dataset into a few large tar shards with an index, for fast training I/O.
+
+    python src/dataset_packer.py packed/train --coco dataset/train/_annotations.coco.json --images dataset/train
+    python src/dataset_packer.py packed/markets --markets local_dataset/markets --annotations labels.coco.json
+    python src/dataset_packer.py packed/train --coco ... --images ... --tensor_cache 640
+
+Images are stored unchanged in <output>/shard-00000.tar, ... (up to --shard_size_mb each).
+index.json holds the categories and, for every sample, its shard, the byte offset and size of
+its JPEG inside the shard, its size and COCO annotations and (for collected market folders) the
+market's place_id and location. With --tensor_cache N every image is also decoded once, resized
+to N x N and stored in tensors_N.npy, which is memory-mapped at training time.
+
+PackedDataset reads a packed folder with random access by index.
+"""
+import io
+import os
+import json
+import tarfile
+import argparse
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from storage import place_id_from_folder_name
+
+DEFAULT_SHARD_SIZE_MB = 256
+INDEX_FILENAME = "index.json"
+TAR_BLOCK = 512
+
+
+def load_coco_images(json_path):
+    """(categories, [image info with "annotations", ...]) of a COCO annotation file, in file order."""
+    with open(json_path, "r", encoding="utf-8") as f:
+        coco = json.load(f)
+    annotations_by_image_id = defaultdict(list)
+    for annotation in coco.get("annotations", []):
+        annotations_by_image_id[annotation["image_id"]].append(annotation)
+    images = [dict(image_info, annotations=annotations_by_image_id[image_info["id"]])
+              for image_info in coco.get("images", [])]
+    return coco.get("categories", []), images
+
+
+def load_coco(json_path):
+    """(categories, {file_name: image info with "annotations"}) of a COCO annotation file."""
+    categories, images = load_coco_images(json_path)
+    return categories, {image_info["file_name"]: image_info for image_info in images}
+
+
+def coco_samples(json_path, image_dir):
+    """Samples of a COCO split (e.g. a Roboflow export), in the order of its images list."""
+    categories, images = load_coco(json_path)
+    samples = [
+        {
+            "path": os.path.join(image_dir, file_name),
+            "image_id": info["id"],
+            "width": info.get("width"),
+            "height": info.get("height"),
+            "annotations": info["annotations"],
+        }
+        for file_name, info in images.items()
+    ]
+    return categories, samples
+
+
+def market_samples(root, annotations_path=None):
+    """
+    Samples of all images in the collected {place_id}_{lat}_{lng} market folders under root.
+    Annotations from a COCO file are matched by the image path relative to root, then by
+    "{folder}/{filename}" or "{place_id}/{filename}". Every market uses the same view file names,
+    so a bare file name is only used when it occurs once in the COCO file and once under root;
+    unmatched images get no annotations.
+    """
+    categories, coco_images = load_coco_images(annotations_path) if annotations_path else ([], [])
+    file_names = [info["file_name"].replace("\\", "/") for info in coco_images]
+    annotated = dict(zip(file_names, coco_images))
+    coco_name_counts = Counter(file_names)
+
+    images = []
+    for directory, _, names in sorted(os.walk(root)):
+        folder_name = os.path.basename(directory)
+        place_id = place_id_from_folder_name(folder_name)
+        if place_id is None:
+            continue
+        images.extend((directory, folder_name, place_id, name) for name in sorted(names)
+                      if name.lower().endswith((".jpg", ".jpeg", ".png")))
+    local_name_counts = Counter(name for _, _, _, name in images)
+
+    samples = []
+    for directory, folder_name, place_id, name in images:
+        _, lat, lng = folder_name.rsplit("_", 2)
+        path = os.path.join(directory, name)
+        relative = os.path.relpath(path, root).replace(os.sep, "/")
+        info = annotated.get(relative) or annotated.get(f"{folder_name}/{name}") or annotated.get(f"{place_id}/{name}")
+        if info is None and coco_name_counts[name] == 1 and local_name_counts[name] == 1:
+            info = annotated.get(name)
+        info = info or {}
+        samples.append({
+            "path": path,
+            "image_id": info.get("id", len(samples)),
+            "width": info.get("width"),
+            "height": info.get("height"),
+            "annotations": info.get("annotations", []),
+            "market": {"place_id": place_id, "lat": float(lat), "lng": float(lng)},
+        })
+    return categories, samples
+
+
+class ShardWriter:
+    """Appends files to numbered tar shards and reports where each file's data starts."""
+
+    def __init__(self, output_dir, shard_size_mb=DEFAULT_SHARD_SIZE_MB):
+        self.output_dir = output_dir
+        self.max_shard_bytes = shard_size_mb * 1024 * 1024
+        self.shards = []
+        self._tar = None
+
+    def _open_next(self):
+        self.close()
+        name = f"shard-{len(self.shards):05d}.tar"
+        self.shards.append(name)
+        self._tar = tarfile.open(os.path.join(self.output_dir, name), "w", format=tarfile.USTAR_FORMAT)
+
+    def add(self, name, data):
+        """Writes one file; returns (shard name, data offset, size)."""
+        if self._tar is None or self._tar.offset + len(data) > self.max_shard_bytes:
+            self._open_next()
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        start = self._tar.offset
+        self._tar.addfile(info, io.BytesIO(data))
+        padded_size = -(-len(data) // TAR_BLOCK) * TAR_BLOCK
+        header_size = self._tar.offset - start - padded_size
+        return self.shards[-1], start + header_size, len(data)
+
+    def close(self):
+        if self._tar is not None:
+            self._tar.close()
+            self._tar = None
+
+
+def pack(samples, output_dir, categories=None, shard_size_mb=DEFAULT_SHARD_SIZE_MB, workers=8):
+    """
+    Copies the images of samples into tar shards and writes index.json. Images are read ahead
+    on `workers` threads; unreadable ones are skipped. Returns the index.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    writer = ShardWriter(output_dir, shard_size_mb)
+
+    def read(sample):
+        try:
+            with open(sample["path"], "rb") as f:
+                data = f.read()
+            if not sample.get("width") or not sample.get("height"):
+                sample["width"], sample["height"] = Image.open(io.BytesIO(data)).size
+            return data
+        except (OSError, ValueError):
+            return None
+
+    entries = []
+    skipped = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for sample, data in zip(samples, pool.map(read, samples)):
+            if data is None:
+                skipped += 1
+                continue
+            key = f"{len(entries):08d}"
+            extension = os.path.splitext(sample["path"])[1].lower()
+            shard, offset, size = writer.add(key + extension, data)
+            entry = {
+                "key": key,
+                "shard": shard,
+                "offset": offset,
+                "size": size,
+                "source": sample["path"],
+                "image_id": sample["image_id"],
+                "width": sample["width"],
+                "height": sample["height"],
+                "annotations": sample["annotations"],
+            }
+            if "market" in sample:
+                entry["market"] = sample["market"]
+            entries.append(entry)
+    writer.close()
+
+    index = {"categories": categories or [], "shards": writer.shards, "samples": entries}
+    with open(os.path.join(output_dir, INDEX_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False)
+    print(f"{len(entries)} images packed into {len(writer.shards)} shard(s) in {output_dir} ({skipped} unreadable skipped).")
+    return index
+
+
+def build_tensor_cache(packed_dir, image_size, workers=8):
+    """
+    Decodes every packed image once, resizes it to image_size x image_size RGB and writes all of
+    them to tensors_<image_size>.npy as one uint8 (N, H, W, 3) array. Boxes are not changed; the
+    per-image x / y scale factors are stored in the index as "tensor_scale".
+    """
+    dataset = PackedDataset(packed_dir)
+    path = os.path.join(packed_dir, f"tensors_{image_size}.npy")
+    tensors = np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8,
+                                        shape=(len(dataset), image_size, image_size, 3))
+
+    def convert(i):
+        image = dataset.image(i)
+        tensors[i] = np.asarray(image.resize((image_size, image_size), Image.BILINEAR))
+        return image_size / image.width, image_size / image.height
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        scales = list(pool.map(convert, range(len(dataset))))
+    tensors.flush()
+    del tensors
+
+    for entry, scale in zip(dataset.samples, scales):
+        entry.setdefault("tensor_scale", {})[str(image_size)] = [round(scale[0], 6), round(scale[1], 6)]
+    dataset.index.setdefault("tensor_caches", [])
+    if image_size not in dataset.index["tensor_caches"]:
+        dataset.index["tensor_caches"].append(image_size)
+    with open(os.path.join(packed_dir, INDEX_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(dataset.index, f, ensure_ascii=False)
+    dataset.close()
+    print(f"Tensor cache written: {path} ({os.path.getsize(path) / 1024 / 1024:.0f} MB)")
+    return path
+
+
+class PackedDataset:
+    """
+    Random access to a packed folder. dataset[i] returns {"image": PIL image, "image_id",
+    "annotations", "width", "height", "market"?}. With tensor_size set, "image" is instead the
+    memory-mapped uint8 (H, W, 3) array of the tensor cache and "scale" its (x, y) scale factors.
+
+    Shard files are opened lazily per process and read with positioned reads, so one instance
+    can be shared by DataLoader workers (after fork) and by threads.
+    """
+
+    def __init__(self, packed_dir, tensor_size=None):
+        self.packed_dir = packed_dir
+        with open(os.path.join(packed_dir, INDEX_FILENAME), "r", encoding="utf-8") as f:
+            self.index = json.load(f)
+        self.samples = self.index["samples"]
+        self.categories = self.index["categories"]
+        self.tensor_size = tensor_size
+        self._tensors = None
+        if tensor_size is not None:
+            self._tensors = np.load(os.path.join(packed_dir, f"tensors_{tensor_size}.npy"), mmap_mode="r")
+        self._files = {}
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.samples)
+
+    def _fd(self, shard):
+        with self._lock:
+            if self._pid != os.getpid():
+                # File descriptors inherited from a parent process share its file offsets; reopen
+                self._files = {}
+                self._pid = os.getpid()
+            fd = self._files.get(shard)
+            if fd is None:
+                fd = self._files[shard] = os.open(os.path.join(self.packed_dir, shard), os.O_RDONLY)
+            return fd
+
+    def read_bytes(self, i):
+        entry = self.samples[i]
+        return os.pread(self._fd(entry["shard"]), entry["size"], entry["offset"])
+
+    def image(self, i):
+        image = Image.open(io.BytesIO(self.read_bytes(i)))
+        image.load()
+        return image.convert("RGB")
+
+    def __getitem__(self, i):
+        entry = self.samples[i]
+        item = {
+            "image_id": entry["image_id"],
+            "annotations": entry["annotations"],
+            "width": entry["width"],
+            "height": entry["height"],
+        }
+        if "market" in entry:
+            item["market"] = entry["market"]
+        if self._tensors is not None:
+            item["image"] = self._tensors[i]
+            item["scale"] = tuple(entry["tensor_scale"][str(self.tensor_size)])
+        else:
+            item["image"] = self.image(i)
+        return item
+
+    def __iter__(self):
+        # Index order is shard order, so iterating reads every shard sequentially
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self):
+        with self._lock:
+            for fd in self._files.values():
+                os.close(fd)
+            self._files = {}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("output", help="Output folder for the shards and index.json")
+    parser.add_argument("--coco", help="COCO annotation file of a split (with --images)")
+    parser.add_argument("--images", help="Image folder of the COCO split")
+    parser.add_argument("--markets", help="Collected market folder tree (e.g. local_dataset/markets)")
+    parser.add_argument("--annotations", help="COCO annotations of the market images")
+    parser.add_argument("--shard_size_mb", type=int, default=DEFAULT_SHARD_SIZE_MB)
+    parser.add_argument("--tensor_cache", type=int, default=None, metavar="SIZE",
+                        help="Also write a memory-mappable SIZE x SIZE uint8 tensor cache")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    if args.coco:
+        categories, samples = coco_samples(args.coco, args.images or os.path.dirname(args.coco))
+    elif args.markets:
+        categories, samples = market_samples(args.markets, args.annotations)
+    else:
+        parser.error("one of --coco or --markets is required")
+    pack(samples, args.output, categories, args.shard_size_mb, args.workers)
+    if args.tensor_cache:
+        build_tensor_cache(args.output, args.tensor_cache, args.workers)
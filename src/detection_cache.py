@@ -0,0 +1,205 @@
+"""
+Persistent cache of detector outputs, keyed by image content and model version.
+
+An entry is stored under (sha256 of the image bytes, sha256 of the model weights, detector
+settings), so renamed or re-collected copies of an unchanged image are hits, and a retrained
+model or a different confidence threshold never returns stale detections. Models given by a hub
+name instead of a local path are keyed by that name. The cache is bounded by max_entries and
+evicts the least recently used entries.
+"""
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+
+from instrumentation import log, PROGRESS
+
+DEFAULT_MAX_ENTRIES = 2_000_000
+# Entries removed at once when the cache is full, so eviction does not run on every insert
+EVICTION_FRACTION = 0.05
+# last_used refreshes of cache hits are written in batches of this size
+TOUCH_BATCH_SIZE = 512
+
+# Files of a checkpoint directory that define the model; covers sharded weights
+# (model-00001-of-00003.safetensors) and their index files as well
+WEIGHT_FILE_SUFFIXES = (".safetensors", ".bin", ".pt", ".pth", ".ckpt", ".json")
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def weight_files(path):
+    """Sorted names of the weight and config files in a checkpoint directory."""
+    return sorted(name for name in os.listdir(path)
+                  if name.endswith(WEIGHT_FILE_SUFFIXES) and os.path.isfile(os.path.join(path, name)))
+
+
+def weights_signature(path):
+    """Cheap (name, mtime, size) fingerprint of a weights file or directory, used to reuse its hash."""
+    if not os.path.isdir(path):
+        stat = os.stat(path)
+        return (path, stat.st_mtime, stat.st_size)
+    files = []
+    for name in weight_files(path):
+        stat = os.stat(os.path.join(path, name))
+        files.append((name, stat.st_mtime, stat.st_size))
+    return (path, tuple(files))
+
+
+def weights_hash(path):
+    """sha256 of a weights file, or of all weight and config files of a checkpoint directory."""
+    if not os.path.isdir(path):
+        return file_sha256(path)
+    digest = hashlib.sha256()
+    for name in weight_files(path):
+        digest.update(name.encode())
+        digest.update(file_sha256(os.path.join(path, name)).encode())
+    return digest.hexdigest()
+
+
+class DetectionCache:
+    """
+    SQLite table of detections per (image_sha256, weights_hash, settings).
+
+    Registering a model under a name whose weights changed since the last run drops all entries
+    of the old weights, unless another registered name still uses them. Lookups refresh the
+    entries' last_used time, which decides eviction; the refreshes are buffered and written in
+    batches, with the next put_many or on close.
+    """
+
+    def __init__(self, db_path="detection_cache.sqlite", max_entries=DEFAULT_MAX_ENTRIES):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._weights_hashes = {}
+        self._touched = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS detections (
+                   image_sha256 TEXT NOT NULL,
+                   weights_hash TEXT NOT NULL,
+                   settings TEXT NOT NULL,
+                   detections TEXT NOT NULL,
+                   last_used REAL NOT NULL,
+                   PRIMARY KEY (image_sha256, weights_hash, settings)
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS detections_last_used ON detections (last_used)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS models (name TEXT PRIMARY KEY, weights_hash TEXT NOT NULL, updated_at REAL)"
+        )
+        self._conn.commit()
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM detections").fetchone()[0]
+        self._evict()
+        self._conn.commit()
+
+    def __len__(self):
+        return self._entries
+
+    def model_key(self, name, weights_path, settings):
+        """
+        (weights_hash, settings) identifying a model version; invalidates the entries of the
+        previous weights registered under the same name.
+        """
+        if os.path.exists(weights_path):
+            cache_key = weights_signature(weights_path)
+            digest = self._weights_hashes.get(cache_key)
+            if digest is None:
+                digest = self._weights_hashes[cache_key] = weights_hash(weights_path)
+        else:
+            # A hub model name (e.g. facebook/detr-resnet-50); its revision is not tracked
+            digest = hashlib.sha256(f"hub:{weights_path}".encode()).hexdigest()
+        with self._lock:
+            row = self._conn.execute("SELECT weights_hash FROM models WHERE name = ?", (name,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO models (name, weights_hash, updated_at) VALUES (?, ?, ?)",
+                (name, digest, time.time())
+            )
+            if row and row[0] != digest:
+                # Another name registered with the same weights still uses their entries
+                in_use = self._conn.execute("SELECT 1 FROM models WHERE weights_hash = ?", (row[0],)).fetchone()
+                if in_use is None:
+                    removed = self._conn.execute("DELETE FROM detections WHERE weights_hash = ?", (row[0],)).rowcount
+                    self._entries -= removed
+                    log(f"Weights of {name} changed, {removed} cached detections dropped.", PROGRESS)
+            self._conn.commit()
+        return digest, json.dumps(settings, sort_keys=True)
+
+    def get_many(self, image_hashes, model_key):
+        """{image_sha256: detections} for the cached ones among image_hashes."""
+        digest, settings = model_key
+        found = {}
+        with self._lock:
+            for image_hash in image_hashes:
+                row = self._conn.execute(
+                    "SELECT detections FROM detections WHERE image_sha256 = ? AND weights_hash = ? AND settings = ?",
+                    (image_hash, digest, settings)
+                ).fetchone()
+                if row:
+                    found[image_hash] = json.loads(row[0])
+            if found:
+                now = time.time()
+                for image_hash in found:
+                    self._touched[(image_hash, digest, settings)] = now
+                if len(self._touched) >= TOUCH_BATCH_SIZE:
+                    self._flush_touches()
+                    self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(image_hashes) - len(found)
+        return found
+
+    def get(self, image_hash, model_key):
+        return self.get_many([image_hash], model_key).get(image_hash)
+
+    def put_many(self, items, model_key):
+        """Stores {image_sha256: detections}, evicting the least recently used entries when full."""
+        digest, settings = model_key
+        now = time.time()
+        with self._lock:
+            self._flush_touches()
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO detections (image_sha256, weights_hash, settings, detections, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(image_hash, digest, settings, json.dumps(detections), now) for image_hash, detections in items.items()]
+            )
+            self._entries += self._conn.total_changes - before
+            self._evict()
+            self._conn.commit()
+
+    def _flush_touches(self):
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE detections SET last_used = ? WHERE image_sha256 = ? AND weights_hash = ? AND settings = ?",
+                [(now, *key) for key, now in self._touched.items()]
+            )
+            self._touched = {}
+
+    def _evict(self):
+        if self._entries > self.max_entries:
+            excess = self._entries - self.max_entries + int(self.max_entries * EVICTION_FRACTION)
+            self._entries -= self._conn.execute(
+                "DELETE FROM detections WHERE rowid IN "
+                "(SELECT rowid FROM detections ORDER BY last_used LIMIT ?)", (excess,)
+            ).rowcount
+
+    def print_stats(self):
+        total = self.hits + self.misses
+        rate = 100 * self.hits / total if total else 0.0
+        print(f"Detection cache: {self.hits}/{total} hits ({rate:.0f}%), {self._entries} entries in {self.db_path}")
+
+    def close(self):
+        with self._lock:
+            self._flush_touches()
+            self._conn.commit()
+            self._conn.close()
@@ -0,0 +1,65 @@
+import numpy as np
+
+# Mean Earth radius used for distances
+EARTH_RADIUS_METERS = 6371000
+# Equatorial radius used when moving a point (matches the original offset_coordinates)
+EQUATORIAL_RADIUS_METERS = 6378137
+
+
+def haversine_distance_batch(lat1, lng1, lat2, lng2):
+    """Vectorized great-circle distance in meters. Inputs broadcast like NumPy arrays."""
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    delta_phi = np.radians(np.subtract(lat2, lat1))
+    delta_lambda = np.radians(np.subtract(lng2, lng1))
+    a = np.sin(delta_phi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(delta_lambda / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return EARTH_RADIUS_METERS * c
+
+
+def heading_batch(camera_lat, camera_lng, target_lat, target_lng):
+    """Vectorized initial bearing (0-360 degrees) from the camera points to the target points."""
+    lat1 = np.radians(camera_lat)
+    lat2 = np.radians(target_lat)
+    delta_lng = np.radians(np.subtract(target_lng, camera_lng))
+    y = np.sin(delta_lng) * np.cos(lat2)
+    x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(delta_lng)
+    return (np.degrees(np.arctan2(y, x)) + 360) % 360
+
+
+def offset_coordinates_batch(lat, lng, distance_meters, bearing_degrees):
+    """Vectorized destination point for the given distances and bearings. Returns (lats, lngs)."""
+    d = np.divide(distance_meters, EQUATORIAL_RADIUS_METERS)
+    bearing = np.radians(bearing_degrees)
+    lat_rad = np.radians(lat)
+    lng_rad = np.radians(lng)
+    lat_new = np.arcsin(np.sin(lat_rad) * np.cos(d) + np.cos(lat_rad) * np.sin(d) * np.cos(bearing))
+    lng_new = lng_rad + np.arctan2(
+        np.sin(bearing) * np.sin(d) * np.cos(lat_rad),
+        np.cos(d) - np.sin(lat_rad) * np.sin(lat_new)
+    )
+    return np.degrees(lat_new), np.degrees(lng_new)
+
+
+def plan_view_grid(camera_lats, camera_lngs, target_lats, target_lngs, position_offsets, angle_variations):
+    """
+    Computes the camera positions and headings for every market in one call.
+
+    For N markets, P position offsets and A angle variations it returns
+    (position_lats, position_lngs, headings) with shapes (N, P), (N, P) and (N, P, A):
+    each camera is moved sideways (perpendicular to the target direction) by every offset,
+    and every moved camera looks at the target plus each angle variation.
+    """
+    camera_lats = np.asarray(camera_lats, dtype=float)[:, None]
+    camera_lngs = np.asarray(camera_lngs, dtype=float)[:, None]
+    target_lats = np.asarray(target_lats, dtype=float)[:, None]
+    target_lngs = np.asarray(target_lngs, dtype=float)[:, None]
+    offsets = np.asarray(position_offsets, dtype=float)[None, :]
+    angles = np.asarray(angle_variations, dtype=float)[None, None, :]
+
+    base_headings = heading_batch(camera_lats, camera_lngs, target_lats, target_lngs)
+    perpendicular = (base_headings + 90) % 360
+    position_lats, position_lngs = offset_coordinates_batch(camera_lats, camera_lngs, offsets, perpendicular)
+    position_headings = heading_batch(position_lats, position_lngs, target_lats, target_lngs)
+    headings = (position_headings[:, :, None] + angles) % 360
+    return position_lats, position_lngs, headings
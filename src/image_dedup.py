@@ -0,0 +1,248 @@
+"""
+Finds near-duplicate images in a dataset folder tree with perceptual hashes.
+
+    python src/image_dedup.py local_dataset/markets --max_distance 4 --report duplicates.json
+
+Every JPEG is reduced to a 64-bit pHash and inserted into a BK-tree; an image whose hash is
+within --max_distance bits of an earlier image in the same market folder is reported as its
+duplicate (--across_folders compares all folders). With --delete the duplicates are removed
+(the first image of every group is kept).
+"""
+import io
+import os
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+# pHashes of re-captured or overlapping frames differ in at most this many of the 64 bits
+DUPLICATE_MAX_DISTANCE = 4
+
+HASH_SIZE = 8
+DCT_SIZE = 32
+
+
+def _dct_matrix(size):
+    n = np.arange(size)
+    matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * size))
+    matrix[0] /= np.sqrt(2)
+    return matrix * np.sqrt(2 / size)
+
+
+_DCT = _dct_matrix(DCT_SIZE)
+
+
+def phash(source):
+    """
+    64-bit perceptual hash of a JPEG (bytes or a readable file object): the signs of the lowest
+    8 x 8 DCT frequencies of a 32 x 32 grayscale thumbnail relative to their median. JPEGs are
+    decoded at reduced scale, so hashing costs a fraction of a full decode.
+    """
+    image = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+    image.draft("L", (DCT_SIZE * 2, DCT_SIZE * 2))
+    pixels = np.asarray(image.convert("L").resize((DCT_SIZE, DCT_SIZE), Image.BILINEAR), dtype=np.float64)
+    low = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    bits = (low > np.median(low)).flatten()
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+def hamming_distance(hash1, hash2):
+    return bin(hash1 ^ hash2).count("1")
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over Hamming distance. Children are keyed by their distance to the
+    parent, so by the triangle inequality a radius-r query only descends into children whose
+    key is within r of the query's distance to the node.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value, item):
+        if self.root is None:
+            self.root = [value, [item], {}]
+            self.size += 1
+            return
+        node = self.root
+        while True:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                self.size += 1
+                return
+            node = child
+
+    def remove(self, value, item):
+        node = self.root
+        while node is not None:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                if item in node[1]:
+                    node[1].remove(item)
+                return
+            node = node[2].get(distance)
+
+    def search(self, value, max_distance):
+        """Returns [(distance, item), ...] of all items within max_distance, nearest first."""
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= max_distance:
+                found.extend((distance, item) for item in node[1])
+            for key, child in node[2].items():
+                if distance - max_distance <= key <= distance + max_distance:
+                    stack.append(child)
+        found.sort(key=lambda match: match[0])
+        return found
+
+
+class PerceptualHashIndex:
+    """
+    Persistent index of the pHashes of all captured images, keyed by (place_id, filename).
+
+    Before an image is uploaded, check_and_add looks for an indexed image of the same market
+    within max_distance bits and registers the new one in the same step, so two near-identical
+    frames handled by concurrent uploads cannot both pass. Frames of other markets never count
+    as duplicates: neighbouring markets deliberately share panorama views (see the image cache).
+
+    Each market has its own small BK-tree, loaded from SQLite the first time the market is seen,
+    so opening the index costs the same for a dataset of any size.
+    """
+
+    def __init__(self, db_path="image_hashes.sqlite", max_distance=DUPLICATE_MAX_DISTANCE):
+        self.db_path = db_path
+        self.max_distance = max_distance
+        self.duplicates = 0
+        self._trees = {}
+        self._lock = threading.Lock()
+        # Batch worker processes share the file; wait for each other's write locks like ClaimStore does
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=60)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS hashes (
+                   place_id TEXT NOT NULL,
+                   filename TEXT NOT NULL,
+                   hash TEXT NOT NULL,
+                   added_at REAL,
+                   PRIMARY KEY (place_id, filename)
+               )"""
+        )
+        self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
+
+    def _tree_of(self, place_id):
+        tree = self._trees.get(place_id)
+        if tree is None:
+            tree = self._trees[place_id] = BKTree()
+            for filename, value in self._conn.execute(
+                    "SELECT filename, hash FROM hashes WHERE place_id = ?", (place_id,)):
+                tree.add(int(value, 16), (place_id, filename))
+        return tree
+
+    def find_duplicate(self, value, place_id, filename=None):
+        """The (place_id, filename) of the nearest image of the same market within max_distance, other than itself, or None."""
+        for _, item in self._tree_of(place_id).search(value, self.max_distance):
+            if item[1] != filename:
+                return item
+        return None
+
+    def check_and_add(self, value, place_id, filename):
+        """Returns the (place_id, filename) this image duplicates, or None after adding it to the index."""
+        with self._lock:
+            duplicate = self.find_duplicate(value, place_id, filename)
+            if duplicate is not None:
+                self.duplicates += 1
+                return duplicate
+            self._tree_of(place_id).add(value, (place_id, filename))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO hashes (place_id, filename, hash, added_at) VALUES (?, ?, ?, ?)",
+                (place_id, filename, f"{value:016x}", time.time())
+            )
+            self._conn.commit()
+        return None
+
+    def discard(self, value, place_id, filename):
+        """Removes an image whose upload failed, so its retry is not mistaken for a duplicate."""
+        with self._lock:
+            self._tree_of(place_id).remove(value, (place_id, filename))
+            self._conn.execute("DELETE FROM hashes WHERE place_id = ? AND filename = ?", (place_id, filename))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def find_duplicates(root, max_distance=DUPLICATE_MAX_DISTANCE, workers=8, across_folders=False):
+    """
+    Hashes every .jpg under root and returns {duplicate_path: (original_path, distance)}.
+    Images are visited in sorted path order, so the first image of a group is the original.
+    Only images in the same folder (market) are compared unless across_folders is set.
+    """
+    paths = sorted(
+        os.path.join(directory, name)
+        for directory, _, names in os.walk(root)
+        for name in names if name.lower().endswith((".jpg", ".jpeg"))
+    )
+
+    def hash_file(path):
+        try:
+            with open(path, "rb") as f:
+                return phash(f)
+        except (OSError, ValueError):
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        hashes = list(pool.map(hash_file, paths))
+
+    trees = {}
+    duplicates = {}
+    for path, value in zip(paths, hashes):
+        if value is None:
+            continue
+        tree = trees.setdefault("" if across_folders else os.path.dirname(path), BKTree())
+        matches = tree.search(value, max_distance)
+        if matches:
+            duplicates[path] = (matches[0][1], matches[0][0])
+        else:
+            tree.add(value, path)
+    print(f"{len(paths)} images hashed, {len(duplicates)} near duplicates (max distance {max_distance} bits).")
+    return duplicates
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root", help="Dataset folder tree to scan")
+    parser.add_argument("--max_distance", type=int, default=DUPLICATE_MAX_DISTANCE)
+    parser.add_argument("--report", default="duplicates.json", help="JSON report of duplicate -> original")
+    parser.add_argument("--delete", action="store_true", help="Delete the duplicates, keeping the originals")
+    parser.add_argument("--across_folders", action="store_true",
+                        help="Also compare images of different market folders (shared panorama views are then duplicates)")
+    args = parser.parse_args()
+
+    duplicates = find_duplicates(args.root, args.max_distance, across_folders=args.across_folders)
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump({path: {"original": original, "distance": distance}
+                   for path, (original, distance) in duplicates.items()}, f, indent=2)
+    print(f"Report written to {args.report}")
+    if args.delete:
+        for path in duplicates:
+            os.remove(path)
+        print(f"{len(duplicates)} duplicates deleted.")
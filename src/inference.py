@@ -0,0 +1,342 @@
+"""
+Batched CPU inference of the trained detectors over collected Street View images.
+
+    python src/inference.py local_dataset/markets --model runs/yolov12_train/weights/best.pt
+    python src/inference.py local_dataset/markets --model detr-market-finetuned-best --batch_size 4 --threads 8
+
+The detector is loaded once. Images are decoded on background threads a few batches ahead of
+the model, batched and run together, and every image gets one JSON line in the output:
+    {"image": "...", "model": "...", "detections": [{"label", "class_id", "score", "box": [x1, y1, x2, y2]}]}
+
+Detections are cached in detection_cache.sqlite by image content and model version, so a re-run
+over a dataset only runs the model on images it has not seen with the same weights and settings.
+"""
+import io
+import os
+import json
+import time
+import hashlib
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from detection_cache import DetectionCache
+
+DEFAULT_BATCH_SIZE = 8
+DEFAULT_IMAGE_SIZE = 640
+DEFAULT_CONFIDENCE = 0.25
+DEFAULT_DECODE_WORKERS = 2
+# Number of batches decoded ahead of the model
+DEFAULT_PREFETCH_BATCHES = 2
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def list_images(root):
+    """All images under a folder tree (or the single given file), in sorted order."""
+    if os.path.isfile(root):
+        return [root]
+    return sorted(
+        os.path.join(directory, name)
+        for directory, _, names in os.walk(root)
+        for name in names if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+def decode_image(path):
+    image = Image.open(path)
+    image.load()
+    return image.convert("RGB")
+
+
+def set_threads(num_threads):
+    """Number of CPU threads torch uses inside one forward pass."""
+    import torch
+    torch.set_num_threads(num_threads)
+
+
+class ImagePrefetcher:
+    """
+    Decodes images on `decode_workers` threads, at most prefetch_batches * batch_size images
+    ahead of the consumer, and yields them as (paths, images, errors) batches in input order.
+    Images that cannot be decoded are reported in `errors` as {path: message}.
+    """
+
+    def __init__(self, paths, batch_size=DEFAULT_BATCH_SIZE, decode_workers=DEFAULT_DECODE_WORKERS,
+                 prefetch_batches=DEFAULT_PREFETCH_BATCHES, decode=decode_image):
+        self.paths = paths
+        self.batch_size = batch_size
+        self.decode_workers = decode_workers
+        self.max_pending = batch_size * max(1, prefetch_batches)
+        self.decode = decode
+
+    def _decode(self, path):
+        try:
+            return self.decode(path), None
+        except (OSError, ValueError) as error:
+            return None, str(error)
+
+    def __iter__(self):
+        with ThreadPoolExecutor(max_workers=max(1, self.decode_workers)) as pool:
+            pending = deque()
+            paths = iter(self.paths)
+            exhausted = False
+            batch_paths, batch_images, errors = [], [], {}
+            while True:
+                while not exhausted and len(pending) < self.max_pending:
+                    path = next(paths, None)
+                    if path is None:
+                        exhausted = True
+                    else:
+                        pending.append((path, pool.submit(self._decode, path)))
+                if not pending:
+                    break
+                path, future = pending.popleft()
+                image, error = future.result()
+                if image is None:
+                    errors[path] = error
+                else:
+                    batch_paths.append(path)
+                    batch_images.append(image)
+                if len(batch_paths) == self.batch_size:
+                    yield batch_paths, batch_images, errors
+                    batch_paths, batch_images, errors = [], [], {}
+            if batch_paths or errors:
+                yield batch_paths, batch_images, errors
+
+
+class Detector:
+    """A detector that takes a list of RGB PIL images and returns one list of detections per image."""
+
+    name = "detector"
+    # Weights file / checkpoint directory and the settings that change the output; both identify
+    # the model version in the detection cache
+    weights_path = None
+    settings = {}
+
+    def predict_batch(self, images):
+        raise NotImplementedError
+
+
+class YoloDetector(Detector):
+    """Ultralytics YOLO (v8-v12) or RT-DETR weights (best.pt)."""
+
+    def __init__(self, weights, image_size=DEFAULT_IMAGE_SIZE, confidence=DEFAULT_CONFIDENCE,
+                 device="cpu", rtdetr=False):
+        try:
+            from ultralytics import YOLO, RTDETR
+        except ImportError:
+            raise ImportError("YOLO / RT-DETR inference requires ultralytics (pip install ultralytics).")
+        self.model = (RTDETR if rtdetr else YOLO)(weights)
+        self.name = os.path.basename(os.path.dirname(os.path.dirname(os.path.abspath(weights)))) or weights
+        self.labels = self.model.names
+        self.image_size = image_size
+        self.confidence = confidence
+        self.device = device
+        self.weights_path = weights
+        self.settings = {"type": "rtdetr" if rtdetr else "yolo", "imgsz": image_size, "conf": confidence}
+
+    def predict_batch(self, images):
+        results = self.model.predict(images, imgsz=self.image_size, conf=self.confidence,
+                                     device=self.device, verbose=False)
+        batch = []
+        for result in results:
+            boxes = result.boxes
+            detections = []
+            for box, score, class_id in zip(boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy(),
+                                            boxes.cls.cpu().numpy().astype(int)):
+                detections.append({
+                    "label": self.labels[int(class_id)],
+                    "class_id": int(class_id),
+                    "score": round(float(score), 4),
+                    "box": [round(float(coord), 1) for coord in box],
+                })
+            batch.append(detections)
+        return batch
+
+
+class DetrDetector(Detector):
+    """A fine-tuned Hugging Face DETR checkpoint directory (model + processor, as saved by the notebook)."""
+
+    def __init__(self, model_path, confidence=DEFAULT_CONFIDENCE, device="cpu"):
+        try:
+            import torch
+            from transformers import DetrImageProcessor, DetrForObjectDetection
+        except ImportError:
+            raise ImportError("DETR inference requires torch and transformers.")
+        self.torch = torch
+        self.processor = DetrImageProcessor.from_pretrained(model_path)
+        self.model = DetrForObjectDetection.from_pretrained(model_path).to(device).eval()
+        self.name = os.path.basename(os.path.normpath(model_path))
+        self.labels = self.model.config.id2label
+        self.confidence = confidence
+        self.device = device
+        self.weights_path = model_path
+        self.settings = {"type": "detr", "conf": confidence}
+
+    def predict_batch(self, images):
+        # The processor pads the batch to a common size and returns the matching pixel_mask
+        inputs = self.processor(images=images, return_tensors="pt").to(self.device)
+        with self.torch.inference_mode():
+            outputs = self.model(**inputs)
+        target_sizes = self.torch.tensor([image.size[::-1] for image in images])
+        results = self.processor.post_process_object_detection(
+            outputs, target_sizes=target_sizes, threshold=self.confidence
+        )
+        batch = []
+        for result in results:
+            detections = []
+            for score, label, box in zip(result["scores"], result["labels"], result["boxes"]):
+                detections.append({
+                    "label": self.labels[label.item()],
+                    "class_id": label.item(),
+                    "score": round(score.item(), 4),
+                    "box": [round(coord, 1) for coord in box.tolist()],
+                })
+            batch.append(detections)
+        return batch
+
+
+def load_detector(model_path, model_type=None, image_size=DEFAULT_IMAGE_SIZE, confidence=DEFAULT_CONFIDENCE,
+                  device="cpu"):
+    """
+    Loads a detector once. model_type is "yolo", "rtdetr" or "detr"; without it a directory
+    is taken for a DETR checkpoint and a .pt file with "rtdetr" in its path for RT-DETR.
+    """
+    if model_type is None:
+        if os.path.isdir(model_path):
+            model_type = "detr"
+        elif "rtdetr" in model_path.lower().replace("-", ""):
+            model_type = "rtdetr"
+        else:
+            model_type = "yolo"
+    if model_type == "detr":
+        return DetrDetector(model_path, confidence=confidence, device=device)
+    if model_type in ("yolo", "rtdetr"):
+        return YoloDetector(model_path, image_size=image_size, confidence=confidence,
+                            device=device, rtdetr=model_type == "rtdetr")
+    raise ValueError(f"Unknown model type: {model_type}")
+
+
+class InferenceEngine:
+    """
+    Runs a loaded detector over many images in prefetched batches.
+
+    With a DetectionCache, every image is hashed on the decode threads first and only decoded
+    and run through the model when the cache has no detections for it from the same model version.
+    """
+
+    def __init__(self, detector, batch_size=DEFAULT_BATCH_SIZE, decode_workers=DEFAULT_DECODE_WORKERS,
+                 prefetch_batches=DEFAULT_PREFETCH_BATCHES, cache=None):
+        self.detector = detector
+        self.batch_size = batch_size
+        self.decode_workers = decode_workers
+        self.prefetch_batches = prefetch_batches
+        self.cache = cache
+        self.model_key = None
+        if cache is not None and detector.weights_path:
+            self.model_key = cache.model_key(detector.name, detector.weights_path, detector.settings)
+
+    def _load(self, path):
+        """(image sha256, cached detections or None, decoded image or None)"""
+        with open(path, "rb") as f:
+            data = f.read()
+        image_hash = hashlib.sha256(data).hexdigest()
+        cached = self.cache.get(image_hash, self.model_key)
+        if cached is not None:
+            return image_hash, cached, None
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        return image_hash, None, image.convert("RGB")
+
+    def iter_detections(self, paths):
+        """Yields (path, detections, error) for every image, in input order within each batch."""
+        if self.model_key is None:
+            prefetcher = ImagePrefetcher(paths, self.batch_size, self.decode_workers, self.prefetch_batches)
+            for batch_paths, batch_images, errors in prefetcher:
+                for path, error in errors.items():
+                    yield path, None, error
+                if batch_images:
+                    for path, detections in zip(batch_paths, self.detector.predict_batch(batch_images)):
+                        yield path, detections, None
+            return
+
+        prefetcher = ImagePrefetcher(paths, self.batch_size, self.decode_workers, self.prefetch_batches,
+                                     decode=self._load)
+        for batch_paths, batch_items, errors in prefetcher:
+            for path, error in errors.items():
+                yield path, None, error
+            misses = [(path, image_hash, image) for path, (image_hash, cached, image) in zip(batch_paths, batch_items)
+                      if cached is None]
+            results = {}
+            if misses:
+                predictions = self.detector.predict_batch([image for _, _, image in misses])
+                results = {image_hash: detections for (_, image_hash, _), detections in zip(misses, predictions)}
+                self.cache.put_many(results, self.model_key)
+            for path, (image_hash, cached, _) in zip(batch_paths, batch_items):
+                yield path, cached if cached is not None else results[image_hash], None
+
+    def run(self, paths, output_path=None):
+        """Writes one JSON line per image to output_path (if given). Returns throughput stats."""
+        started_at = time.perf_counter()
+        images = errors = detections_total = 0
+        output = open(output_path, "w", encoding="utf-8") if output_path else None
+        try:
+            for path, detections, error in self.iter_detections(paths):
+                record = {"image": path, "model": self.detector.name}
+                if error is None:
+                    images += 1
+                    detections_total += len(detections)
+                    record["detections"] = detections
+                else:
+                    errors += 1
+                    record["error"] = error
+                if output:
+                    output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        finally:
+            if output:
+                output.close()
+        seconds = time.perf_counter() - started_at
+        return {
+            "images": images,
+            "errors": errors,
+            "detections": detections_total,
+            "seconds": round(seconds, 2),
+            "images_per_sec": round(images / seconds, 2) if seconds else 0.0,
+        }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", help="Image file or folder tree (e.g. a collected dataset)")
+    parser.add_argument("--model", required=True, help="YOLO / RT-DETR .pt weights or a DETR checkpoint directory")
+    parser.add_argument("--type", choices=["yolo", "rtdetr", "detr"], default=None)
+    parser.add_argument("--batch_size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--threads", type=int, default=os.cpu_count(), help="torch CPU threads")
+    parser.add_argument("--decode_workers", type=int, default=DEFAULT_DECODE_WORKERS)
+    parser.add_argument("--prefetch_batches", type=int, default=DEFAULT_PREFETCH_BATCHES)
+    parser.add_argument("--imgsz", type=int, default=DEFAULT_IMAGE_SIZE)
+    parser.add_argument("--confidence", type=float, default=DEFAULT_CONFIDENCE)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--output", default="detections.jsonl")
+    parser.add_argument("--cache", default="detection_cache.sqlite", help="Detection cache database")
+    parser.add_argument("--no_cache", action="store_true", help="Run the model on every image")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    set_threads(args.threads)
+    paths = list_images(args.images)
+    print(f"{len(paths)} images found in {args.images}")
+    detector = load_detector(args.model, args.type, image_size=args.imgsz, confidence=args.confidence, device=args.device)
+    cache = None if args.no_cache else DetectionCache(args.cache)
+    engine = InferenceEngine(detector, args.batch_size, args.decode_workers, args.prefetch_batches, cache)
+    stats = engine.run(paths, args.output)
+    if cache is not None:
+        cache.print_stats()
+        cache.close()
+    print(f"{stats['images']} images ({stats['errors']} unreadable), {stats['detections']} detections "
+          f"in {stats['seconds']} s: {stats['images_per_sec']} images/sec. Written to {args.output}")
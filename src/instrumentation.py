@@ -0,0 +1,268 @@
+"""
+Run metrics of the collection pipeline: timing spans, counters and latency histograms.
+
+Metrics are off until enable() is called; until then span() returns a shared no-op context and
+count() / observe() return at once, so the instrumented code pays one global lookup per call.
+An enabled run can be exported as a Prometheus text file (node-exporter textfile format), served
+on an HTTP /metrics endpoint and summarized in a JSON run report.
+
+Console output goes through log(message, level): at verbosity SUMMARY only run totals are
+printed, PROGRESS adds one line per market / stage and DETAIL (the default) prints everything.
+"""
+import json
+import time
+import bisect
+import functools
+import threading
+import contextlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SUMMARY = 1
+PROGRESS = 2
+DETAIL = 3
+VERBOSITY_LEVELS = {"summary": SUMMARY, "progress": PROGRESS, "detail": DETAIL}
+
+METRIC_PREFIX = "market_collector_"
+# Upper bounds in seconds, from cache hits to slow uploads
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+verbosity = DETAIL
+metrics = None
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+def set_verbosity(level):
+    """level is SUMMARY, PROGRESS, DETAIL or their names."""
+    global verbosity
+    verbosity = VERBOSITY_LEVELS[level] if isinstance(level, str) else level
+
+
+def log(message, level=DETAIL):
+    if level <= verbosity:
+        print(message)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (max for the overflow bucket)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class Span:
+    """Times a block into the <name>_seconds histogram and counts <name>_errors_total on exceptions."""
+
+    __slots__ = ("registry", "name", "labels", "started_at")
+
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.registry.observe(f"{self.name}_seconds", time.perf_counter() - self.started_at, self.labels)
+        if exc_type is not None:
+            self.registry.count(f"{self.name}_errors_total", 1, self.labels)
+        return False
+
+
+class Metrics:
+    """Thread-safe counters and histograms keyed by (name, sorted labels)."""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items())) if labels else ()
+
+    def count(self, name, value=1, labels=None):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=None):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def span(self, name, labels=None):
+        return Span(self, name, labels)
+
+    def to_prometheus(self):
+        """The metrics in the Prometheus text exposition format."""
+        def escape(value):
+            # Exposition format: backslash, double quote and line feed are escaped in label values
+            return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        def label_text(labels, extra=()):
+            pairs = [f'{key}="{escape(value)}"' for key, value in tuple(labels) + tuple(extra)]
+            return "{" + ",".join(pairs) + "}" if pairs else ""
+
+        lines = []
+        with self._lock:
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {METRIC_PREFIX}{name} counter")
+                    typed.add(name)
+                lines.append(f"{METRIC_PREFIX}{name}{label_text(labels)} {value}")
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {METRIC_PREFIX}{name} histogram")
+                    typed.add(name)
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.buckets, histogram.counts):
+                    cumulative += bucket_count
+                    lines.append(f"{METRIC_PREFIX}{name}_bucket{label_text(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{METRIC_PREFIX}{name}_bucket{label_text(labels, [('le', '+Inf')])} {histogram.count}")
+                lines.append(f"{METRIC_PREFIX}{name}_sum{label_text(labels)} {histogram.sum:.6f}")
+                lines.append(f"{METRIC_PREFIX}{name}_count{label_text(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def report(self):
+        """JSON-serializable run report with totals, means and approximate p50 / p95 per histogram."""
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self.counters.items())
+            ]
+            histograms = [
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": histogram.count,
+                    "total_s": round(histogram.sum, 3),
+                    "mean_s": round(histogram.sum / histogram.count, 4) if histogram.count else 0.0,
+                    "p50_s": histogram.quantile(0.5),
+                    "p95_s": histogram.quantile(0.95),
+                    "max_s": round(histogram.max, 4),
+                }
+                for (name, labels), histogram in sorted(self.histograms.items())
+            ]
+        return {
+            "started_at": self.started_at,
+            "duration_s": round(time.time() - self.started_at, 2),
+            "counters": counters,
+            "histograms": histograms,
+        }
+
+    def print_summary(self):
+        """Time spent per stage and external call, slowest first."""
+        rows = sorted(self.report()["histograms"], key=lambda row: -row["total_s"])
+        if not rows:
+            return
+        print("\nTime per stage / call:")
+        for row in rows:
+            labels = ",".join(f"{key}={value}" for key, value in row["labels"].items())
+            name = f"{row['name']}{{{labels}}}" if labels else row["name"]
+            print(f"  {name:<48} {row['count']:>7} x  total {row['total_s']:>8.1f} s  "
+                  f"mean {row['mean_s'] * 1000:>7.1f} ms  p95 {row['p95_s'] * 1000:>7.0f} ms")
+
+
+def enable():
+    """Starts collecting metrics (a fresh registry) and returns it."""
+    global metrics
+    metrics = Metrics()
+    return metrics
+
+
+def disable():
+    global metrics
+    metrics = None
+
+
+def count(name, value=1, **labels):
+    if metrics is not None:
+        metrics.count(name, value, labels)
+
+
+def observe(name, value, **labels):
+    if metrics is not None:
+        metrics.observe(name, value, labels)
+
+
+def span(name, **labels):
+    """with span("streetview_download"): ... records streetview_download_seconds while enabled."""
+    if metrics is None:
+        return _NULL_SPAN
+    return metrics.span(name, labels)
+
+
+def timed(name, **labels):
+    """Decorator form of span(): every call of the function is timed while metrics are enabled."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if metrics is None:
+                return function(*args, **kwargs)
+            with metrics.span(name, labels):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def write_prometheus(path):
+    if metrics is not None:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(metrics.to_prometheus())
+
+
+def write_report(path):
+    if metrics is not None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(metrics.report(), f, indent=2, ensure_ascii=False)
+
+
+def serve_prometheus(port, host="0.0.0.0"):
+    """Serves the current metrics on http://host:port/metrics from a daemon thread."""
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = (metrics.to_prometheus() if metrics is not None else "").encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Metrics served on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,196 @@
+import json
+import time
+import sqlite3
+import threading
+
+# Stages a market goes through, in order
+STAGE_DISCOVERED = "discovered"
+STAGE_DETAILS_FETCHED = "details_fetched"
+STAGE_FOLDER_CREATED = "folder_created"
+STAGE_DETAILS_SAVED = "details_saved"
+STAGE_COMPLETED = "completed"
+
+STAGES = [STAGE_DISCOVERED, STAGE_DETAILS_FETCHED, STAGE_FOLDER_CREATED, STAGE_DETAILS_SAVED, STAGE_COMPLETED]
+
+# A finished search is replayed from the journal instead of being repeated for this long;
+# after that the area counts as a new survey
+SEARCH_RESUME_MAX_AGE = 24 * 3600
+
+
+class JobJournal:
+    """
+    Durable record of how far every market got in the collection pipeline.
+
+    Each stage (discovered, details fetched, folder created, details JSON saved, every
+    uploaded image, completed) is committed to SQLite as soon as it happens. After a crash
+    the next run reads the unfinished markets back and continues each one from its last
+    recorded step: the folder is reused, the JSON is not saved twice and already uploaded
+    images are not fetched again.
+    """
+
+    def __init__(self, db_path="collection_journal.sqlite"):
+        self.db_path = db_path
+        self.run_id = time.strftime("%Y%m%d-%H%M%S")
+        self._lock = threading.Lock()
+        # Batch worker processes share the file; wait for each other's write locks like ClaimStore does
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=60)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS markets (
+                   place_id TEXT PRIMARY KEY,
+                   market_json TEXT NOT NULL,
+                   stage TEXT NOT NULL,
+                   folder_id TEXT,
+                   image_count INTEGER,
+                   run_id TEXT,
+                   updated_at REAL
+               )"""
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS images (
+                   place_id TEXT NOT NULL,
+                   filename TEXT NOT NULL,
+                   file_id TEXT,
+                   uploaded_at REAL,
+                   PRIMARY KEY (place_id, filename)
+               )"""
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS searches (
+                   search_key TEXT PRIMARY KEY,
+                   place_ids TEXT NOT NULL,
+                   completed_at REAL
+               )"""
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def search_key(lat, lng, radius_km):
+        return f"{float(lat):.6f},{float(lng):.6f},{float(radius_km):g}"
+
+    def record_search(self, lat, lng, radius_km, markets):
+        """Stores the filtered result of a finished search together with its markets."""
+        with self._lock:
+            for market in markets:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO markets (place_id, market_json, stage, run_id, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    (market.get("place_id"), json.dumps(market, ensure_ascii=False), STAGE_DISCOVERED, self.run_id, time.time())
+                )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO searches (search_key, place_ids, completed_at) VALUES (?, ?, ?)",
+                (self.search_key(lat, lng, radius_km), json.dumps([m.get("place_id") for m in markets]), time.time())
+            )
+            self._conn.commit()
+
+    def get_search(self, lat, lng, radius_km, max_age=SEARCH_RESUME_MAX_AGE):
+        """
+        Returns [(market, stage), ...] of an identical search finished less than max_age seconds
+        ago (in the original order), or None.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT place_ids, completed_at FROM searches WHERE search_key = ?", (self.search_key(lat, lng, radius_km),)
+            ).fetchone()
+            if row is None or time.time() - row[1] > max_age:
+                return None
+            markets = []
+            for place_id in json.loads(row[0]):
+                entry = self._conn.execute(
+                    "SELECT market_json, stage FROM markets WHERE place_id = ?", (place_id,)
+                ).fetchone()
+                if entry:
+                    markets.append((json.loads(entry[0]), entry[1]))
+        return markets
+
+    def _stage_index(self, stage):
+        return STAGES.index(stage)
+
+    def _advance(self, place_id, stage, **columns):
+        """Moves a market to `stage` (never backwards) and updates the given columns."""
+        row = self._conn.execute("SELECT stage FROM markets WHERE place_id = ?", (place_id,)).fetchone()
+        if row is None:
+            return
+        if self._stage_index(stage) > self._stage_index(row[0]):
+            columns["stage"] = stage
+        columns["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in columns)
+        self._conn.execute(f"UPDATE markets SET {assignments} WHERE place_id = ?", (*columns.values(), place_id))
+        self._conn.commit()
+
+    def record_details(self, market):
+        with self._lock:
+            self._advance(market.get("place_id"), STAGE_DETAILS_FETCHED,
+                          market_json=json.dumps(market, ensure_ascii=False))
+
+    def record_folder(self, place_id, folder_id):
+        with self._lock:
+            self._advance(place_id, STAGE_FOLDER_CREATED, folder_id=folder_id)
+
+    def record_details_saved(self, place_id):
+        with self._lock:
+            self._advance(place_id, STAGE_DETAILS_SAVED)
+
+    def record_image(self, place_id, filename, file_id):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO images (place_id, filename, file_id, uploaded_at) VALUES (?, ?, ?, ?)",
+                (place_id, filename, str(file_id), time.time())
+            )
+            self._conn.commit()
+
+    def record_completed(self, place_id, image_count):
+        with self._lock:
+            self._advance(place_id, STAGE_COMPLETED, image_count=image_count)
+
+    def get(self, place_id):
+        """Returns {"market", "stage", "folder_id", "image_count"} for a journaled market, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT market_json, stage, folder_id, image_count FROM markets WHERE place_id = ?", (place_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"market": json.loads(row[0]), "stage": row[1], "folder_id": row[2], "image_count": row[3]}
+
+    def stage_of(self, place_id):
+        entry = self.get(place_id)
+        return entry["stage"] if entry else None
+
+    def has_reached(self, place_id, stage):
+        current = self.stage_of(place_id)
+        return current is not None and self._stage_index(current) >= self._stage_index(stage)
+
+    def folder_id_of(self, place_id):
+        entry = self.get(place_id)
+        return entry["folder_id"] if entry else None
+
+    def uploaded_images(self, place_id):
+        """Filenames of the images of a market that are already stored."""
+        with self._lock:
+            # Older journals also recorded skipped duplicates, as "duplicate:..." file IDs
+            rows = self._conn.execute(
+                "SELECT filename FROM images WHERE place_id = ? AND file_id NOT LIKE 'duplicate:%'", (place_id,)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def unfinished_place_ids(self):
+        """place_ids whose folder was created but whose capture never completed."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT place_id FROM markets WHERE stage IN (?, ?)", (STAGE_FOLDER_CREATED, STAGE_DETAILS_SAVED)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def pending_markets(self):
+        """Markets that were selected for capture (folder created) but not completed, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT market_json FROM markets WHERE stage IN (?, ?) ORDER BY updated_at",
+                (STAGE_FOLDER_CREATED, STAGE_DETAILS_SAVED)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,111 @@
+import re
+
+STRONG_MARKET_TYPES = {"grocery_or_supermarket", "supermarket"}
+
+MARKET_NAME_WORDS = [
+    "market", "bakkal", "süpermarket", "manav", "shop", "grocery",
+    "minibakkal", "bakkaliye", "supermarket"
+]
+
+EXCLUDED_NAME_WORDS = ["pharmacy", "eczane", "kuyumcu"]
+
+TYPE_SCORES = {
+    "convenience_store": 3,
+    "store": 1,
+    "food": 1
+}
+
+NAME_SCORES = {
+    "mini market": 3,
+    "süper market": 3,
+    "halk market": 3,
+    "mahalle market": 3,
+    "gıda": 2
+}
+
+NEGATIVE_NAME_WORDS = [
+    "restaurant", "cafe", "kahvaltı", "kulüp", "dernek", "bar", "lounge", "coffee", "kahve",
+    "çay", "tea", "fitness", "spa", "merkez", "hotel", "otel", "resort", "kasap", "kuruyemiş", "salon"
+]
+# These words were always matched case-insensitively
+NEGATIVE_NAME_WORDS_IGNORECASE = ["süt", "çiftliği", "tekel"]
+
+NEGATIVE_TYPES = {
+    "pharmacy", "gas_station", "car_repair", "car_dealer",
+    "clothing_store", "furniture_store", "home_goods_store",
+    "electronics_store", "jewelry_store", "restaurant", "cafe",
+    "breakfast_restaurant", "bar", "wedding_venue", "gym", "event_venue",
+    "athletic_field", "sports_activity_location", "health", "club"
+}
+
+FUEL_STATION_TERMS = ["shell", "bp", "petrol", "opet", "aytemiz", "total", "lukoil"]
+
+MEAL_SERVICE_FIELDS = ("servesBreakfast", "servesBrunch", "servesLunch", "servesDinner")
+
+
+def _word_regex(words, flags=0):
+    """One alternation regex that matches any of the words as a whole word."""
+    return re.compile(r"\b(?:" + "|".join(re.escape(word) for word in words) + r")\b", flags)
+
+
+def _substring_regex(terms):
+    """One alternation regex that matches any of the terms anywhere in the text."""
+    return re.compile("|".join(re.escape(term) for term in terms))
+
+
+class MarketClassifier:
+    """
+    Precompiled version of the market / chain filters.
+
+    Every word list is compiled once into a single alternation regex, so classifying a
+    place costs a handful of regex scans over its name instead of dozens of re.search calls,
+    and type checks are set lookups.
+    """
+
+    def __init__(self, large_chains):
+        self.large_chains = list(large_chains)
+        self._chain_regex = _substring_regex(self.large_chains) if self.large_chains else None
+        self._market_regex = _word_regex(MARKET_NAME_WORDS)
+        self._excluded_regex = _word_regex(EXCLUDED_NAME_WORDS)
+        self._negative_regex = _word_regex(NEGATIVE_NAME_WORDS)
+        self._negative_ignorecase_regex = _word_regex(NEGATIVE_NAME_WORDS_IGNORECASE, re.IGNORECASE)
+        self._fuel_regex = _substring_regex(FUEL_STATION_TERMS)
+
+    def is_large_chain(self, name):
+        """True if the (lower-case) name contains one of the large chain names."""
+        return self._chain_regex is not None and self._chain_regex.search(name) is not None
+
+    def is_market(self, place):
+        """Determines whether a place is truly a market."""
+        name = place.get("name", "").lower()
+        types = [t.lower() for t in place.get("types", [])]
+        type_set = set(types)
+
+        # Strong positive indicators
+        if not type_set.isdisjoint(STRONG_MARKET_TYPES):
+            return not ("pharmacy" in type_set or "eczane" in name)
+
+        # Clear market names
+        if self._market_regex.search(name) and not self._excluded_regex.search(name):
+            return True
+
+        # Scoring system
+        score = sum(TYPE_SCORES.get(t, 0) for t in types)
+        score += sum(points for term, points in NAME_SCORES.items() if term in name)
+
+        # Negative indicators
+        if self._negative_regex.search(name) or self._negative_ignorecase_regex.search(name):
+            score -= 5
+        if not type_set.isdisjoint(NEGATIVE_TYPES):
+            score -= 5
+        if self._fuel_regex.search(name):
+            score -= 4
+        if any(field in place for field in MEAL_SERVICE_FIELDS):
+            score -= 3
+        if place.get("dineIn") == True:
+            score -= 2
+        return score >= 2
+
+    def classify(self, places):
+        """Batch version of is_market. Returns one decision per place, in order."""
+        return [self.is_market(place) for place in places]
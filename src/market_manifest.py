@@ -0,0 +1,170 @@
+import sys
+import time
+import sqlite3
+import threading
+
+from storage import place_id_from_folder_name
+
+
+class MarketManifest:
+    """
+    Local index of the markets already collected in a storage backend.
+
+    The place_ids are kept in an in-memory set, so the skip check during the search is a
+    constant-time lookup. The SQLite file stores the folder and capture metadata of every
+    market plus the backend's change token, so each start only reads the changes made since
+    the previous run instead of listing the whole dataset. A full rebuild from the backend
+    listing only happens on the very first sync or when asked for.
+    """
+
+    def __init__(self, db_path="market_manifest.sqlite"):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        # Batch worker processes share the file; wait for each other's write locks like ClaimStore does
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=60)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS markets (
+                   place_id TEXT PRIMARY KEY,
+                   folder_name TEXT NOT NULL,
+                   folder_id TEXT,
+                   lat REAL,
+                   lng REAL,
+                   image_count INTEGER,
+                   captured_at REAL
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_markets_folder_id ON markets (folder_id)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS state (name TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+        self._place_ids = {row[0] for row in self._conn.execute("SELECT place_id FROM markets")}
+
+    def __contains__(self, place_id):
+        return place_id in self._place_ids
+
+    def __len__(self):
+        return len(self._place_ids)
+
+    def place_ids(self):
+        """The live set of collected place_ids (updated in place by record/sync)."""
+        return self._place_ids
+
+    def get(self, place_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT place_id, folder_name, folder_id, lat, lng, image_count, captured_at FROM markets WHERE place_id = ?",
+                (place_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("place_id", "folder_name", "folder_id", "lat", "lng", "image_count", "captured_at")
+        return dict(zip(keys, row))
+
+    def _get_state(self, name):
+        row = self._conn.execute("SELECT value FROM state WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, name, value):
+        self._conn.execute("INSERT OR REPLACE INTO state (name, value) VALUES (?, ?)", (name, value))
+
+    def _upsert_folder(self, folder_name, folder_id):
+        place_id = place_id_from_folder_name(folder_name)
+        if not place_id:
+            return
+        parts = folder_name.rsplit('_', 2)
+        try:
+            lat, lng = float(parts[-2]), float(parts[-1])
+        except ValueError:
+            lat = lng = None
+        self._conn.execute(
+            """INSERT INTO markets (place_id, folder_name, folder_id, lat, lng) VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT(place_id) DO UPDATE SET folder_name = excluded.folder_name, folder_id = excluded.folder_id""",
+            (place_id, folder_name, folder_id, lat, lng)
+        )
+        self._place_ids.add(place_id)
+
+    def record_market(self, market, folder_name, folder_id, image_count=None):
+        """Adds (or updates) a collected market with its capture metadata."""
+        location = market.get("location", {})
+        with self._lock:
+            self._conn.execute(
+                """INSERT OR REPLACE INTO markets (place_id, folder_name, folder_id, lat, lng, image_count, captured_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (market.get("place_id"), folder_name, folder_id, location.get("lat"), location.get("lng"),
+                 image_count, time.time())
+            )
+            self._conn.commit()
+            self._place_ids.add(market.get("place_id"))
+
+    def rebuild(self, backend):
+        """Replaces the manifest with a full listing of the backend. Cost grows with the dataset."""
+        print(f"\nRebuilding the market manifest from a full {backend.name} listing...")
+        change_token = backend.get_change_token()
+        folders = backend.list_market_folders()
+        with self._lock:
+            captured = {
+                row[0]: row[1:]
+                for row in self._conn.execute("SELECT place_id, image_count, captured_at FROM markets")
+            }
+            self._conn.execute("DELETE FROM markets")
+            self._place_ids.clear()
+            for folder_name, folder_id in folders.items():
+                self._upsert_folder(folder_name, folder_id)
+            for place_id, (image_count, captured_at) in captured.items():
+                self._conn.execute(
+                    "UPDATE markets SET image_count = ?, captured_at = ? WHERE place_id = ?",
+                    (image_count, captured_at, place_id)
+                )
+            self._set_state("backend", backend.name)
+            self._set_state("change_token", change_token)
+            self._conn.commit()
+        print(f"Market manifest rebuilt: {len(self._place_ids)} markets.")
+
+    def sync(self, backend):
+        """
+        Brings the manifest up to date with the backend's change feed. Falls back to a full
+        rebuild only when the manifest was never synced with this backend.
+        """
+        with self._lock:
+            synced_backend = self._get_state("backend")
+            change_token = self._get_state("change_token")
+
+        if synced_backend != backend.name:
+            self.rebuild(backend)
+            return
+
+        if change_token is None:
+            # The backend has no change feed: the manifest is kept up to date by record_market
+            print(f"Market manifest: {len(self._place_ids)} collected markets.")
+            return
+
+        added, removed_ids, new_token = backend.list_market_folder_changes(change_token)
+        with self._lock:
+            for folder_name, folder_id in added.items():
+                self._upsert_folder(folder_name, folder_id)
+            for folder_id in removed_ids:
+                row = self._conn.execute("SELECT place_id FROM markets WHERE folder_id = ?", (folder_id,)).fetchone()
+                if row:
+                    self._conn.execute("DELETE FROM markets WHERE place_id = ?", (row[0],))
+                    self._place_ids.discard(row[0])
+            self._set_state("change_token", new_token)
+            self._conn.commit()
+        print(f"Market manifest: {len(self._place_ids)} collected markets "
+              f"({len(added)} added, {len(removed_ids)} removed since the last run).")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+if __name__ == "__main__":
+    # python src/market_manifest.py --rebuild  -> full rebuild from the configured storage backend
+    from data_collection import initialize_storage
+
+    backend = initialize_storage()
+    if backend:
+        manifest = MarketManifest(f"market_manifest_{backend.name}.sqlite")
+        if "--rebuild" in sys.argv[1:]:
+            manifest.rebuild(backend)
+        else:
+            manifest.sync(backend)
@@ -0,0 +1,299 @@
+"""
+Columnar store of market metadata and detections, with spatial aggregation queries.
+
+    python src/market_stats.py ingest --details local_dataset/markets --detections detections.jsonl
+    python src/market_stats.py query --feature ice-cream-cabinet --by district
+    python src/market_stats.py query --feature signboard --by geohash5 --near 41.0,28.9,5
+    python src/market_stats.py compact
+
+Every ingest appends one Parquet file to market_stats/markets/ (one row per market, from the
+{place_id}_details.json files written by the collector) and one to market_stats/detections/
+(one row per detected box, from the JSON lines of src/inference.py; the market of an image is
+its {place_id}_{lat}_{lng} folder). Each market row carries its geohash and the district / city
+parsed from its address; compact rewrites all parts into one file sorted by geohash, so reads
+restricted to an area only touch the row groups of that area.
+"""
+import os
+import re
+import json
+import time
+import argparse
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+from storage import place_id_from_folder_name
+
+DEFAULT_ROOT = "market_stats"
+GEOHASH_PRECISION = 7
+# A market has a feature when any of its images has a detection of it scoring at least this
+DEFAULT_MIN_SCORE = 0.5
+
+GEOHASH_ALPHABET = np.frombuffer(b"0123456789bcdefghjkmnpqrstuvwxyz", dtype=np.uint8)
+# "..., 34710 Kadıköy/İstanbul, Türkiye"
+DISTRICT_PATTERN = re.compile(r"\b\d{5}\s+([^/,]+)/([^,]+)")
+
+
+def geohash_encode(lats, lngs, precision=GEOHASH_PRECISION):
+    """Vectorized geohashes of arrays of coordinates."""
+    lats = np.asarray(lats, dtype=np.float64)
+    lngs = np.asarray(lngs, dtype=np.float64)
+    bits = 5 * precision
+    lng_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    lat_cells = np.clip(((lats + 90) / 180 * (1 << lat_bits)).astype(np.int64), 0, (1 << lat_bits) - 1)
+    lng_cells = np.clip(((lngs + 180) / 360 * (1 << lng_bits)).astype(np.int64), 0, (1 << lng_bits) - 1)
+    # Interleave the bits, starting with longitude
+    code = np.zeros(len(lats), dtype=np.int64)
+    for i in range(bits):
+        if i % 2 == 0:
+            bit = (lng_cells >> (lng_bits - 1 - i // 2)) & 1
+        else:
+            bit = (lat_cells >> (lat_bits - 1 - i // 2)) & 1
+        code = (code << 1) | bit
+    shifts = 5 * np.arange(precision - 1, -1, -1)
+    chars = GEOHASH_ALPHABET[(code[:, None] >> shifts) & 31]
+    return np.ascontiguousarray(chars).view(f"S{precision}").ravel().astype(str)
+
+
+def parse_district(address):
+    """(district, city) from a Turkish formatted address, or (None, None)."""
+    match = DISTRICT_PATTERN.search(address or "")
+    if not match:
+        return None, None
+    return match.group(1).strip(), match.group(2).strip()
+
+
+def load_market_details(root):
+    """All {place_id}_details.json market records under a dataset folder tree."""
+    markets = []
+    for directory, _, names in os.walk(root):
+        for name in names:
+            if name.endswith("_details.json"):
+                with open(os.path.join(directory, name), "r", encoding="utf-8") as f:
+                    markets.append(json.load(f))
+    return markets
+
+
+def load_detection_records(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def markets_table(markets):
+    """One row per market dict (as returned by find_markets_in_radius)."""
+    markets = [market for market in markets if market.get("place_id") and market.get("location")]
+    lats = np.array([market["location"]["lat"] for market in markets], dtype=np.float64)
+    lngs = np.array([market["location"]["lng"] for market in markets], dtype=np.float64)
+    districts = [parse_district(market.get("formatted_address") or market.get("vicinity")) for market in markets]
+    return pa.table({
+        "place_id": [market["place_id"] for market in markets],
+        "name": [market.get("name") for market in markets],
+        "lat": lats,
+        "lng": lngs,
+        "geohash": geohash_encode(lats, lngs) if markets else np.array([], dtype=str),
+        "district": [district for district, _ in districts],
+        "city": [city for _, city in districts],
+        "rating": pa.array([market.get("rating") for market in markets], type=pa.float64()),
+        "user_ratings_total": pa.array([market.get("user_ratings_total") for market in markets], type=pa.int64()),
+        "ingested_at": pa.array([time.time()] * len(markets), type=pa.float64()),
+    })
+
+
+def detections_table(records):
+    """One row per detected box of the inference JSON lines; images outside market folders are skipped."""
+    columns = {name: [] for name in ("place_id", "image", "model", "label", "score", "x1", "y1", "x2", "y2")}
+    for record in records:
+        place_id = place_id_from_folder_name(os.path.basename(os.path.dirname(record["image"])))
+        if place_id is None:
+            continue
+        for detection in record.get("detections") or []:
+            columns["place_id"].append(place_id)
+            columns["image"].append(os.path.basename(record["image"]))
+            columns["model"].append(record.get("model"))
+            columns["label"].append(detection["label"])
+            columns["score"].append(detection["score"])
+            for name, coord in zip(("x1", "y1", "x2", "y2"), detection["box"]):
+                columns[name].append(coord)
+    table = pa.table(columns)
+    return table.cast(pa.schema([
+        ("place_id", pa.string()), ("image", pa.string()), ("model", pa.string()), ("label", pa.string()),
+        ("score", pa.float32()), ("x1", pa.float32()), ("y1", pa.float32()), ("x2", pa.float32()), ("y2", pa.float32()),
+    ]))
+
+
+class MarketStatsStore:
+    """
+    Parquet parts under root/markets and root/detections. Appends never rewrite existing parts;
+    a market ingested again replaces its earlier row (the latest row of a place_id wins).
+
+    Queries work on an in-memory feature table (one row per market, one boolean column per
+    detected label) that is built on first use and after every append.
+    """
+
+    def __init__(self, root=DEFAULT_ROOT, min_score=DEFAULT_MIN_SCORE):
+        if pa is None:
+            raise ImportError("The market statistics store requires pyarrow (pip install pyarrow).")
+        self.root = root
+        self.min_score = min_score
+        os.makedirs(os.path.join(root, "markets"), exist_ok=True)
+        os.makedirs(os.path.join(root, "detections"), exist_ok=True)
+        self._features = None
+
+    def _next_part(self, table_name):
+        directory = os.path.join(self.root, table_name)
+        return os.path.join(directory, f"part-{time.time_ns()}.parquet")
+
+    def append(self, markets=None, detection_records=None):
+        """Appends market dicts and inference records as new parts. Returns (markets, detections) rows added."""
+        added = [0, 0]
+        if markets:
+            table = markets_table(markets)
+            pq.write_table(table, self._next_part("markets"))
+            added[0] = table.num_rows
+        if detection_records:
+            table = detections_table(detection_records)
+            if table.num_rows:
+                pq.write_table(table, self._next_part("detections"))
+            added[1] = table.num_rows
+        self._features = None
+        return tuple(added)
+
+    def _read(self, table_name, filters=None):
+        directory = os.path.join(self.root, table_name)
+        if not any(name.endswith(".parquet") for name in os.listdir(directory)):
+            return None
+        return pq.read_table(directory, filters=filters)
+
+    def markets(self, geohash_prefix=None):
+        """Latest row of every market, optionally only those whose geohash starts with geohash_prefix."""
+        filters = None
+        if geohash_prefix:
+            # Prefix range; on a compacted store the Parquet statistics skip the other row groups
+            filters = [("geohash", ">=", geohash_prefix), ("geohash", "<", geohash_prefix + "~")]
+        table = self._read("markets", filters)
+        if table is None:
+            return markets_table([])
+        # Latest ingest of each place_id
+        order = pc.sort_indices(table, [("place_id", "ascending"), ("ingested_at", "descending")])
+        table = table.take(order)
+        place_ids = table.column("place_id").to_numpy(zero_copy_only=False)
+        first = np.ones(len(place_ids), dtype=bool)
+        first[1:] = place_ids[1:] != place_ids[:-1]
+        return table.filter(pa.array(first))
+
+    def detections(self):
+        table = self._read("detections")
+        return table if table is not None else detections_table([])
+
+    def features(self):
+        """Markets with a has_<label> column for every detected label (score >= min_score)."""
+        if self._features is not None:
+            return self._features
+        markets = self.markets()
+        detections = self.detections()
+        detections = detections.filter(pc.greater_equal(detections.column("score"), self.min_score))
+        present = detections.group_by(["place_id", "label"]).aggregate([]) if detections.num_rows else None
+
+        table = markets
+        if present is not None:
+            labels = present.column("label").to_numpy(zero_copy_only=False)
+            rows = pc.index_in(present.column("place_id"), value_set=markets.column("place_id"))
+            rows = rows.fill_null(-1).to_numpy()
+            for label in sorted(set(labels)):
+                has = np.zeros(markets.num_rows, dtype=bool)
+                selected = rows[(labels == label) & (rows >= 0)]
+                has[selected] = True
+                table = table.append_column(f"has_{label}", pa.array(has))
+        self._features = table
+        return table
+
+    def labels(self):
+        return [name[4:] for name in self.features().column_names if name.startswith("has_")]
+
+    def feature_share(self, label, by="district", near=None):
+        """
+        Share of markets with a feature per group. by is "district", "city" or "geohashN" (the
+        first N geohash characters, N = 1..7); near=(lat, lng, radius_km) restricts the markets.
+        Returns a table of group, markets, with_feature, share sorted by group.
+        """
+        table = self.features()
+        if near is not None:
+            table = table.filter(pa.array(within_radius(table, *near)))
+        column = f"has_{label}"
+        has = table.column(column) if column in table.column_names else pa.array(np.zeros(table.num_rows, dtype=bool))
+        if by.startswith("geohash"):
+            precision = int(by[len("geohash"):] or GEOHASH_PRECISION)
+            groups = pc.utf8_slice_codeunits(table.column("geohash"), 0, precision)
+        else:
+            groups = table.column(by)
+        grouped = pa.table({"group": groups, "has": pc.cast(has, pa.int64())}).group_by("group").aggregate(
+            [("has", "count"), ("has", "sum")]
+        )
+        grouped = grouped.select(["group", "has_count", "has_sum"]).rename_columns(["group", "markets", "with_feature"])
+        share = pc.divide(pc.cast(grouped.column("with_feature"), pa.float64()), grouped.column("markets"))
+        grouped = grouped.append_column("share", share)
+        return grouped.sort_by("group")
+
+    def compact(self):
+        """Rewrites each table as one Parquet file, markets sorted by geohash for area reads."""
+        for table_name, table in (("markets", self.markets()), ("detections", self.detections())):
+            directory = os.path.join(self.root, table_name)
+            old_parts = [name for name in os.listdir(directory) if name.endswith(".parquet")]
+            if not old_parts:
+                continue
+            if table_name == "markets":
+                table = table.sort_by("geohash")
+            pq.write_table(table, self._next_part(table_name), row_group_size=64 * 1024)
+            for name in old_parts:
+                os.remove(os.path.join(directory, name))
+            print(f"{table_name}: {len(old_parts)} part(s) compacted into one file ({table.num_rows} rows).")
+        self._features = None
+
+
+def within_radius(table, lat, lng, radius_km):
+    """Boolean mask of the rows within radius_km of (lat, lng) (equirectangular approximation)."""
+    lats = table.column("lat").to_numpy()
+    lngs = table.column("lng").to_numpy()
+    dy = (lats - lat) * 111.32
+    dx = (lngs - lng) * 111.32 * np.cos(np.radians(lat))
+    return dx * dx + dy * dy <= radius_km * radius_km
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["ingest", "query", "compact"])
+    parser.add_argument("--root", default=DEFAULT_ROOT)
+    parser.add_argument("--details", help="ingest: dataset folder tree with the *_details.json files")
+    parser.add_argument("--detections", help="ingest: detections.jsonl written by src/inference.py")
+    parser.add_argument("--feature", help="query: detected label, e.g. ice-cream-cabinet")
+    parser.add_argument("--by", default="district", help="query: district, city or geohash1..geohash7")
+    parser.add_argument("--near", help="query: lat,lng,radius_km")
+    parser.add_argument("--min_score", type=float, default=DEFAULT_MIN_SCORE)
+    args = parser.parse_args()
+
+    store = MarketStatsStore(args.root, args.min_score)
+    if args.command == "ingest":
+        markets = load_market_details(args.details) if args.details else None
+        records = load_detection_records(args.detections) if args.detections else None
+        added_markets, added_detections = store.append(markets, records)
+        print(f"{added_markets} markets and {added_detections} detections appended to {args.root}")
+    elif args.command == "compact":
+        store.compact()
+    else:
+        if not args.feature:
+            parser.error(f"--feature is required for query; detected labels: {', '.join(store.labels())}")
+        near = tuple(float(value) for value in args.near.split(",")) if args.near else None
+        started_at = time.perf_counter()
+        result = store.feature_share(args.feature, args.by, near)
+        elapsed_ms = (time.perf_counter() - started_at) * 1000
+        print(f"{'Group':<24} {'Markets':>8} {'With':>8} {'Share':>7}")
+        for row in result.to_pylist():
+            print(f"{str(row['group']):<24} {row['markets']:>8} {row['with_feature']:>8} {row['share'] * 100:>6.1f}%")
+        print(f"({elapsed_ms:.1f} ms)")
@@ -0,0 +1,292 @@
+"""
+Compares several trained detectors on the same images, with the models kept loaded.
+
+    python src/model_registry.py test.jpg --model YOLOv8=runs/yolov8_train/weights/best.pt \
+        --model YOLOv12=runs/yolov12_train/weights/best.pt --model DETR=detr-market-finetuned-best --fuse
+
+Every model is loaded once and stays resident. Each image is decoded once and the same decoded
+image is handed to all models in parallel; the per-model detections (and, with --fuse, their
+weighted-box-fusion ensemble) are printed and written as JSON. With --cache the detections
+are looked up in (and added to) the same detection cache inference.py uses; it is off by default,
+because cached images would leave the per-model timings nothing to measure.
+"""
+import io
+import os
+import json
+import time
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from detection_cache import DetectionCache
+from inference import DEFAULT_CONFIDENCE, DEFAULT_IMAGE_SIZE, decode_image, load_detector, set_threads
+from instrumentation import log, PROGRESS
+
+# Boxes of the same class from different models overlapping more than this are fused
+FUSION_IOU_THRESHOLD = 0.55
+
+
+def load_image(source):
+    """An RGB PIL image from a path, JPEG bytes or an already decoded image."""
+    if isinstance(source, Image.Image):
+        return source.convert("RGB") if source.mode != "RGB" else source
+    if isinstance(source, bytes):
+        image = Image.open(io.BytesIO(source))
+        image.load()
+        return image.convert("RGB")
+    return decode_image(source)
+
+
+def read_source(source):
+    """(RGB image, sha256 of the image bytes) of a path, JPEG bytes or decoded image; no hash for the latter."""
+    if isinstance(source, Image.Image):
+        return load_image(source), None
+    if not isinstance(source, bytes):
+        with open(source, "rb") as f:
+            source = f.read()
+    return load_image(source), hashlib.sha256(source).hexdigest()
+
+
+def box_iou(box, boxes):
+    """IoU of one [x1, y1, x2, y2] box against an (N, 4) array of boxes."""
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return intersection / np.maximum(area + areas - intersection, 1e-9)
+
+
+def weighted_boxes_fusion(model_detections, weights=None, iou_threshold=FUSION_IOU_THRESHOLD):
+    """
+    Weighted boxes fusion (Solovyev et al., 2019) of {model_name: detections}.
+
+    Boxes are visited in descending score order and joined to the first fused box of the same
+    label they overlap by more than iou_threshold. A fused box is the score-weighted mean of its
+    members and its score is their mean score, scaled down when fewer models than the total
+    weight agree on it.
+    """
+    weights = weights or {}
+    total_weight = sum(weights.get(name, 1.0) for name in model_detections) or 1.0
+    candidates = sorted(
+        (
+            (detection["score"] * weights.get(name, 1.0), name, detection)
+            for name, detections in model_detections.items()
+            for detection in detections
+        ),
+        key=lambda candidate: -candidate[0]
+    )
+
+    clusters = {}  # label -> [[fused_box, [(score, box, model_name), ...], class_id], ...]
+    for score, name, detection in candidates:
+        label_clusters = clusters.setdefault(detection["label"], [])
+        box = np.asarray(detection["box"], dtype=np.float64)
+        match = None
+        if label_clusters:
+            ious = box_iou(box, np.array([cluster[0] for cluster in label_clusters]))
+            best = int(np.argmax(ious))
+            if ious[best] > iou_threshold:
+                match = label_clusters[best]
+        if match is None:
+            label_clusters.append([box, [(score, box, name)], detection.get("class_id")])
+            continue
+        match[1].append((score, box, name))
+        scores = np.array([member[0] for member in match[1]])
+        match[0] = (scores[:, None] * np.array([member[1] for member in match[1]])).sum(axis=0) / scores.sum()
+
+    fused = []
+    for label, label_clusters in clusters.items():
+        for box, members, class_id in label_clusters:
+            agreeing = {member[2] for member in members}
+            agreement = min(sum(weights.get(name, 1.0) for name in agreeing), total_weight) / total_weight
+            fused.append({
+                "label": label,
+                "class_id": class_id,
+                "score": round(float(np.mean([member[0] for member in members]) * agreement), 4),
+                "box": [round(float(coord), 1) for coord in box],
+                "models": sorted(agreeing),
+            })
+    fused.sort(key=lambda detection: -detection["score"])
+    return fused
+
+
+class ModelRegistry:
+    """
+    Named detectors that are loaded on first use (or by warm_up) and then kept in memory.
+
+    predict() decodes an image once and runs every model on that same image from a thread pool.
+    Each model has its own lock, so concurrent predict calls never run one model twice at once.
+    With several models running in parallel, torch threads per model (set_threads) should be
+    about cpu_count / number of models. With a DetectionCache, images given as paths or bytes
+    are only run through the models that have no cached detections for them; the timings then
+    cover the cache misses only.
+    """
+
+    def __init__(self, confidence=DEFAULT_CONFIDENCE, image_size=DEFAULT_IMAGE_SIZE, device="cpu", max_workers=None,
+                 cache=None):
+        self.confidence = confidence
+        self.image_size = image_size
+        self.device = device
+        self.max_workers = max_workers
+        self.cache = cache
+        self._specs = {}
+        self._detectors = {}
+        self._model_keys = {}
+        self._model_locks = {}
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def register(self, name, model_path, model_type=None, weight=1.0):
+        """Adds a model without loading it. weight is its vote in the fused ensemble."""
+        with self._lock:
+            self._specs[name] = {"path": model_path, "type": model_type, "weight": weight}
+            self._detectors.pop(name, None)
+            self._model_keys.pop(name, None)
+            self._model_locks.setdefault(name, threading.Lock())
+            # The pool is sized by the number of models; a new one is made on the next predict
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    @property
+    def names(self):
+        return list(self._specs)
+
+    @property
+    def weights(self):
+        return {name: spec["weight"] for name, spec in self._specs.items()}
+
+    def get(self, name):
+        """The loaded detector of a registered model, loading it on first use."""
+        detector = self._detectors.get(name)
+        if detector is not None:
+            return detector
+        with self._model_locks[name]:
+            detector = self._detectors.get(name)
+            if detector is None:
+                spec = self._specs[name]
+                started_at = time.perf_counter()
+                detector = load_detector(spec["path"], spec["type"], image_size=self.image_size,
+                                         confidence=self.confidence, device=self.device)
+                if self.cache is not None and detector.weights_path:
+                    self._model_keys[name] = self.cache.model_key(name, detector.weights_path, detector.settings)
+                self._detectors[name] = detector
+                log(f"{name} loaded ({time.perf_counter() - started_at:.1f} s)", PROGRESS)
+        return detector
+
+    def warm_up(self):
+        """Loads every model and runs it once on a blank image, so the first real call is not a cold start."""
+        blank = Image.new("RGB", (self.image_size, self.image_size))
+        for name in self.names:
+            detector = self.get(name)
+            with self._model_locks[name]:
+                detector.predict_batch([blank])
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers or max(1, len(self._specs)))
+            return self._pool
+
+    def _run_model(self, name, images, image_hashes):
+        detector = self.get(name)
+        model_key = self._model_keys.get(name)
+        cached = {}
+        if model_key is not None:
+            cached = self.cache.get_many([h for h in image_hashes if h is not None], model_key)
+        misses = [i for i, image_hash in enumerate(image_hashes) if image_hash not in cached]
+        with self._model_locks[name]:
+            started_at = time.perf_counter()
+            predictions = detector.predict_batch([images[i] for i in misses]) if misses else []
+        milliseconds = (time.perf_counter() - started_at) * 1000
+        if model_key is not None:
+            self.cache.put_many({image_hashes[i]: detections for i, detections in zip(misses, predictions)
+                                 if image_hashes[i] is not None}, model_key)
+        detections = [cached.get(image_hash) for image_hash in image_hashes]
+        for i, prediction in zip(misses, predictions):
+            detections[i] = prediction
+        return detections, milliseconds
+
+    def predict_batch(self, sources, models=None, fuse=False, iou_threshold=FUSION_IOU_THRESHOLD):
+        """
+        Runs the chosen models (default: all) on a batch of images (paths, bytes or PIL images).
+        Returns one result per image: {"models": {name: detections}, "ensemble": [...]} (ensemble
+        only with fuse=True), plus the total "timings_ms" of every model for the batch.
+        """
+        images, image_hashes = zip(*(read_source(source) for source in sources)) if sources else ((), ())
+        names = models or self.names
+        pool = self._executor()
+        futures = {name: pool.submit(self._run_model, name, images, image_hashes) for name in names}
+        timings = {}
+        per_model = {}
+        for name, future in futures.items():
+            per_model[name], timings[name] = future.result()
+
+        results = []
+        for i in range(len(images)):
+            result = {"models": {name: per_model[name][i] for name in names}}
+            if fuse:
+                result["ensemble"] = weighted_boxes_fusion(result["models"], self.weights, iou_threshold)
+            results.append(result)
+        return results, {name: round(ms, 1) for name, ms in timings.items()}
+
+    def predict(self, source, models=None, fuse=False, iou_threshold=FUSION_IOU_THRESHOLD):
+        """Single-image predict_batch; the result also carries the per-model "timings_ms"."""
+        results, timings = self.predict_batch([source], models, fuse, iou_threshold)
+        results[0]["timings_ms"] = timings
+        return results[0]
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", nargs="+", help="Test image(s)")
+    parser.add_argument("--model", action="append", required=True, metavar="NAME=PATH",
+                        help="Model weights (.pt) or DETR checkpoint directory; repeat for every model")
+    parser.add_argument("--confidence", type=float, default=0.5)
+    parser.add_argument("--threads", type=int, default=None, help="torch CPU threads per model")
+    parser.add_argument("--fuse", action="store_true", help="Add a weighted-boxes-fusion ensemble")
+    parser.add_argument("--iou", type=float, default=FUSION_IOU_THRESHOLD)
+    parser.add_argument("--output", default="model_comparison.json")
+    parser.add_argument("--cache", default=None, help="Detection cache database to reuse (e.g. detection_cache.sqlite)")
+    args = parser.parse_args()
+
+    cache = DetectionCache(args.cache) if args.cache else None
+    registry = ModelRegistry(confidence=args.confidence, cache=cache)
+    for entry in args.model:
+        name, _, path = entry.partition("=")
+        if not path:
+            name, path = os.path.basename(entry), entry
+        registry.register(name, path)
+    set_threads(args.threads or max(1, (os.cpu_count() or 1) // len(registry.names)))
+    registry.warm_up()
+
+    report = {}
+    for image_path in args.images:
+        result = registry.predict(image_path, fuse=args.fuse, iou_threshold=args.iou)
+        report[image_path] = result
+        print(f"\n{image_path}")
+        for name, detections in result["models"].items():
+            labels = ", ".join(f"{d['label']} {d['score']:.2f}" for d in detections) or "-"
+            print(f"  {name:<14} {result['timings_ms'][name]:>7.1f} ms  {labels}")
+        if args.fuse:
+            labels = ", ".join(f"{d['label']} {d['score']:.2f}" for d in result["ensemble"]) or "-"
+            print(f"  {'Ensemble':<14} {'':>10}  {labels}")
+    registry.close()
+    if cache is not None:
+        cache.print_stats()
+        cache.close()
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nResults written to {args.output}")
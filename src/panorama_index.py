@@ -0,0 +1,159 @@
+import os
+import math
+import shutil
+import hashlib
+import threading
+
+METERS_PER_DEGREE_LAT = 111320.0
+
+# Targets closer than this to an already resolved target reuse its panorama lookup
+PANORAMA_REUSE_RADIUS_METERS = 5
+# Headings of panorama views are rounded to this step so overlapping views share a cache key
+HEADING_QUANTUM_DEGREES = 5
+
+
+def quantize_heading(heading, quantum=HEADING_QUANTUM_DEGREES):
+    return (round(heading / quantum) * quantum) % 360
+
+
+class PanoramaIndex:
+    """
+    In-memory spatial index of resolved Street View metadata.
+
+    Lookups are bucketed in a grid of `reuse_radius_m` cells, so a query only has to look at
+    the 3 x 3 neighbouring cells. Markets on the same block resolve to the same panorama,
+    so reusing a lookup made a few meters away saves the metadata call.
+    """
+
+    def __init__(self, reuse_radius_m=PANORAMA_REUSE_RADIUS_METERS):
+        self.reuse_radius_m = reuse_radius_m
+        self.hits = 0
+        self.misses = 0
+        self._cells = {}
+        self._lock = threading.Lock()
+
+    def _cell(self, lat, lng):
+        cell_lat = self.reuse_radius_m / METERS_PER_DEGREE_LAT
+        cell_lng = cell_lat / max(math.cos(math.radians(lat)), 1e-6)
+        return int(math.floor(lat / cell_lat)), int(math.floor(lng / cell_lng))
+
+    @staticmethod
+    def _distance(lat1, lng1, lat2, lng2):
+        dy = (lat2 - lat1) * METERS_PER_DEGREE_LAT
+        dx = (lng2 - lng1) * METERS_PER_DEGREE_LAT * math.cos(math.radians((lat1 + lat2) / 2))
+        return math.hypot(dx, dy)
+
+    def lookup(self, lat, lng):
+        """Returns the metadata resolved for the nearest target within the reuse radius, or None."""
+        row, col = self._cell(lat, lng)
+        best, best_distance = None, self.reuse_radius_m
+        with self._lock:
+            for d_row in (-1, 0, 1):
+                for d_col in (-1, 0, 1):
+                    for entry_lat, entry_lng, metadata in self._cells.get((row + d_row, col + d_col), ()):
+                        distance = self._distance(lat, lng, entry_lat, entry_lng)
+                        if distance <= best_distance:
+                            best, best_distance = metadata, distance
+            if best is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return best
+
+    def add(self, lat, lng, metadata):
+        with self._lock:
+            self._cells.setdefault(self._cell(lat, lng), []).append((lat, lng, metadata))
+
+
+class StreetViewImageCache:
+    """
+    On-disk cache of Street View images keyed by (pano_id, quantized heading, pitch, fov, size).
+
+    Overlapping views of neighbouring markets are downloaded once and reused for every market
+    folder that needs them. The oldest files are removed once the cache grows past `max_bytes`.
+    """
+
+    def __init__(self, cache_dir="streetview_cache", max_bytes=2 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._size = sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, files in os.walk(cache_dir)
+            for name in files
+        )
+
+    @staticmethod
+    def make_key(pano_id, heading, pitch, fov, size):
+        raw = f"{pano_id}|{quantize_heading(float(heading))}|{pitch}|{fov}|{size}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.jpg")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def get_path(self, key):
+        """Path of the cached image (for chunked reads), or None."""
+        path = self._path(key)
+        found = os.path.exists(path)
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return path if found else None
+
+    def _store(self, key, size, write):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._size += size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def put(self, key, data):
+        self._store(key, len(data), lambda f: f.write(data))
+
+    def put_stream(self, key, image, chunk_size=64 * 1024):
+        """Stores a storage.SpooledImage without reading it into memory."""
+        self._store(key, image.size, lambda f: shutil.copyfileobj(image.open(), f, chunk_size))
+
+    def _evict(self):
+        """Removes the oldest images until the cache is back under 90% of max_bytes."""
+        files = []
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if name.endswith(".jpg"):
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        self._size = sum(size for _, size, _ in files)
+        target = self.max_bytes * 0.9
+        for _, size, path in files:
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+                self._size -= size
+            except FileNotFoundError:
+                pass
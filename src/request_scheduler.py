@@ -0,0 +1,298 @@
+import os
+import json
+import time
+import atexit
+import random
+import threading
+
+import requests
+
+import instrumentation
+from instrumentation import log
+
+# Sustained requests per second and burst size for each endpoint
+DEFAULT_RATE_LIMITS = {
+    "nearbysearch": (10, 20),
+    "place_details": (10, 20),
+    "streetview_metadata": (30, 50),
+    "streetview": (30, 50),
+}
+
+# Price of one call in USD (Google Maps Platform list prices per 1000 calls / 1000)
+DEFAULT_COSTS_USD = {
+    "nearbysearch": 0.032,
+    "place_details": 0.017,
+    "streetview_metadata": 0.0,
+    "streetview": 0.007,
+}
+
+RETRYABLE_HTTP_CODES = {429, 500, 502, 503, 504}
+RETRYABLE_API_STATUSES = {"OVER_QUERY_LIMIT", "UNKNOWN_ERROR"}
+# Network errors worth another attempt; other RequestExceptions (bad URL, too many redirects) are not
+RETRYABLE_EXCEPTIONS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.ContentDecodingError,
+)
+
+# The quota file is rewritten at most this often while calls are charged (and once more at exit)
+BUDGET_SAVE_INTERVAL = 5.0
+
+
+class QuotaExceeded(Exception):
+    """Raised when a request would go over the daily API budget."""
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, at most `capacity` saved up."""
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class QuotaBudget:
+    """
+    Counts calls and their cost per UTC day and refuses calls once the daily budget is spent.
+    The counters are persisted in a small JSON file so separate runs share the same budget; it
+    is written every BUDGET_SAVE_INTERVAL seconds at most, by flush() and at interpreter exit.
+    """
+
+    def __init__(self, costs=None, daily_budget_usd=None, state_path="api_quota.json"):
+        self.costs = dict(DEFAULT_COSTS_USD)
+        if costs:
+            self.costs.update(costs)
+        self.daily_budget_usd = daily_budget_usd
+        self.state_path = state_path
+        self._lock = threading.Lock()
+        self._day = None
+        self.calls = {}
+        self.spent_usd = 0.0
+        self._saved_at = 0.0
+        self._dirty = False
+        self._load()
+        if self.state_path:
+            atexit.register(self.flush)
+
+    @staticmethod
+    def _today():
+        return time.strftime("%Y-%m-%d", time.gmtime())
+
+    def _load(self):
+        self._day = self._today()
+        if self.state_path and os.path.exists(self.state_path):
+            try:
+                with open(self.state_path, encoding="utf-8") as f:
+                    state = json.load(f)
+                if state.get("day") == self._day:
+                    self.calls = state.get("calls", {})
+                    self.spent_usd = state.get("spent_usd", 0.0)
+            except (OSError, ValueError):
+                pass
+
+    def _save(self):
+        if not self.state_path:
+            return
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"day": self._day, "calls": self.calls, "spent_usd": self.spent_usd}, f)
+        os.replace(tmp_path, self.state_path)
+        self._saved_at = time.monotonic()
+        self._dirty = False
+
+    def flush(self):
+        """Writes counters that were charged since the last save."""
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def remaining_usd(self):
+        """Budget left for today, or None when there is no budget."""
+        if self.daily_budget_usd is None:
+            return None
+        return max(0.0, self.daily_budget_usd - self.spent_usd)
+
+    def add_usage(self, calls, spent_usd):
+        """Adds calls made elsewhere (e.g. by batch worker processes) to today's counters."""
+        with self._lock:
+            for endpoint, count in calls.items():
+                self.calls[endpoint] = self.calls.get(endpoint, 0) + count
+            self.spent_usd += spent_usd
+            self._save()
+
+    def charge(self, endpoint):
+        cost = self.costs.get(endpoint, 0.0)
+        with self._lock:
+            if self._day != self._today():
+                self._day = self._today()
+                self.calls = {}
+                self.spent_usd = 0.0
+            if self.daily_budget_usd is not None and cost and self.spent_usd + cost > self.daily_budget_usd:
+                raise QuotaExceeded(
+                    f"Daily API budget of ${self.daily_budget_usd:.2f} reached (${self.spent_usd:.2f} spent today)."
+                )
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+            self.spent_usd += cost
+            self._dirty = True
+            if time.monotonic() - self._saved_at >= BUDGET_SAVE_INTERVAL:
+                self._save()
+
+    def refund(self, endpoint):
+        """Takes back the cost of a call the API does not bill; the call itself stays counted."""
+        with self._lock:
+            self.spent_usd = max(0.0, self.spent_usd - self.costs.get(endpoint, 0.0))
+            self._dirty = True
+
+
+class RequestScheduler:
+    """
+    Single gateway for every Google Maps API request.
+
+    Each endpoint has its own token bucket, every call is charged against the daily budget,
+    and retryable failures (network errors and broken transfers, HTTP 429/5xx, OVER_QUERY_LIMIT,
+    Street View XML error bodies) are retried with exponential backoff and full jitter instead of dropping
+    the item.
+    """
+
+    def __init__(self, session, rate_limits=None, budget=None, max_retries=5, base_delay=0.5, max_delay=32.0):
+        self.session = session
+        limits = dict(DEFAULT_RATE_LIMITS)
+        if rate_limits:
+            limits.update(rate_limits)
+        self.buckets = {endpoint: TokenBucket(rate, burst) for endpoint, (rate, burst) in limits.items()}
+        self.budget = budget or QuotaBudget(state_path=None)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = {}
+        self.failures = {}
+        self._lock = threading.Lock()
+
+    def _count(self, counter, endpoint):
+        with self._lock:
+            counter[endpoint] = counter.get(endpoint, 0) + 1
+
+    def backoff_delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _send(self, endpoint, url, params, stream=False):
+        bucket = self.buckets.get(endpoint)
+        if bucket:
+            bucket.acquire()
+        self.budget.charge(endpoint)
+        instrumentation.count("api_calls_total", endpoint=endpoint)
+        with instrumentation.span("api_request", endpoint=endpoint):
+            return self.session.get(url, params=params, stream=stream, timeout=30)
+
+    def get(self, endpoint, url, params, stream=False, retry_if=None):
+        """
+        Sends a rate-limited GET request with retries. `retry_if(response)` can flag
+        endpoint-specific transient errors in an otherwise successful response.
+        Returns the last response, or None when every attempt failed at the network level.
+        """
+        response = None
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            response = None
+            try:
+                response = self._send(endpoint, url, params, stream)
+                if response.status_code in RETRYABLE_HTTP_CODES:
+                    reason = f"HTTP {response.status_code}"
+                    header = response.headers.get("Retry-After")
+                    if header and header.isdigit():
+                        retry_after = min(float(header), self.max_delay)
+                elif retry_if is not None and retry_if(response):
+                    reason = "transient error response"
+                else:
+                    return response
+            except RETRYABLE_EXCEPTIONS as error:
+                # Also raised by retry_if while it reads the start of a streamed body
+                if response is not None:
+                    response.close()
+                response = None
+                reason = str(error)
+            except requests.RequestException as error:
+                if response is not None:
+                    response.close()
+                log(f"    {endpoint}: {error!r}, not retried")
+                self._count(self.failures, endpoint)
+                instrumentation.count("api_failures_total", endpoint=endpoint)
+                return None
+
+            if attempt == self.max_retries:
+                break
+            if response is not None:
+                # Streamed responses hold their connection until closed
+                response.close()
+            self._count(self.retries, endpoint)
+            instrumentation.count("api_retries_total", endpoint=endpoint)
+            delay = self.backoff_delay(attempt, retry_after)
+            log(f"    {endpoint}: {reason}, retrying in {delay:.1f} s ({attempt + 1}/{self.max_retries})")
+            time.sleep(delay)
+
+        self._count(self.failures, endpoint)
+        instrumentation.count("api_failures_total", endpoint=endpoint)
+        return response
+
+    @staticmethod
+    def _json_body(response):
+        try:
+            return response.json()
+        except ValueError:
+            return None
+
+    def get_json(self, endpoint, url, params):
+        """GET a JSON endpoint; OVER_QUERY_LIMIT / UNKNOWN_ERROR answers are retried. Returns the body or None."""
+        def is_transient(response):
+            body = self._json_body(response) if response.status_code == 200 else None
+            return body is not None and body.get("status") in RETRYABLE_API_STATUSES
+
+        response = self.get(endpoint, url, params, retry_if=is_transient)
+        if response is None or response.status_code != 200:
+            return None
+        instrumentation.count("api_bytes_total", len(response.content), endpoint=endpoint)
+        return self._json_body(response)
+
+    def poll_page_token(self, fetch, endpoint="nearbysearch", first_wait=0.5, interval=0.4, timeout=10.0):
+        """
+        Fetches a Nearby Search next page with `fetch()`. A new next_page_token only becomes valid
+        a short moment after it is issued (until then the API answers INVALID_REQUEST), so the
+        token is polled at a short interval instead of waiting a fixed 2 seconds. INVALID_REQUEST
+        answers are not billed, so their cost is refunded to the budget.
+        """
+        time.sleep(first_wait)
+        deadline = time.monotonic() + timeout
+        while True:
+            result = fetch()
+            if result is None or result.get("status") != "INVALID_REQUEST":
+                return result
+            self.budget.refund(endpoint)
+            if time.monotonic() >= deadline:
+                return result
+            time.sleep(interval)
+
+    def print_stats(self):
+        print(f"\nAPI usage today: ${self.budget.spent_usd:.2f}"
+              + (f" of ${self.budget.daily_budget_usd:.2f} budget" if self.budget.daily_budget_usd is not None else ""))
+        for endpoint in sorted(self.budget.calls):
+            print(f"  {endpoint}: {self.budget.calls[endpoint]} calls, "
+                  f"{self.retries.get(endpoint, 0)} retries, {self.failures.get(endpoint, 0)} failures")
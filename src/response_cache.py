@@ -0,0 +1,162 @@
+import sqlite3
+import json
+import time
+import hashlib
+import threading
+
+# Default time-to-live (seconds) for each cached endpoint
+DEFAULT_TTLS = {
+    "nearbysearch": 7 * 24 * 3600,
+    "place_details": 30 * 24 * 3600,
+    "streetview_metadata": 30 * 24 * 3600,
+}
+
+# Parameters that must never be part of a cache key
+IGNORED_PARAMS = {"key"}
+
+
+class ResponseCache:
+    """
+    Persistent SQLite cache for Google API JSON responses.
+
+    Entries are keyed on the endpoint name and the normalized request parameters (the API key
+    is left out), expire after a per-endpoint TTL and are evicted least-recently-used first once
+    the cache holds more than `max_entries` responses.
+    """
+
+    def __init__(self, db_path="api_cache.sqlite", ttls=None, max_entries=200000):
+        self.db_path = db_path
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.max_entries = max_entries
+        self.hits = {}
+        self.misses = {}
+        self._lock = threading.Lock()
+        # Batch worker processes share the file; wait for each other's write locks like ClaimStore does
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=60)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                   cache_key TEXT PRIMARY KEY,
+                   endpoint TEXT NOT NULL,
+                   body TEXT NOT NULL,
+                   created_at REAL NOT NULL,
+                   last_access REAL NOT NULL
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def normalize_params(params):
+        """Returns the request parameters as a canonical, key-free dict of strings."""
+        normalized = {}
+        for name, value in params.items():
+            if name in IGNORED_PARAMS:
+                continue
+            if name == "location" and isinstance(value, str) and "," in value:
+                try:
+                    lat, lng = (float(v) for v in value.split(","))
+                    value = f"{lat:.6f},{lng:.6f}"
+                except ValueError:
+                    pass
+            elif isinstance(value, float):
+                value = f"{value:.6f}".rstrip("0").rstrip(".")
+            normalized[name] = str(value)
+        return normalized
+
+    def make_key(self, endpoint, params):
+        payload = json.dumps([endpoint, self.normalize_params(params)], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, endpoint, params):
+        """Returns the cached response for the request or None on a miss / expired entry."""
+        cache_key = self.make_key(endpoint, params)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, created_at FROM responses WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+            ttl = self.ttls.get(endpoint)
+            if row is None or (ttl is not None and now - row[1] > ttl):
+                if row is not None:
+                    self._conn.execute("DELETE FROM responses WHERE cache_key = ?", (cache_key,))
+                    self._conn.commit()
+                self.misses[endpoint] = self.misses.get(endpoint, 0) + 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE cache_key = ?", (now, cache_key))
+            self._conn.commit()
+            self.hits[endpoint] = self.hits.get(endpoint, 0) + 1
+        return json.loads(row[0])
+
+    def contains(self, endpoint, params):
+        """True if a fresh entry exists for the request. Does not count as a hit or miss."""
+        cache_key = self.make_key(endpoint, params)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT created_at FROM responses WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+        ttl = self.ttls.get(endpoint)
+        return row is not None and (ttl is None or time.time() - row[0] <= ttl)
+
+    def set(self, endpoint, params, value):
+        cache_key = self.make_key(endpoint, params)
+        now = time.time()
+        body = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (cache_key, endpoint, body, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (cache_key, endpoint, body, now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Drops the least recently used entries when the cache is over its size limit."""
+        count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM responses WHERE cache_key IN "
+                "(SELECT cache_key FROM responses ORDER BY last_access ASC LIMIT ?)",
+                (overflow,),
+            )
+
+    def purge_expired(self):
+        """Removes every expired entry. Returns the number of deleted rows."""
+        now = time.time()
+        deleted = 0
+        with self._lock:
+            for endpoint, ttl in self.ttls.items():
+                cursor = self._conn.execute(
+                    "DELETE FROM responses WHERE endpoint = ? AND created_at < ?", (endpoint, now - ttl)
+                )
+                deleted += cursor.rowcount
+            self._conn.commit()
+        return deleted
+
+    def stats(self):
+        """Hit/miss counters per endpoint for this session plus the number of stored entries."""
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        endpoints = sorted(set(self.hits) | set(self.misses))
+        return {
+            "entries": size,
+            "endpoints": {
+                endpoint: {"hits": self.hits.get(endpoint, 0), "misses": self.misses.get(endpoint, 0)}
+                for endpoint in endpoints
+            },
+        }
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f"\nAPI response cache: {stats['entries']} entries stored")
+        for endpoint, counts in stats["endpoints"].items():
+            total = counts["hits"] + counts["misses"]
+            rate = counts["hits"] / total * 100 if total else 0
+            print(f"  {endpoint}: {counts['hits']} hits / {counts['misses']} misses ({rate:.0f}% hit rate)")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,138 @@
+import math
+from collections import deque
+
+# Nearby Search returns at most 3 pages of 20 results for a single query
+NEARBY_SEARCH_RESULT_CAP = 60
+# Nearby Search does not accept a larger radius
+MAX_QUERY_RADIUS_METERS = 50000
+# Saturated tiles are not split below this query radius
+MIN_TILE_RADIUS_METERS = 150
+
+METERS_PER_DEGREE_LAT = 111320.0
+
+
+class Tile:
+    """
+    Square search tile. It is queried with the circle that circumscribes the square
+    (the root tile uses the requested search circle itself).
+    """
+
+    def __init__(self, lat, lng, half_size_m, radius_m=None, depth=0):
+        self.lat = lat
+        self.lng = lng
+        self.half_size_m = half_size_m
+        self.radius_m = radius_m if radius_m is not None else half_size_m * math.sqrt(2)
+        self.depth = depth
+
+    def __repr__(self):
+        return f"Tile({self.lat:.6f}, {self.lng:.6f}, radius={self.radius_m:.0f}m, depth={self.depth})"
+
+    def offset(self, north_m, east_m):
+        """Returns the (lat, lng) that is north_m / east_m meters away from the tile centre."""
+        lat = self.lat + north_m / METERS_PER_DEGREE_LAT
+        lng = self.lng + east_m / (METERS_PER_DEGREE_LAT * math.cos(math.radians(self.lat)))
+        return lat, lng
+
+    def corners(self):
+        h = self.half_size_m
+        return [self.offset(north, east) for north in (-h, h) for east in (-h, h)]
+
+    def children(self):
+        """Splits the tile into four quadrants."""
+        quarter = self.half_size_m / 2
+        return [
+            Tile(*self.offset(north, east), quarter, depth=self.depth + 1)
+            for north in (-quarter, quarter)
+            for east in (-quarter, quarter)
+        ]
+
+
+def local_distance(lat1, lng1, lat2, lng2):
+    """Equirectangular distance in meters, accurate enough at tile scale (< 50 km)."""
+    mean_lat = math.radians((lat1 + lat2) / 2)
+    dy = (lat2 - lat1) * METERS_PER_DEGREE_LAT
+    dx = (lng2 - lng1) * METERS_PER_DEGREE_LAT * math.cos(mean_lat)
+    return math.hypot(dx, dy)
+
+
+def tile_intersects_circle(tile, lat, lng, radius_m):
+    """True if the square of the tile overlaps the circle."""
+    north = (lat - tile.lat) * METERS_PER_DEGREE_LAT
+    east = (lng - tile.lng) * METERS_PER_DEGREE_LAT * math.cos(math.radians(tile.lat))
+    dy = max(abs(north) - tile.half_size_m, 0)
+    dx = max(abs(east) - tile.half_size_m, 0)
+    return math.hypot(dx, dy) <= radius_m
+
+
+def tile_inside_circle(tile, lat, lng, radius_m):
+    """True if the square of the tile lies entirely inside the circle."""
+    return all(local_distance(lat, lng, c_lat, c_lng) <= radius_m for c_lat, c_lng in tile.corners())
+
+
+class CompletedAreas:
+    """
+    Search circles already answered by an unsaturated query.
+
+    The circles are bucketed by radius (one per quadtree depth) into a grid whose cells are twice
+    that radius wide, so a circle can only contain a tile whose centre lies in the same or a
+    neighbouring cell. Checking a tile looks at 9 cells per depth instead of every completed area.
+    """
+
+    def __init__(self, lat):
+        self.meters_per_degree_lng = METERS_PER_DEGREE_LAT * math.cos(math.radians(lat))
+        self._grids = {}
+
+    def __len__(self):
+        return sum(len(areas) for grid in self._grids.values() for areas in grid.values())
+
+    def _cell(self, lat, lng, radius_m):
+        size = 2 * radius_m
+        return (math.floor(lat * METERS_PER_DEGREE_LAT / size), math.floor(lng * self.meters_per_degree_lng / size))
+
+    def add(self, lat, lng, radius_m):
+        grid = self._grids.setdefault(radius_m, {})
+        grid.setdefault(self._cell(lat, lng, radius_m), []).append((lat, lng, radius_m))
+
+    def covers(self, tile):
+        """True if the tile lies entirely inside one of the completed circles."""
+        for radius_m, grid in self._grids.items():
+            row, col = self._cell(tile.lat, tile.lng, radius_m)
+            for d_row in (-1, 0, 1):
+                for d_col in (-1, 0, 1):
+                    for area in grid.get((row + d_row, col + d_col), ()):
+                        if tile_inside_circle(tile, *area):
+                            return True
+        return False
+
+
+def adaptive_tile_search(lat, lng, radius_m, query_tile,
+                         saturation_limit=NEARBY_SEARCH_RESULT_CAP,
+                         min_radius_m=MIN_TILE_RADIUS_METERS):
+    """
+    Quadtree search over the circle (lat, lng, radius_m).
+
+    `query_tile(tile)` must run the search for one tile and return the list of results.
+    A tile whose query returns `saturation_limit` results or more is split into four
+    children; tiles outside the search circle and tiles fully inside an area already
+    answered by an unsaturated query are skipped. Yields (tile, results) for every query.
+    """
+    queue = deque([Tile(lat, lng, radius_m, radius_m=radius_m)])
+
+    complete_areas = CompletedAreas(lat)
+    while queue:
+        tile = queue.popleft()
+        if not tile_intersects_circle(tile, lat, lng, radius_m):
+            continue
+        if tile.radius_m > MAX_QUERY_RADIUS_METERS:
+            queue.extend(tile.children())
+            continue
+        if complete_areas.covers(tile):
+            continue
+
+        results = query_tile(tile)
+        yield tile, results
+
+        if len(results) >= saturation_limit and tile.half_size_m / 2 * math.sqrt(2) >= min_radius_m:
+            queue.extend(tile.children())
+        else:
+            complete_areas.add(tile.lat, tile.lng, tile.radius_m)
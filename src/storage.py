@@ -0,0 +1,485 @@
+import os
+import io
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+
+from instrumentation import log, SUMMARY, PROGRESS
+
+# Read / write granularity of streamed image transfers
+STREAM_CHUNK_SIZE = 64 * 1024
+# A spooled image is kept in memory up to this size and moved to a temporary file beyond it
+SPOOL_MAX_MEMORY = 64 * 1024
+
+
+def place_id_from_folder_name(folder_name):
+    """Market folders are named {place_id}_{lat}_{lng}. Returns the place_id or None."""
+    # place_ids may themselves contain underscores, so split from the right
+    parts = folder_name.rsplit('_', 2)
+    if len(parts) == 3 and parts[0]:
+        return parts[0]
+    return None
+
+
+class SpooledImage:
+    """
+    Image bytes received chunk by chunk, hashed on the way in and spooled to a temporary file
+    once they outgrow SPOOL_MAX_MEMORY, so an image in transit costs a fixed amount of memory
+    however large it is. Backends read it back with open() in chunks.
+    """
+
+    def __init__(self, max_memory=SPOOL_MAX_MEMORY):
+        self.file = tempfile.SpooledTemporaryFile(max_size=max_memory)
+        self.size = 0
+        self._hash = hashlib.sha256()
+
+    @classmethod
+    def from_bytes(cls, data):
+        image = cls()
+        image.write(data)
+        return image
+
+    @classmethod
+    def from_file(cls, path):
+        image = cls()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(STREAM_CHUNK_SIZE), b""):
+                image.write(chunk)
+        return image
+
+    def write(self, chunk):
+        self.file.write(chunk)
+        self._hash.update(chunk)
+        self.size += len(chunk)
+
+    @property
+    def sha256(self):
+        return self._hash.hexdigest()
+
+    def open(self):
+        """The spooled file, rewound for reading."""
+        self.file.seek(0)
+        return self.file
+
+    def read_bytes(self):
+        return self.open().read()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class StorageBackend:
+    """
+    Interface of the sinks that market folders are written to.
+
+    A market folder holds the {place_id}_details.json file and the captured Street View
+    images. Folder IDs are opaque strings that only mean something to the backend that
+    returned them.
+    """
+
+    name = "storage"
+
+    def list_market_folders(self):
+        """Returns a dict mapping every market folder name to its folder ID."""
+        raise NotImplementedError
+
+    def list_folder_files(self, folder_id):
+        """Returns the names of the files stored in a market folder."""
+        raise NotImplementedError
+
+    def get_existing_market_folders(self):
+        """Returns the set of place_ids that already have a market folder."""
+        existing_place_ids = set()
+        try:
+            for folder_name in self.list_market_folders():
+                place_id = place_id_from_folder_name(folder_name)
+                if place_id:
+                    existing_place_ids.add(place_id)
+        except Exception as error:
+            log(f'An error occurred while listing folders: {error}', SUMMARY)
+            return set()
+        log(f"\n{len(existing_place_ids)} existing markets found.", PROGRESS)
+        return existing_place_ids
+
+    def get_change_token(self):
+        """
+        Current position in the backend's change feed, or None if the backend has none
+        (the market manifest then has to be rebuilt from a full listing).
+        """
+        return None
+
+    def list_market_folder_changes(self, change_token):
+        """
+        Returns (added, removed_ids, new_token): the market folders created since change_token
+        as a name -> ID dict, the IDs of removed folders and the token to continue from.
+        """
+        raise NotImplementedError
+
+    def create_market_folder(self, folder_name):
+        """Creates a market folder and returns its ID (None on failure)."""
+        raise NotImplementedError
+
+    def create_market_folders(self, folder_names, on_created=None):
+        """
+        Creates several market folders. Returns a dict mapping folder name to ID; on_created(name, ID)
+        is called as soon as each folder exists.
+        """
+        folder_ids = {}
+        for folder_name in folder_names:
+            folder_ids[folder_name] = self.create_market_folder(folder_name)
+            if on_created and folder_ids[folder_name]:
+                on_created(folder_name, folder_ids[folder_name])
+        return folder_ids
+
+    def upload_json_to_folder(self, folder_id, filename, content):
+        raise NotImplementedError
+
+    def upload_image_to_folder(self, folder_id, filename, image_data):
+        raise NotImplementedError
+
+    def upload_image_stream(self, folder_id, filename, image):
+        """
+        Stores a SpooledImage. Backends override this to copy it in chunks; the default reads
+        it into memory and falls back to upload_image_to_folder.
+        """
+        return self.upload_image_to_folder(folder_id, filename, image.read_bytes())
+
+
+class LocalStorageBackend(StorageBackend):
+    """
+    Content-addressed local filesystem sink.
+
+    Image bytes are stored once under objects/<aa>/<bb>/<sha256>.jpg and hard-linked into the
+    market folders (copied when the filesystem does not support links), so identical views
+    shared by several markets take the space of one. Market folders are sharded under
+    markets/<xx>/ by a hash of their name to keep directories small.
+
+    Layout:
+        <root>/objects/ab/cd/abcd....jpg
+        <root>/markets/3f/{place_id}_{lat}_{lng}/{place_id}_details.json
+        <root>/markets/3f/{place_id}_{lat}_{lng}/pos_0_angle_0.jpg
+    """
+
+    name = "local"
+
+    def __init__(self, root="local_dataset"):
+        self.root = os.path.abspath(root)
+        self.objects_dir = os.path.join(self.root, "objects")
+        self.markets_dir = os.path.join(self.root, "markets")
+        self.changes_log = os.path.join(self.root, "changes.log")
+        self._log_lock = threading.Lock()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.markets_dir, exist_ok=True)
+
+    @staticmethod
+    def shard_of(folder_name):
+        return hashlib.sha1(folder_name.encode("utf-8")).hexdigest()[:2]
+
+    def folder_path(self, folder_id):
+        return os.path.join(self.root, folder_id)
+
+    def list_market_folders(self):
+        """Returns a dict mapping every market folder name to its folder ID."""
+        folders = {}
+        for shard in os.listdir(self.markets_dir):
+            shard_dir = os.path.join(self.markets_dir, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for folder_name in os.listdir(shard_dir):
+                if os.path.isdir(os.path.join(shard_dir, folder_name)):
+                    folders[folder_name] = os.path.join("markets", shard, folder_name)
+        return folders
+
+    def list_folder_files(self, folder_id):
+        """Returns the names of the files stored in a market folder (not the temporary files of unfinished writes)."""
+        return sorted(name for name in os.listdir(self.folder_path(folder_id)) if not name.endswith(".tmp"))
+
+    def get_change_token(self):
+        """The change feed is the append-only changes.log; the token is its size in bytes."""
+        try:
+            return str(os.path.getsize(self.changes_log))
+        except FileNotFoundError:
+            return "0"
+
+    def list_market_folder_changes(self, change_token):
+        added = {}
+        position = int(change_token or 0)
+        try:
+            with open(self.changes_log, "rb") as f:
+                f.seek(position)
+                for line in f:
+                    # A half-written last line is picked up by the next call
+                    if not line.endswith(b"\n"):
+                        break
+                    change = json.loads(line)
+                    added[change["folder_name"]] = change["folder_id"]
+                    position += len(line)
+        except FileNotFoundError:
+            return {}, set(), "0"
+        return added, set(), str(position)
+
+    def create_market_folder(self, folder_name):
+        folder_id = os.path.join("markets", self.shard_of(folder_name), folder_name)
+        path = self.folder_path(folder_id)
+        try:
+            if not os.path.isdir(path):
+                os.makedirs(path, exist_ok=True)
+                record = json.dumps({"folder_name": folder_name, "folder_id": folder_id}, ensure_ascii=False)
+                with self._log_lock, open(self.changes_log, "a", encoding="utf-8") as f:
+                    f.write(record + "\n")
+        except OSError as error:
+            print(f'Error creating folder: {error}')
+            return None
+        return folder_id
+
+    def upload_json_to_folder(self, folder_id, filename, content):
+        path = os.path.join(self.folder_path(folder_id), filename)
+        try:
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(content, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, path)
+        except OSError as error:
+            print(f'Error saving JSON: {error}')
+            return None
+        log(f"    JSON  file is saved: {filename}")
+        return os.path.join(folder_id, filename)
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest[2:4], f"{digest}.jpg")
+
+    def _write_object(self, object_path, write):
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            tmp_path = f"{object_path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                write(f)
+            os.replace(tmp_path, object_path)
+        return object_path
+
+    def store_object(self, data):
+        """Writes the bytes to the object store (once per content). Returns the object path."""
+        return self._write_object(self.object_path(hashlib.sha256(data).hexdigest()), lambda f: f.write(data))
+
+    def store_object_stream(self, image):
+        """Copies a SpooledImage to the object store in chunks (once per content). Returns the object path."""
+        return self._write_object(
+            self.object_path(image.sha256),
+            lambda f: shutil.copyfileobj(image.open(), f, STREAM_CHUNK_SIZE)
+        )
+
+    def link_object(self, object_path, folder_id, filename):
+        path = os.path.join(self.folder_path(folder_id), filename)
+        if os.path.exists(path):
+            os.remove(path)
+        try:
+            os.link(object_path, path)
+        except OSError:
+            shutil.copyfile(object_path, path)
+        return path
+
+    def upload_image_to_folder(self, folder_id, filename, image_data):
+        try:
+            object_path = self.store_object(image_data)
+            self.link_object(object_path, folder_id, filename)
+        except OSError as error:
+            print(f'Error while saving image: {error}')
+            return None
+        log(f"    Image saved: {filename}")
+        return os.path.join(folder_id, filename)
+
+    def upload_image_stream(self, folder_id, filename, image):
+        try:
+            object_path = self.store_object_stream(image)
+            self.link_object(object_path, folder_id, filename)
+        except OSError as error:
+            print(f'Error while saving image: {error}')
+            return None
+        log(f"    Image saved: {filename}")
+        return os.path.join(folder_id, filename)
+
+
+class S3StorageBackend(StorageBackend):
+    """
+    S3-compatible object store sink (AWS S3, MinIO, or a local stand-in such as moto_server).
+
+    Images are uploaded once under <prefix>objects/<sha256>.jpg and copied server-side into
+    <prefix>markets/<folder_name>/<filename>, so shared views are transferred only once.
+    Requires boto3.
+    """
+
+    name = "s3"
+
+    def __init__(self, bucket, prefix="", endpoint_url=None, client=None):
+        if client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise ImportError("The S3 storage backend requires boto3 (pip install boto3).")
+            client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.rstrip("/") + "/" if prefix else ""
+        self._known_objects = set()
+        self._lock = threading.Lock()
+
+    def list_market_folders(self):
+        folders = {}
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=f"{self.prefix}markets/", Delimiter="/"):
+            for common_prefix in page.get("CommonPrefixes", []):
+                folder_id = common_prefix["Prefix"]
+                folders[folder_id.rstrip("/").rsplit("/", 1)[-1]] = folder_id
+        return folders
+
+    def list_folder_files(self, folder_id):
+        names = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=folder_id, Delimiter="/"):
+            names.extend(item["Key"][len(folder_id):] for item in page.get("Contents", []))
+        return sorted(names)
+
+    def create_market_folder(self, folder_name):
+        # Object stores have no directories: the folder is the key prefix
+        return f"{self.prefix}markets/{folder_name}/"
+
+    def upload_json_to_folder(self, folder_id, filename, content):
+        key = f"{folder_id}{filename}"
+        body = json.dumps(content, ensure_ascii=False, indent=2).encode("utf-8")
+        try:
+            self.client.put_object(Bucket=self.bucket, Key=key, Body=body, ContentType="application/json")
+        except Exception as error:
+            print(f'Error loading JSON: {error}')
+            return None
+        log(f"    JSON  file is uploaded: {filename}")
+        return key
+
+    def _object_exists(self, key):
+        with self._lock:
+            if key in self._known_objects:
+                return True
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+        except Exception:
+            return False
+        with self._lock:
+            self._known_objects.add(key)
+        return True
+
+    def _store_and_copy(self, digest, folder_id, filename, fileobj):
+        object_key = f"{self.prefix}objects/{digest}.jpg"
+        key = f"{folder_id}{filename}"
+        try:
+            if not self._object_exists(object_key):
+                # upload_fileobj reads the file in parts, never the whole image at once
+                self.client.upload_fileobj(fileobj(), self.bucket, object_key,
+                                           ExtraArgs={"ContentType": "image/jpeg"})
+                with self._lock:
+                    self._known_objects.add(object_key)
+            self.client.copy_object(Bucket=self.bucket, Key=key,
+                                    CopySource={"Bucket": self.bucket, "Key": object_key})
+        except Exception as error:
+            print(f'Error while loading image: {error}')
+            return None
+        log(f"    Image uploaded: {filename}")
+        return key
+
+    def upload_image_to_folder(self, folder_id, filename, image_data):
+        return self._store_and_copy(hashlib.sha256(image_data).hexdigest(), folder_id, filename,
+                                    lambda: io.BytesIO(image_data))
+
+    def upload_image_stream(self, folder_id, filename, image):
+        return self._store_and_copy(image.sha256, folder_id, filename, image.open)
+
+
+def create_storage_backend(backend_name=None):
+    """
+    Creates the local or S3 backend from the environment:
+        STORAGE_BACKEND=local  LOCAL_STORAGE_DIR=local_dataset
+        STORAGE_BACKEND=s3     S3_BUCKET=...  S3_PREFIX=...  S3_ENDPOINT_URL=http://localhost:9000
+    The Drive backend (GoogleDriveManager) is created by data_collection.initialize_storage.
+    """
+    backend_name = backend_name or os.environ.get("STORAGE_BACKEND", "drive")
+    if backend_name == "local":
+        return LocalStorageBackend(os.environ.get("LOCAL_STORAGE_DIR", "local_dataset"))
+    if backend_name == "s3":
+        bucket = os.environ.get("S3_BUCKET")
+        if not bucket:
+            raise ValueError("S3_BUCKET must be set for the s3 storage backend.")
+        return S3StorageBackend(bucket, os.environ.get("S3_PREFIX", ""), os.environ.get("S3_ENDPOINT_URL"))
+    raise ValueError(f"Unknown storage backend: {backend_name}")
+
+
+def sync_local_storage(source, target):
+    """
+    Copies the market folders of a LocalStorageBackend to the target backend (bulk collection
+    writes locally at disk speed; this pushes the result to Drive / S3 later). Files the target
+    folder already has are skipped, so an interrupted or partly failed sync is finished by the
+    next one. Returns the number of markets that were brought fully up to date.
+    """
+    target_ids = {}
+    for folder_name, folder_id in target.list_market_folders().items():
+        place_id = place_id_from_folder_name(folder_name)
+        if place_id:
+            target_ids[place_id] = folder_id
+
+    new_folders = []
+    existing_folders = []
+    for folder_name, folder_id in source.list_market_folders().items():
+        if place_id_from_folder_name(folder_name) in target_ids:
+            existing_folders.append((folder_name, folder_id))
+        else:
+            new_folders.append((folder_name, folder_id))
+    print(f"\n{len(new_folders)} new market folders will be synchronized to {target.name}, "
+          f"{len(existing_folders)} existing ones checked for missing files.")
+
+    created_ids = target.create_market_folders([folder_name for folder_name, _ in new_folders])
+    synced = incomplete = 0
+    for folder_name, folder_id in new_folders + existing_folders:
+        target_id = created_ids.get(folder_name) or target_ids.get(place_id_from_folder_name(folder_name))
+        if not target_id:
+            incomplete += 1
+            continue
+        stored = set() if folder_name in created_ids else set(target.list_folder_files(target_id))
+        missing = [filename for filename in source.list_folder_files(folder_id) if filename not in stored]
+        if not missing:
+            continue
+        failed = 0
+        for filename in missing:
+            path = os.path.join(source.folder_path(folder_id), filename)
+            if filename.endswith(".json"):
+                with open(path, encoding="utf-8") as f:
+                    result = target.upload_json_to_folder(target_id, filename, json.load(f))
+            else:
+                with SpooledImage.from_file(path) as image:
+                    result = target.upload_image_stream(target_id, filename, image)
+            if not result:
+                failed += 1
+        if failed:
+            incomplete += 1
+            log(f"{folder_name}: {failed} of {len(missing)} files could not be synchronized.", SUMMARY)
+        else:
+            synced += 1
+    if incomplete:
+        print(f"{incomplete} market folders are incomplete; run the sync again to finish them.")
+    return synced
+
+
+if __name__ == "__main__":
+    # python src/storage.py <local_dataset_dir>  -> pushes the local dataset to Google Drive
+    from data_collection import initialize_drive_manager
+
+    local_dir = sys.argv[1] if len(sys.argv) > 1 else os.environ.get("LOCAL_STORAGE_DIR", "local_dataset")
+    drive = initialize_drive_manager()
+    if drive:
+        count = sync_local_storage(LocalStorageBackend(local_dir), drive)
+        print(f"{count} markets synchronized to Google Drive.")
@@ -0,0 +1,84 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+# Size of the probe images fetched before the full resolution capture
+THUMBNAIL_SIZE = "320x256"
+# Number of views captured at full resolution per market in progressive mode
+DEFAULT_TOP_K = 4
+# Views whose dHashes differ in at most this many bits are treated as the same frame
+NEAR_DUPLICATE_BITS = 8
+
+ANALYSIS_SIZE = (128, 96)
+STRONG_EDGE = 0.08
+
+
+def _grayscale(image, size):
+    return np.asarray(image.convert("L").resize(size, Image.BILINEAR), dtype=np.float32) / 255.0
+
+
+def dhash(image, hash_size=8):
+    """Difference hash: one bit per horizontally adjacent pixel pair of a (hash_size+1) x hash_size thumbnail."""
+    pixels = _grayscale(image, (hash_size + 1, hash_size))
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+def hamming_distance(hash1, hash2):
+    return bin(hash1 ^ hash2).count("1")
+
+
+def storefront_score(pixels):
+    """
+    Cheap estimate of how useful a frame is. Blurry frames, blank walls and sky or road views
+    have little high-frequency detail (low Laplacian variance) and low contrast; storefronts
+    have many sharp horizontal and vertical edges (shelves, signboards, windows, doors).
+    """
+    laplacian = (4 * pixels[1:-1, 1:-1] - pixels[:-2, 1:-1] - pixels[2:, 1:-1]
+                 - pixels[1:-1, :-2] - pixels[1:-1, 2:])
+    sharpness = float(laplacian.var())
+
+    gx = np.abs(pixels[:-1, 1:] - pixels[:-1, :-1])
+    gy = np.abs(pixels[1:, :-1] - pixels[:-1, :-1])
+    strong = np.hypot(gx, gy) > STRONG_EDGE
+    if strong.any():
+        # Axis-aligned edges: one gradient component dominates the other
+        axis_aligned = np.minimum(gx, gy) < 0.3 * np.maximum(gx, gy)
+        structure = float((axis_aligned & strong).sum() / strong.sum())
+        edge_density = float(strong.mean())
+    else:
+        structure = edge_density = 0.0
+
+    contrast = min(1.0, float(pixels.std()) * 4)
+    return np.log1p(sharpness * 1000) * (0.5 + structure) * (0.25 + min(edge_density * 4, 1.0)) * contrast
+
+
+def analyze_view(image_data):
+    """Decodes a JPEG once and returns (score, dhash), or None when it cannot be decoded."""
+    try:
+        image = Image.open(io.BytesIO(image_data))
+        image.load()
+    except (OSError, ValueError):
+        return None
+    return storefront_score(_grayscale(image, ANALYSIS_SIZE)), dhash(image)
+
+
+def select_views(analyses, top_k=DEFAULT_TOP_K, duplicate_bits=NEAR_DUPLICATE_BITS):
+    """
+    Picks up to top_k view indexes by descending score, skipping near duplicates of a frame
+    that is already selected. `analyses` holds analyze_view results (None = unusable).
+    """
+    ranked = sorted(
+        (index for index, analysis in enumerate(analyses) if analysis is not None),
+        key=lambda index: analyses[index][0],
+        reverse=True
+    )
+    selected = []
+    for index in ranked:
+        if len(selected) == top_k:
+            break
+        if any(hamming_distance(analyses[index][1], analyses[other][1]) <= duplicate_bits for other in selected):
+            continue
+        selected.append(index)
+    return selected
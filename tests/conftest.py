@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The modules under src/ import each other by plain name, like the scripts run from there
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
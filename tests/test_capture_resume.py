@@ -0,0 +1,39 @@
+import pytest
+
+import data_collection as dc
+from job_journal import JobJournal, STAGE_FOLDER_CREATED
+from storage import LocalStorageBackend
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    monkeypatch.setattr(dc, "storage_backend", LocalStorageBackend(str(tmp_path / "markets")))
+    monkeypatch.setattr(dc, "job_journal", JobJournal(str(tmp_path / "journal.sqlite")))
+    monkeypatch.setattr(dc, "market_manifest", None)
+    monkeypatch.setattr(dc, "image_hash_index", None)
+    yield dc
+    dc.job_journal.close()
+
+
+def test_folders_are_journaled_before_setup(pipeline, monkeypatch):
+    markets = [{"place_id": f"place{i}", "name": f"Market {i}", "location": {"lat": 41.0 + i / 1000, "lng": 28.9}}
+               for i in range(6)]
+    pipeline.job_journal.record_search(41.0, 28.9, 1.0, markets)
+    stages_at_setup = []
+
+    def crash(market, folder_id=None):
+        # The process dies in the first setup, after the batch created every folder
+        if not stages_at_setup:
+            stages_at_setup.extend(pipeline.job_journal.stage_of(m["place_id"]) for m in markets)
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(pipeline, "save_market_to_drive", crash)
+    with pytest.raises(KeyboardInterrupt):
+        pipeline.capture_markets_concurrently(markets, max_workers=2)
+
+    assert stages_at_setup == [STAGE_FOLDER_CREATED] * 6
+    folders = pipeline.storage_backend.list_market_folders()
+    pending = pipeline.job_journal.pending_markets()
+    assert {market["place_id"] for market in pending} == {market["place_id"] for market in markets}
+    for market in markets:
+        assert pipeline.job_journal.folder_id_of(market["place_id"]) == folders[pipeline.market_folder_name(market)]
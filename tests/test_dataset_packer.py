@@ -0,0 +1,124 @@
+import io
+import json
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from dataset_packer import PackedDataset, build_tensor_cache, coco_samples, market_samples, pack
+
+
+def write_jpeg(path, size, color):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, "JPEG")
+    with open(path, "wb") as f:
+        f.write(buffer.getvalue())
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def coco_split(tmp_path):
+    image_dir = tmp_path / "train"
+    image_dir.mkdir()
+    images, annotations, originals = [], [], {}
+    for i in range(6):
+        name = f"image_{i}.jpg"
+        size = (40 + 8 * i, 30 + 4 * i)
+        originals[name] = write_jpeg(image_dir / name, size, (40 * i, 20, 200))
+        images.append({"id": i, "file_name": name, "width": size[0], "height": size[1]})
+        annotations.append({"id": 100 + i, "image_id": i, "category_id": 1, "bbox": [1, 2, 3, 4]})
+    annotation_path = image_dir / "_annotations.coco.json"
+    annotation_path.write_text(json.dumps({
+        "categories": [{"id": 1, "name": "signboard"}], "images": images, "annotations": annotations
+    }))
+    return annotation_path, image_dir, originals
+
+
+def test_pack_round_trip(tmp_path, coco_split):
+    annotation_path, image_dir, originals = coco_split
+    categories, samples = coco_samples(str(annotation_path), str(image_dir))
+    # A tiny shard size forces several shards
+    index = pack(samples, str(tmp_path / "packed"), categories, shard_size_mb=0.0001, workers=2)
+    assert len(index["shards"]) > 1
+
+    dataset = PackedDataset(str(tmp_path / "packed"))
+    assert len(dataset) == 6
+    assert dataset.categories == [{"id": 1, "name": "signboard"}]
+    for i, item in enumerate(dataset):
+        name = os.path.basename(dataset.samples[i]["source"])
+        assert dataset.read_bytes(i) == originals[name]
+        assert item["image"].size == (item["width"], item["height"])
+        assert [a["id"] for a in item["annotations"]] == [100 + item["image_id"]]
+    dataset.close()
+
+
+def test_unreadable_images_are_skipped(tmp_path, coco_split):
+    annotation_path, image_dir, _ = coco_split
+    os.remove(image_dir / "image_2.jpg")
+    categories, samples = coco_samples(str(annotation_path), str(image_dir))
+    index = pack(samples, str(tmp_path / "packed"), categories, workers=2)
+    assert [entry["image_id"] for entry in index["samples"]] == [0, 1, 3, 4, 5]
+
+
+def test_tensor_cache(tmp_path, coco_split):
+    annotation_path, image_dir, _ = coco_split
+    categories, samples = coco_samples(str(annotation_path), str(image_dir))
+    pack(samples, str(tmp_path / "packed"), categories, workers=2)
+    build_tensor_cache(str(tmp_path / "packed"), 32, workers=2)
+
+    dataset = PackedDataset(str(tmp_path / "packed"), tensor_size=32)
+    item = dataset[3]
+    assert item["image"].shape == (32, 32, 3) and item["image"].dtype == np.uint8
+    assert item["scale"] == pytest.approx((32 / item["width"], 32 / item["height"]), abs=1e-6)
+    dataset.close()
+
+
+def test_market_folders(tmp_path):
+    folder = tmp_path / "markets" / "ChIJ_abc_41.0263_28.8767"
+    folder.mkdir(parents=True)
+    data = write_jpeg(folder / "view_0.jpg", (20, 10), (255, 0, 0))
+    (folder / "details.json").write_text("{}")
+
+    categories, samples = market_samples(str(tmp_path / "markets"))
+    pack(samples, str(tmp_path / "packed"), categories, workers=1)
+    dataset = PackedDataset(str(tmp_path / "packed"))
+    assert len(dataset) == 1
+    assert dataset[0]["market"] == {"place_id": "ChIJ_abc", "lat": 41.0263, "lng": 28.8767}
+    assert dataset.read_bytes(0) == data
+    dataset.close()
+
+
+def test_market_annotations_are_matched_per_market(tmp_path):
+    root = tmp_path / "markets"
+    for place_id in ("placeA", "placeB"):
+        folder = root / "3f" / f"{place_id}_41.0_28.9"
+        folder.mkdir(parents=True)
+        for name in ("pos_0_angle_0.jpg", "pos_0_angle_30.jpg"):
+            write_jpeg(folder / name, (20, 10), (0, 255, 0))
+    write_jpeg(root / "3f" / "placeB_41.0_28.9" / "extra.jpg", (20, 10), (0, 0, 255))
+    annotation_path = tmp_path / "labels.coco.json"
+    images = [
+        {"id": 1, "file_name": "placeA/pos_0_angle_0.jpg"},
+        {"id": 2, "file_name": "placeB_41.0_28.9/pos_0_angle_0.jpg"},
+        # Ambiguous: every market has a pos_0_angle_30.jpg
+        {"id": 3, "file_name": "pos_0_angle_30.jpg"},
+        {"id": 4, "file_name": "extra.jpg"},
+    ]
+    annotation_path.write_text(json.dumps({
+        "categories": [{"id": 1, "name": "signboard"}],
+        "images": images,
+        "annotations": [{"id": 10 + image["id"], "image_id": image["id"], "category_id": 1, "bbox": [0, 0, 1, 1]}
+                        for image in images],
+    }))
+
+    _, samples = market_samples(str(root), str(annotation_path))
+    labels = {(s["market"]["place_id"], os.path.basename(s["path"])): [a["id"] for a in s["annotations"]]
+              for s in samples}
+    assert labels == {
+        ("placeA", "pos_0_angle_0.jpg"): [11],
+        ("placeA", "pos_0_angle_30.jpg"): [],
+        ("placeB", "extra.jpg"): [14],
+        ("placeB", "pos_0_angle_0.jpg"): [12],
+        ("placeB", "pos_0_angle_30.jpg"): [],
+    }
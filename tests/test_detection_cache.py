@@ -0,0 +1,53 @@
+import os
+
+from detection_cache import DetectionCache
+
+SETTINGS = {"type": "detr", "conf": 0.5}
+
+
+def write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def test_sharded_checkpoint_changes_invalidate(tmp_path):
+    checkpoint = tmp_path / "detr"
+    checkpoint.mkdir()
+    for name in ("model-00001-of-00002.safetensors", "model-00002-of-00002.safetensors", "config.json"):
+        write(checkpoint / name, name.encode())
+    cache = DetectionCache(str(tmp_path / "cache.sqlite"))
+    key = cache.model_key("DETR", str(checkpoint), SETTINGS)
+    cache.put_many({"a": [1], "b": [2]}, key)
+    assert cache.get("a", key) == [1]
+
+    write(checkpoint / "model-00002-of-00002.safetensors", b"retrained")
+    new_key = cache.model_key("DETR", str(checkpoint), SETTINGS)
+    assert new_key != key and len(cache) == 0
+    cache.close()
+
+
+def test_hub_models_are_keyed_by_name(tmp_path):
+    cache = DetectionCache(str(tmp_path / "cache.sqlite"))
+    key = cache.model_key("hub", "facebook/detr-resnet-50", SETTINGS)
+    assert key == cache.model_key("hub", "facebook/detr-resnet-50", SETTINGS)
+    assert key != cache.model_key("hub", "facebook/detr-resnet-101", SETTINGS)
+    cache.close()
+
+
+def test_shared_weights_survive_other_name_changing(tmp_path):
+    weights = tmp_path / "best.pt"
+    write(weights, b"v1")
+    cache = DetectionCache(str(tmp_path / "cache.sqlite"))
+    key = cache.model_key("YOLOv8", str(weights), SETTINGS)
+    assert cache.model_key("baseline", str(weights), SETTINGS) == key
+    cache.put_many({"a": [1]}, key)
+
+    retrained = tmp_path / "retrained.pt"
+    write(retrained, b"v2")
+    cache.model_key("YOLOv8", str(retrained), SETTINGS)
+    assert cache.get("a", key) == [1]
+
+    # Once no name uses the old weights any more, their entries go
+    cache.model_key("baseline", str(retrained), SETTINGS)
+    assert cache.get("a", key) is None and len(cache) == 0
+    cache.close()
@@ -0,0 +1,80 @@
+import math
+
+import numpy as np
+import pytest
+
+from geometry import haversine_distance_batch, heading_batch, offset_coordinates_batch, plan_view_grid
+
+
+# The scalar implementations the vectorized functions replaced
+def scalar_heading(camera_lat, camera_lng, target_lat, target_lng):
+    lat1, lng1 = math.radians(camera_lat), math.radians(camera_lng)
+    lat2, lng2 = math.radians(target_lat), math.radians(target_lng)
+    y = math.sin(lng2 - lng1) * math.cos(lat2)
+    x = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(lng2 - lng1)
+    return (math.degrees(math.atan2(y, x)) + 360) % 360
+
+
+def scalar_offset(lat, lng, distance_meters, bearing_degrees):
+    d = distance_meters / 6378137
+    bearing = math.radians(bearing_degrees)
+    lat_rad, lng_rad = math.radians(lat), math.radians(lng)
+    lat_new = math.asin(math.sin(lat_rad) * math.cos(d) + math.cos(lat_rad) * math.sin(d) * math.cos(bearing))
+    lng_new = lng_rad + math.atan2(math.sin(bearing) * math.sin(d) * math.cos(lat_rad),
+                                   math.cos(d) - math.sin(lat_rad) * math.sin(lat_new))
+    return math.degrees(lat_new), math.degrees(lng_new)
+
+
+def scalar_haversine(lat1, lng1, lat2, lng2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    delta_phi = math.radians(lat2 - lat1)
+    delta_lambda = math.radians(lng2 - lng1)
+    a = math.sin(delta_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2) ** 2
+    return 6371000 * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(0)
+    lats = 41.0 + rng.uniform(-0.05, 0.05, size=(2, 50))
+    lngs = 28.9 + rng.uniform(-0.05, 0.05, size=(2, 50))
+    return lats, lngs
+
+
+def test_haversine_matches_scalar(points):
+    lats, lngs = points
+    distances = haversine_distance_batch(lats[0], lngs[0], lats[1], lngs[1])
+    expected = [scalar_haversine(*args) for args in zip(lats[0], lngs[0], lats[1], lngs[1])]
+    np.testing.assert_allclose(distances, expected, rtol=1e-9, atol=1e-6)
+
+
+def test_heading_matches_scalar(points):
+    lats, lngs = points
+    headings = heading_batch(lats[0], lngs[0], lats[1], lngs[1])
+    expected = [scalar_heading(*args) for args in zip(lats[0], lngs[0], lats[1], lngs[1])]
+    np.testing.assert_allclose(headings, expected, atol=1e-9)
+
+
+@pytest.mark.parametrize("distance, bearing", [(0, 0), (20, 45), (-20, 300), (150, 180)])
+def test_offset_round_trip(distance, bearing):
+    lat, lng = offset_coordinates_batch(41.0263, 28.8767, distance, bearing)
+    assert (float(lat), float(lng)) == pytest.approx(scalar_offset(41.0263, 28.8767, distance, bearing), abs=1e-12)
+    # Moving the same distance back towards the start point ends there
+    back_bearing = float(heading_batch(lat, lng, 41.0263, 28.8767))
+    lat_back, lng_back = offset_coordinates_batch(lat, lng, abs(distance), back_bearing)
+    assert float(haversine_distance_batch(lat_back, lng_back, 41.0263, 28.8767)) < 1e-3
+
+
+def test_view_grid_matches_scalar_loop(points):
+    lats, lngs = points
+    offsets, angles = [-20, 0, 20], [-30, 0, 30]
+    position_lats, position_lngs, headings = plan_view_grid(lats[0], lngs[0], lats[1], lngs[1], offsets, angles)
+    assert position_lats.shape == (50, 3) and headings.shape == (50, 3, 3)
+    for n in range(50):
+        base_heading = scalar_heading(lats[0][n], lngs[0][n], lats[1][n], lngs[1][n])
+        for p, offset in enumerate(offsets):
+            position = scalar_offset(lats[0][n], lngs[0][n], offset, (base_heading + 90) % 360)
+            assert (position_lats[n, p], position_lngs[n, p]) == pytest.approx(position, abs=1e-9)
+            position_heading = scalar_heading(*position, lats[1][n], lngs[1][n])
+            for a, angle in enumerate(angles):
+                assert headings[n, p, a] == pytest.approx((position_heading + angle) % 360, abs=1e-6)
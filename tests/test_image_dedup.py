@@ -0,0 +1,29 @@
+from image_dedup import PerceptualHashIndex
+
+HASH = 0x0F0F_F0F0_1234_5678
+
+
+def test_duplicates_are_per_market(tmp_path):
+    index = PerceptualHashIndex(str(tmp_path / "hashes.sqlite"))
+    assert index.check_and_add(HASH, "placeA", "pos_0_angle_0.jpg") is None
+    # One bit off: a duplicate within the same market, not for a neighbouring one
+    assert index.check_and_add(HASH ^ 1, "placeA", "pos_0_angle_30.jpg") == ("placeA", "pos_0_angle_0.jpg")
+    assert index.check_and_add(HASH ^ 1, "placeB", "pos_0_angle_0.jpg") is None
+    assert index.duplicates == 1
+    index.discard(HASH ^ 1, "placeB", "pos_0_angle_0.jpg")
+    assert len(index) == 1
+    index.close()
+
+
+def test_markets_are_loaded_on_demand(tmp_path):
+    index = PerceptualHashIndex(str(tmp_path / "hashes.sqlite"))
+    for i in range(20):
+        index.check_and_add(HASH ^ (1 << 40), f"place{i}", "pos_0_angle_0.jpg")
+    index.close()
+
+    reopened = PerceptualHashIndex(str(tmp_path / "hashes.sqlite"))
+    assert len(reopened) == 20
+    assert reopened.find_duplicate(HASH, "place7") == ("place7", "pos_0_angle_0.jpg")
+    assert reopened.find_duplicate(HASH, "place7", "pos_0_angle_0.jpg") is None
+    assert list(reopened._trees) == ["place7"]
+    reopened.close()
@@ -0,0 +1,58 @@
+import pytest
+
+from market_classifier import MarketClassifier
+from bench_market_classifier import LARGE_CHAINS, legacy_is_actual_market, legacy_is_large_chain, random_corpus
+
+# (place, expected is_market decision)
+GOLDEN_CASES = [
+    ({"name": "Migros Jet", "types": ["supermarket"]}, True),
+    ({"name": "Eczane Market", "types": ["grocery_or_supermarket"]}, False),
+    ({"name": "Sağlık Deposu", "types": ["supermarket", "pharmacy"]}, False),
+    ({"name": "Yıldız Bakkal", "types": ["point_of_interest"]}, True),
+    ({"name": "Kuyumcu Market", "types": []}, False),
+    ({"name": "Ali Gıda", "types": ["store"]}, True),
+    ({"name": "Ali Gıda Cafe", "types": ["store"]}, False),
+    ({"name": "Mahalle Market Şubesi", "types": ["food"]}, True),
+    ({"name": "Köy SÜT Ürünleri", "types": ["convenience_store"]}, False),
+    ({"name": "Opet Convenience", "types": ["convenience_store", "gas_station"]}, False),
+    ({"name": "Shopping Kafe", "types": ["convenience_store"], "servesBreakfast": True}, False),
+    ({"name": "Köşe Büfe", "types": ["convenience_store"], "dineIn": True}, False),
+    ({"name": "Köşe Büfe", "types": ["convenience_store"]}, True),
+    ({"name": "Barbaros Tekel", "types": ["convenience_store", "store"]}, False),
+    ({"name": "Bar Sokak", "types": ["store", "food"]}, False),
+]
+
+
+@pytest.fixture(scope="module")
+def classifier():
+    return MarketClassifier(LARGE_CHAINS)
+
+
+@pytest.mark.parametrize("place, expected", GOLDEN_CASES)
+def test_golden_cases(classifier, place, expected):
+    assert classifier.is_market(place) == expected
+    assert legacy_is_actual_market(place) == expected
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("migros jet", True),
+    ("şok market", True),
+    ("a101 express", True),
+    ("kimya evi", True),
+    ("yıldız bakkal", False),
+    ("", False),
+])
+def test_large_chain(classifier, name, expected):
+    assert classifier.is_large_chain(name) == expected
+
+
+def test_no_large_chains():
+    assert not MarketClassifier([]).is_large_chain("migros")
+
+
+def test_matches_legacy_filters(classifier):
+    corpus = random_corpus(5000, seed=1)
+    assert classifier.classify(corpus) == [legacy_is_actual_market(place) for place in corpus]
+    for place in corpus:
+        name = place["name"].lower()
+        assert classifier.is_large_chain(name) == legacy_is_large_chain(name), name
@@ -0,0 +1,72 @@
+import math
+import random
+from collections import deque
+
+import pytest
+
+from spatial_tiling import (MAX_QUERY_RADIUS_METERS, CompletedAreas, Tile, adaptive_tile_search,
+                            local_distance, tile_inside_circle, tile_intersects_circle)
+
+
+def linear_tile_search(lat, lng, radius_m, query_tile, saturation_limit=60, min_radius_m=150):
+    """The search with a linear scan over the completed areas, as the reference."""
+    queue = deque([Tile(lat, lng, radius_m, radius_m=radius_m)])
+    complete_areas = []
+    while queue:
+        tile = queue.popleft()
+        if not tile_intersects_circle(tile, lat, lng, radius_m):
+            continue
+        if tile.radius_m > MAX_QUERY_RADIUS_METERS:
+            queue.extend(tile.children())
+            continue
+        if any(tile_inside_circle(tile, *area) for area in complete_areas):
+            continue
+        results = query_tile(tile)
+        yield tile, results
+        if len(results) >= saturation_limit and tile.half_size_m / 2 * math.sqrt(2) >= min_radius_m:
+            queue.extend(tile.children())
+        else:
+            complete_areas.append((tile.lat, tile.lng, tile.radius_m))
+
+
+def clustered_places(lat, lng, count, seed=0):
+    """Places around a few dense centres, so the quadtree is split unevenly."""
+    rng = random.Random(seed)
+    centres = [(lat + rng.uniform(-0.1, 0.1), lng + rng.uniform(-0.1, 0.1)) for _ in range(6)]
+    places = []
+    for _ in range(count):
+        c_lat, c_lng = rng.choice(centres)
+        places.append((c_lat + rng.gauss(0, 0.01), c_lng + rng.gauss(0, 0.01)))
+    return places
+
+
+@pytest.mark.parametrize("radius_m", [3000, 15000])
+def test_same_queries_as_linear_scan(radius_m):
+    places = clustered_places(41.0, 28.9, 4000)
+
+    def query_tile(tile):
+        return [p for p in places if local_distance(tile.lat, tile.lng, *p) <= tile.radius_m][:60]
+
+    expected = [repr(tile) for tile, _ in linear_tile_search(41.0, 28.9, radius_m, query_tile)]
+    assert [repr(tile) for tile, _ in adaptive_tile_search(41.0, 28.9, radius_m, query_tile)] == expected
+    assert len(expected) > 20
+
+
+def test_completed_areas_match_linear_check():
+    rng = random.Random(1)
+    root = Tile(41.0, 28.9, 20000)
+    areas = CompletedAreas(root.lat)
+    circles = []
+    for _ in range(300):
+        half = 20000 / 2 ** rng.randint(1, 7)
+        tile = Tile(*root.offset(rng.uniform(-20000, 20000), rng.uniform(-20000, 20000)), half)
+        areas.add(tile.lat, tile.lng, tile.radius_m)
+        circles.append((tile.lat, tile.lng, tile.radius_m))
+    assert len(areas) == 300
+    covered = 0
+    for _ in range(3000):
+        tile = Tile(*root.offset(rng.uniform(-20000, 20000), rng.uniform(-20000, 20000)), 20000 / 2 ** rng.randint(2, 9))
+        expected = any(tile_inside_circle(tile, *circle) for circle in circles)
+        assert areas.covers(tile) == expected
+        covered += expected
+    assert covered > 100
@@ -0,0 +1,68 @@
+import io
+import os
+
+from PIL import Image
+
+from storage import LocalStorageBackend, sync_local_storage
+
+
+class FlakyBackend(LocalStorageBackend):
+    """Local target whose upload of the listed file names fails once."""
+
+    def __init__(self, root, fail_once):
+        super().__init__(root)
+        self.fail_once = set(fail_once)
+
+    def upload_image_stream(self, folder_id, filename, image):
+        if filename in self.fail_once:
+            self.fail_once.discard(filename)
+            return None
+        return super().upload_image_stream(folder_id, filename, image)
+
+
+def jpeg(color):
+    buffer = io.BytesIO()
+    Image.new("RGB", (16, 16), color).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+def make_source(root):
+    source = LocalStorageBackend(root)
+    for place_id in ("placeA", "placeB"):
+        folder_id = source.create_market_folder(f"{place_id}_41.0_28.9")
+        source.upload_json_to_folder(folder_id, f"{place_id}_details.json", {"place_id": place_id})
+        for i, color in enumerate(("red", "blue")):
+            source.upload_image_to_folder(folder_id, f"pos_0_angle_{i}.jpg", jpeg(color))
+        # Left behind by an interrupted write
+        with open(os.path.join(source.folder_path(folder_id), "pos_0_angle_2.jpg.123.tmp"), "wb") as f:
+            f.write(b"partial")
+    return source
+
+
+def target_files(target):
+    return {name: target.list_folder_files(folder_id) for name, folder_id in target.list_market_folders().items()}
+
+
+def test_sync_resumes_after_partial_upload(tmp_path):
+    source = make_source(str(tmp_path / "source"))
+    target = FlakyBackend(str(tmp_path / "target"), fail_once=["pos_0_angle_1.jpg"])
+
+    # The first market folder's second image fails; that market is not counted as synchronized
+    assert sync_local_storage(source, target) == 1
+    files = target_files(target)
+    assert sorted(len(names) for names in files.values()) == [2, 3]
+
+    assert sync_local_storage(source, target) == 1
+    expected = ["pos_0_angle_0.jpg", "pos_0_angle_1.jpg"]
+    assert target_files(target) == {
+        "placeA_41.0_28.9": ["placeA_details.json"] + expected,
+        "placeB_41.0_28.9": ["placeB_details.json"] + expected,
+    }
+    # Nothing left to do
+    assert sync_local_storage(source, target) == 0
+
+
+def test_temporary_files_are_not_listed(tmp_path):
+    source = make_source(str(tmp_path / "source"))
+    for folder_id in source.list_market_folders().values():
+        assert not any(name.endswith(".tmp") for name in source.list_folder_files(folder_id))